@@ -0,0 +1,227 @@
+"""
+Offline replay of the external services the chat depends on.
+
+ReplayAdapter is mounted on the shared requests session (utils/http_session)
+and answers Steam, Serper and Tavily requests from the JSON fixtures in
+bench/fixtures, after an injected delay. LLMReplay stands in for
+litellm.completion / litellm.acompletion and returns canned answers through
+litellm's own mock_response path, so the response objects (and streaming
+chunks) are the real ones. block_network() makes any other connection
+attempt fail, so a benchmark can never reach the internet by accident.
+"""
+
+import asyncio
+import json
+import random
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+from requests.adapters import BaseAdapter
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# Injected latency in ms per service (the mean; each call is jittered +-JITTER)
+DEFAULT_LATENCY_MS = {
+    "steam": 120,        # appdetails / featured categories
+    "steam_search": 150,
+    "serper": 400,
+    "tavily": 700,
+    "llm_ttft": 600,     # time to first token
+    "llm_chunk": 15,     # between streamed chunks
+}
+JITTER = 0.5
+
+NEWS_WORDS = ("news", "update", "patch", "release", "ข่าว", "ใหม่", "อัปเดต", "เปิดตัว")
+TRENDING_WORDS = ("trending", "popular", "most played", "top", "best selling", "มาแรง", "ยอดนิยม", "ขายดี")
+
+
+def load_fixture(name: str) -> Any:
+    with open(FIXTURES_DIR / name, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_latency(spec: str) -> Dict[str, float]:
+    """"steam=80,serper=300" -> {"steam": 80.0, "serper": 300.0} (unknown names are an error)."""
+    latency = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        if name not in DEFAULT_LATENCY_MS:
+            raise ValueError(f"Unknown latency name {name!r} (expected one of {', '.join(DEFAULT_LATENCY_MS)})")
+        latency[name] = float(value)
+    return latency
+
+
+class LatencyModel:
+    """Jittered delays per service, reproducible for a given seed."""
+
+    def __init__(self, latency_ms: Optional[Dict[str, float]] = None, scale: float = 1.0, seed: int = 0):
+        self.latency_ms = {**DEFAULT_LATENCY_MS, **(latency_ms or {})}
+        self.scale = scale
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, service: str) -> float:
+        """Seconds to wait for one call to a service."""
+        mean = self.latency_ms[service] * self.scale / 1000
+        if mean <= 0:
+            return 0.0
+        with self._lock:
+            return mean * self._random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def _classify_search(query: str) -> str:
+    lowered = query.lower()
+    if any(word in lowered for word in NEWS_WORDS):
+        return "news"
+    if any(word in lowered for word in TRENDING_WORDS):
+        return "trending"
+    return "default"
+
+
+def _compact(text: str) -> str:
+    return re.sub(r"[^0-9a-z]+", "", text.lower())
+
+
+class ReplayAdapter(BaseAdapter):
+    """requests transport adapter that serves recorded API responses."""
+
+    def __init__(self, latency: LatencyModel):
+        super().__init__()
+        self.latency = latency
+        self.appdetails = load_fixture("steam_appdetails.json")
+        self.featured = load_fixture("steam_featured.json")
+        self.serper = load_fixture("serper.json")
+        self.tavily = load_fixture("tavily.json")
+        self.apps = load_fixture("steam_applist.json")["applist"]["apps"]
+        self.calls: Counter = Counter()
+        self._calls_lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = json.loads(request.body) if request.body else {}
+
+        if url.netloc == "store.steampowered.com" and url.path.startswith("/api/appdetails"):
+            service, payload = "steam", self._appdetails(query.get("appids", ""))
+        elif url.netloc == "store.steampowered.com" and url.path.startswith("/api/storesearch"):
+            service, payload = "steam_search", self._storesearch(query.get("term", ""))
+        elif url.netloc == "store.steampowered.com" and url.path.startswith("/api/featuredcategories"):
+            service, payload = "steam", self.featured
+        elif url.netloc == "google.serper.dev":
+            service, payload = "serper", self.serper[_classify_search(body.get("q", ""))]
+        elif url.netloc == "api.tavily.com":
+            service, payload = "tavily", dict(self.tavily[_classify_search(body.get("query", ""))], query=body.get("query", ""))
+        else:
+            raise requests.ConnectionError(f"No fixture for {request.method} {request.url} (network is disabled)",
+                                           request=request)
+
+        with self._calls_lock:
+            self.calls[service] += 1
+        delay = self.latency.delay(service)
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.ReadTimeout(f"Replayed {service} response slower than {read_timeout}s", request=request)
+        time.sleep(delay)
+
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response._content = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        response.headers["Content-Type"] = "application/json; charset=utf-8"
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+    def _appdetails(self, appids: str) -> Dict[str, Any]:
+        return {appid: self.appdetails.get(appid, {"success": False}) for appid in appids.split(",") if appid}
+
+    def _storesearch(self, term: str) -> Dict[str, Any]:
+        key = _compact(term)
+        items = [{"type": "app", "id": app["appid"], "name": app["name"]}
+                 for app in self.apps if key and (key in _compact(app["name"]) or _compact(app["name"]) in key)]
+        return {"total": len(items), "items": items[:10]}
+
+
+class LLMReplay:
+    """Canned LLM answers with an injected time to first token and chunk delay."""
+
+    def __init__(self, latency: LatencyModel):
+        import litellm
+
+        self.latency = latency
+        self.fixture = load_fixture("llm.json")
+        self.calls: Counter = Counter()
+        self._completion = litellm.completion
+        self._acompletion = litellm.acompletion
+
+    def install(self):
+        import litellm
+
+        litellm.completion = self.completion
+        litellm.acompletion = self.acompletion
+
+    def _answer(self, messages: List[Dict[str, str]]) -> str:
+        # History roll-ups are the only calls without the system prompt
+        if not any(m["role"] == "system" for m in messages):
+            self.calls["summary"] += 1
+            return self.fixture["summary"]
+        self.calls["answer"] += 1
+        question = messages[-1]["content"].lower()
+        for keyword, answer in self.fixture["answers"].items():
+            if keyword != "default" and keyword in question:
+                return answer
+        return self.fixture["answers"]["default"]
+
+    def _stream(self, chunks):
+        for chunk in chunks:
+            time.sleep(self.latency.delay("llm_chunk"))
+            yield chunk
+
+    def completion(self, model, messages, stream=False, **kwargs):
+        answer = self._answer(messages)
+        time.sleep(self.latency.delay("llm_ttft"))
+        kwargs.pop("timeout", None)
+        response = self._completion(model=model, messages=messages, stream=stream, mock_response=answer, **kwargs)
+        return self._stream(response) if stream else response
+
+    async def acompletion(self, model, messages, **kwargs):
+        answer = self._answer(messages)
+        await asyncio.sleep(self.latency.delay("llm_ttft"))
+        kwargs.pop("timeout", None)
+        return await self._acompletion(model=model, messages=messages, mock_response=answer, **kwargs)
+
+
+def block_network():
+    """Make every real socket connection fail (replayed services do not open sockets)."""
+    def blocked(*args, **kwargs):
+        raise OSError("Network access is disabled in the offline benchmark")
+
+    socket.socket.connect = blocked
+    socket.socket.connect_ex = blocked
+    socket.create_connection = blocked
+
+
+def install_replay(latency: LatencyModel):
+    """Route the shared HTTP session and litellm through the fixtures. Returns (adapter, llm)."""
+    from utils.http_session import get_session
+
+    adapter = ReplayAdapter(latency)
+    session = get_session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    llm = LLMReplay(latency)
+    llm.install()
+    return adapter, llm
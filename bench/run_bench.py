@@ -0,0 +1,378 @@
+"""
+Offline benchmark of the chat pipeline.
+
+Replays recorded Steam / Serper / Tavily / LLM responses (bench/fixtures)
+with injected latency, then drives handle_tool_calls and the full chat turn
+(gatekeeper -> tools / fast path / cache -> streamed LLM answer -> chat
+store) over a corpus of Thai and English questions. Reports throughput,
+latency percentiles, answer paths, per-stage timings and memory. No network
+is needed (or allowed).
+
+    python bench/run_bench.py
+    python bench/run_bench.py --rounds 5 --concurrency 4 --latency serper=800,llm_ttft=1200
+    python bench/run_bench.py --latency-scale 0            # CPU cost only
+    python bench/run_bench.py --json bench/baseline.json  # save results
+    python bench/run_bench.py --baseline bench/baseline.json --max-regression 0.2  # exit 1 on regression
+
+Before timing, the labelled "gatekeeper" examples in queries.json are run
+through the games-only gatekeeper; a mislabelled one also exits with 1.
+
+The first round runs on empty caches ("cold"), later rounds reuse them ("warm").
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "src"))
+
+_workdir = tempfile.mkdtemp(prefix="gamechat-bench-")
+
+# Must be set before the app and utils modules are imported (they read it at import time)
+os.environ.update({
+    "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+    "HF_HUB_OFFLINE": "1",
+    "TRANSFORMERS_OFFLINE": "1",
+    "STEAM_CACHE_DB": "",
+    "SEARCH_CACHE_DB": "",
+    "STEAM_CATALOG_PATH": str(Path(__file__).parent / "fixtures" / "steam_applist.json"),
+    "RAG_DATA_DIR": os.path.join(_workdir, "rag_data"),
+    "TRACE_EXPORT_PATH": "",
+    "SERPER_API_KEY": "replay",
+    "TAVILY_API_KEY": "replay",
+    "OPENAI_API_KEY": "replay",
+    "DEFAULT_MODEL": "gpt-3.5-turbo",
+})
+os.environ.pop("STEAM_API_KEY", None)
+
+from bench.replay import LatencyModel, block_network, install_replay, load_fixture, parse_latency  # noqa: E402
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (exact, unlike the bucketed histograms in utils/metrics)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(q / 100 * len(ordered) + 0.5)))
+    return round(ordered[min(rank, len(ordered)) - 1], 1)
+
+
+def summarize(latencies: List[float], wall_s: float, paths: Counter, errors: int) -> Dict[str, Any]:
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall_s, 3),
+        "throughput_per_s": round(len(latencies) / wall_s, 2) if wall_s else None,
+        "mean_ms": round(sum(latencies) / len(latencies), 1) if latencies else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": round(max(latencies), 1) if latencies else None,
+        "paths": dict(sorted(paths.items())),
+    }
+
+
+class BenchSession:
+    """Per-user state that st.session_state holds in the app."""
+
+    def __init__(self, app, index: int):
+        from utils.chat_store import new_session_id
+
+        self.session_id = f"bench-{index}-{new_session_id()}"
+        self.messages: List[Dict[str, Any]] = []
+        self.history_manager = app.HistoryManager()
+
+
+def consume_stream(llm_client, messages):
+    """Headless stream_llm_response(): collect the streamed answer and its timings."""
+    from utils.llm_client import LLMError
+
+    parts, timings, info = [], {}, {}
+    start = time.perf_counter()
+    complete = True
+    try:
+        for token in llm_client.stream_chat(messages, raise_errors=True, info=info):
+            if not parts:
+                timings["ttft_ms"] = round((time.perf_counter() - start) * 1000)
+            parts.append(token)
+    except LLMError as e:
+        complete = False
+        print(f"LLM error during benchmark: {e.kind}: {e}")
+    timings["total_ms"] = round((time.perf_counter() - start) * 1000)
+    if info.get("model"):
+        timings["model"] = info["model"]
+    return "".join(parts), timings, complete
+
+
+def run_chat_turn(app, store, session: BenchSession, llm_client, prompt: str) -> str:
+    """Headless chat_turn(): same steps as the app, without rendering. Returns the answer path."""
+    from utils.tracing import span
+
+    with span("chat.turn", model=llm_client.model):
+        if not app.is_game_query(prompt):
+            for message in ({"role": "user", "content": prompt},
+                            {"role": "assistant", "content": app.random_refusal(), "search_used": False}):
+                session.messages.append(message)
+                store.append(session.session_id, message)
+            return "refusal"
+
+        user_message = {"role": "user", "content": prompt}
+        session.messages.append(user_message)
+        store.append(session.session_id, user_message)
+
+        turn_start = time.perf_counter()
+        turn = app.prepare_turn(prompt, session.messages, session.history_manager, llm_client,
+                                rag_budget_ms=app.RAG_LATENCY_BUDGET_MS, search_api="serper")
+        response, timings, complete = turn["response"], None, True
+        if turn["llm_messages"] is not None:
+            response, timings, complete = consume_stream(llm_client, turn["llm_messages"])
+        assistant_message = app.finish_turn(turn, prompt, llm_client, turn_start, response, timings, complete)
+        if response:
+            session.messages.append(assistant_message)
+            store.append(session.session_id, assistant_message)
+
+        if assistant_message.get("incomplete") or not response:
+            return "error"
+        if assistant_message.get("fast_path"):
+            return "fast_path"
+        if assistant_message.get("cached"):
+            return "cache"
+        return "tool" if turn["search_used"] else "llm"
+
+
+def run_tools_only(app, llm_client, prompt: str) -> str:
+    """handle_tool_calls() alone. Returns the route it took."""
+    _, direct, report = app.handle_tool_calls(prompt, llm_client, rag_budget_ms=app.RAG_LATENCY_BUDGET_MS,
+                                              search_api="serper")
+    if report.get("fast_path"):
+        return "fast_path"
+    if report["late"]:
+        return "late"
+    return "direct" if direct else "to_llm"
+
+
+def run_round(mode: str, app, store, llm_client, queries: List[str], concurrency: int, round_index: int):
+    """Run every query once. Returns (latencies ms, wall seconds, path counter, error count)."""
+    # Queries are dealt to `concurrency` sessions, each session asks its share in order
+    shares = [queries[i::concurrency] for i in range(concurrency)]
+    latencies: List[float] = []
+    paths: Counter = Counter()
+
+    def worker(index: int):
+        session = BenchSession(app, round_index * concurrency + index)
+        results = []
+        for prompt in shares[index]:
+            start = time.perf_counter()
+            try:
+                if mode == "turn":
+                    path = run_chat_turn(app, store, session, llm_client, prompt)
+                else:
+                    path = run_tools_only(app, llm_client, prompt)
+            except Exception as e:
+                print(f"Benchmark error ({mode}, {prompt!r}): {e}")
+                path = "error"
+            results.append(((time.perf_counter() - start) * 1000, path))
+        return results
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+        for results in pool.map(worker, range(concurrency)):
+            for ms, path in results:
+                latencies.append(ms)
+                paths[path] += 1
+    wall_s = time.perf_counter() - start
+    return latencies, wall_s, paths, paths.get("error", 0)
+
+
+def check_gatekeeper(app, examples: List[List[Any]]) -> List[str]:
+    """Labelled (message, is_game) examples against the gatekeeper with the fixture catalog."""
+    failures = []
+    for text, expected in examples:
+        if app.is_game_query(text) != expected:
+            failures.append(f"{text!r}: expected is_game={expected}")
+    return failures
+
+
+def reset_caches(app):
+    """Start from cold caches (in-process only in the benchmark)."""
+    from utils.http_session import TokenBucket
+    from utils.steam_api import SteamAPI, STEAM_RATE_PER_SEC, STEAM_RATE_BURST
+    from utils.search_tools import WebSearchTool
+
+    for cls in (SteamAPI, WebSearchTool):
+        for attr in ("_search_cache", "_details_cache", "_cache"):
+            if getattr(cls, attr, None) is not None:
+                setattr(cls, attr, None)
+    SteamAPI._rate_limiter = TokenBucket(STEAM_RATE_PER_SEC, STEAM_RATE_BURST)
+    app.get_semantic_cache().clear()
+
+
+def run_benchmarks(args) -> Dict[str, Any]:
+    import streamlit.logger
+    streamlit.logger.set_log_level("error")
+
+    latency = LatencyModel(parse_latency(args.latency), scale=args.latency_scale, seed=args.seed)
+    block_network()
+    adapter, llm = install_replay(latency)
+
+    import app
+    from utils.chat_store import ChatStore
+    from utils.tracing import stage_stats
+
+    fixture = load_fixture("queries.json")
+    queries = fixture["queries"]
+    store = ChatStore(Path(_workdir) / "chat_memory.db")
+    llm_client = app.get_llm_client()
+
+    results: Dict[str, Any] = {
+        "config": {
+            "rounds": args.rounds, "concurrency": args.concurrency, "queries": len(queries),
+            "latency_ms": latency.latency_ms, "latency_scale": args.latency_scale, "seed": args.seed,
+        },
+        "modes": {},
+        "gatekeeper_failures": check_gatekeeper(app, fixture.get("gatekeeper", [])),
+    }
+
+    for mode in args.modes:
+        reset_caches(app)
+        phases = {"cold": [[], 0.0, Counter(), 0], "warm": [[], 0.0, Counter(), 0]}
+        for round_index in range(args.rounds):
+            latencies, wall_s, paths, errors = run_round(mode, app, store, llm_client, queries,
+                                                         args.concurrency, round_index)
+            phase = phases["cold" if round_index == 0 else "warm"]
+            phase[0] += latencies
+            phase[1] += wall_s
+            phase[2].update(paths)
+            phase[3] += errors
+        results["modes"][mode] = {name: summarize(*phase) for name, phase in phases.items() if phase[0]}
+
+        if args.memory:
+            # Separate pass: tracemalloc slows allocation-heavy code down, so it is not timed
+            reset_caches(app)
+            tracemalloc.start()
+            run_round(mode, app, store, llm_client, queries, args.concurrency, args.rounds)
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("filename")[:5]
+            tracemalloc.stop()
+            results["modes"][mode]["memory"] = {
+                "traced_current_kb": round(current / 1024),
+                "traced_peak_kb": round(peak / 1024),
+                "top_files_kb": {str(stat.traceback[0].filename).replace(str(project_root) + os.sep, ""):
+                                 round(stat.size / 1024) for stat in top},
+            }
+
+    results["stages"] = {name: {k: v for k, v in snap.items() if k in ("count", "p50_ms", "p95_ms", "p99_ms")}
+                         for name, snap in stage_stats().items()}
+    results["calls"] = {**dict(adapter.calls), **{f"llm_{k}": v for k, v in llm.calls.items()}}
+    results["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return results
+
+
+def print_report(results: Dict[str, Any]):
+    config = results["config"]
+    print(f"\n{config['queries']} queries x {config['rounds']} rounds, concurrency {config['concurrency']}, "
+          f"latency scale {config['latency_scale']}")
+    header = f"{'mode':6s} {'phase':5s} {'n':>5s} {'req/s':>8s} {'mean':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s}"
+    print(header)
+    print("-" * len(header))
+    for mode, phases in results["modes"].items():
+        for phase, s in phases.items():
+            if phase == "memory":
+                continue
+            print(f"{mode:6s} {phase:5s} {s['count']:5d} {s['throughput_per_s']:8.2f} {s['mean_ms']:8.1f} "
+                  f"{s['p50_ms']:8.1f} {s['p95_ms']:8.1f} {s['p99_ms']:8.1f} {s['max_ms']:8.1f}  {s['paths']}")
+
+    for mode, phases in results["modes"].items():
+        memory = phases.get("memory")
+        if memory:
+            print(f"\nmemory ({mode}): traced peak {memory['traced_peak_kb']} KB, "
+                  f"still allocated {memory['traced_current_kb']} KB")
+            for filename, kb in memory["top_files_kb"].items():
+                print(f"  {kb:8d} KB  {filename}")
+    print(f"max RSS: {results['max_rss_mb']} MB")
+
+    print(f"\n{'stage':28s} {'n':>6s} {'p50':>8s} {'p95':>8s} {'p99':>8s}")
+    for name, s in sorted(results["stages"].items(), key=lambda item: -(item[1]["p95_ms"] or 0)):
+        print(f"{name:28s} {s['count']:6d} {s['p50_ms']:8} {s['p95_ms']:8} {s['p99_ms']:8}")
+    print(f"\nreplayed calls: {results['calls']}")
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float,
+                          min_delta_ms: float = 5.0) -> List[str]:
+    """
+    Regressions beyond max_regression (fraction) in p95 latency, throughput or
+    traced memory. p95 changes smaller than min_delta_ms are noise, not regressions.
+    """
+    regressions = []
+    for mode, phases in results["modes"].items():
+        for phase, s in phases.items():
+            base = baseline.get("modes", {}).get(mode, {}).get(phase)
+            if phase == "memory" or not base:
+                continue
+            slower = s["p95_ms"] - base["p95_ms"] if base["p95_ms"] else 0
+            if slower > min_delta_ms and s["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+                regressions.append(f"{mode}/{phase} p95 {base['p95_ms']} -> {s['p95_ms']} ms")
+            if slower > min_delta_ms and s["throughput_per_s"] < base["throughput_per_s"] * (1 - max_regression):
+                regressions.append(f"{mode}/{phase} throughput {base['throughput_per_s']} -> {s['throughput_per_s']}/s")
+        memory, base_memory = phases.get("memory"), baseline.get("modes", {}).get(mode, {}).get("memory")
+        if memory and base_memory and memory["traced_peak_kb"] > base_memory["traced_peak_kb"] * (1 + max_regression):
+            regressions.append(f"{mode} traced peak {base_memory['traced_peak_kb']} -> {memory['traced_peak_kb']} KB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the game chat pipeline")
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the query corpus (first one is cold)")
+    parser.add_argument("--concurrency", type=int, default=1, help="chat sessions running at the same time")
+    parser.add_argument("--modes", nargs="+", choices=("tools", "turn"), default=["tools", "turn"])
+    parser.add_argument("--latency", default="", help='override injected latency, e.g. "steam=80,llm_ttft=900"')
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply all injected latency (0 = none)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc pass")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed slowdown vs the baseline before exiting with status 1 (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                        help="ignore p95 / throughput changes when p95 moved by less than this")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    print_report(results)
+    if results["gatekeeper_failures"]:
+        print("\nGATEKEEPER mislabelled examples:")
+        for failure in results["gatekeeper_failures"]:
+            print(f"  {failure}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nresults written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.max_regression, args.min_delta_ms)
+        if regressions:
+            print("\nREGRESSIONS vs baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nno regressions vs {args.baseline} (threshold {args.max_regression:.0%})")
+    if results["gatekeeper_failures"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
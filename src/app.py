@@ -1,22 +1,53 @@
 import streamlit as st
 import sys
 import os
-import json
 import random 
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Tuple
+from typing import Tuple, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from utils.llm_client import LLMClient, get_available_models
+from utils.llm_client import LLMClient, LLMError, get_available_models
 from utils.search_tools import WebSearchTool, format_search_results
 from utils.steam_api import SteamAPI
+from utils.steam_catalog import get_catalog
+from utils.intent_router import (
+    route_intent, ROUTE_STEAM, ROUTE_GAME_INFO, ROUTE_TOP_SELLERS, ROUTE_SEARCH
+)
+from utils.rag_system import SimpleRAGSystem
+from utils.http_session import get_session, warm_up_connections
+from utils.tool_executor import run_tools
+from utils.fast_path import (
+    match_fast_path, answer_fast_path, record_answer, record_fallback, answer_path_stats
+)
+from utils.semantic_cache import SemanticCache, TIME_SENSITIVE_CLASSES
+from utils.chat_history import HistoryManager
+from utils.chat_store import ChatStore, new_session_id
+from utils.tracing import span, traced, get_trace, stage_stats
 
 MEMORY_DIR = Path("data")
-MEMORY_FILE = MEMORY_DIR / "chat_memory.json"
+MEMORY_DB = MEMORY_DIR / "chat_memory.db"
+MEMORY_PAGE_SIZE = 50
+
+# RAG: เวลาสูงสุดที่ยอมรอการค้นเอกสารต่อคำถาม ถ้าเกินให้ข้ามไปเลย
+RAG_DATA_DIR = os.getenv("RAG_DATA_DIR", "rag_data")
+RAG_LATENCY_BUDGET_MS = int(os.getenv("RAG_LATENCY_BUDGET_MS", 300))
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", 0.3))
+# ใช้โมเดล multilingual (เช่น paraphrase-multilingual-MiniLM-L12-v2) ถ้าอยากให้คำถามไทย/อังกฤษจับคู่กันได้
+RAG_EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+# เวลาสูงสุดที่รอแต่ละ tool (ยิงพร้อมกัน ตัวที่ช้ากว่านี้ถูกข้ามและบันทึกว่า late)
+TOOL_DEADLINES_MS = {
+    "steam": int(os.getenv("STEAM_DEADLINE_MS", 3000)),
+    "search": int(os.getenv("SEARCH_DEADLINE_MS", 4000)),
+    "top_sellers": int(os.getenv("TOP_SELLERS_DEADLINE_MS", 5000)),
+}
 
 REFUSALS_TH = [
     "ผมตอบเฉพาะเรื่องเกมนะครับ 🙂 ลองถามชื่อเกม แนวเกม ราคา หรือสเปคได้เลย",
@@ -29,109 +60,267 @@ REFUSALS_TH = [
 def random_refusal() -> str:
     return random.choice(REFUSALS_TH)
 
-GAME_HINTS = [
-    "เกม","game","video game","steam","playstation","ps4","ps5",
-    "xbox","switch","nintendo","pc","mobile","android","ios",
-    "dlc","mod","patch","fps","rpg","moba","open world","survival",
-    "multiplayer","singleplayer","esports","rank","รีวิว","แนว","สเปค","ราคา",
-    "gta","elden ring","valorant","dota","lol","cs2","minecraft","roblox","cyberpunk",
-]
+def find_game_in_text(text: str, intent=None):
+    """(appid, ชื่อ) ของเกมที่พูดถึงในข้อความจาก Steam catalog หรือ None"""
+    intent = intent or route_intent(text)
+    # ชื่อเกมคำเดียว ("how much is terraria") นับเมื่อข้อความมีคีย์เวิร์ดเกม หรือถามราคา/วันวางขาย/แนว/โหลด
+    # ไม่งั้นคำเดียวที่บังเอิญตรงชื่อแอป ("dinner", "homework") จะผ่าน ต้องตรงอย่างน้อย 2 คำ
+    single_word = intent.is_game or intent.has("steam") or bool(match_fast_path(text))
+    return get_catalog().find_in_text(text, min_words=1 if single_word else 2)
+
+@traced("is_game_query")
 def is_game_query(text: str) -> bool:
-    t = text.lower()
-    return any(k in t for k in GAME_HINTS)
+    # ชื่อเกมที่ไม่อยู่ในลิสต์คีย์เวิร์ด (เช่น "how much is stardew valley") ดูจาก Steam catalog
+    intent = route_intent(text)
+    return intent.is_game or find_game_in_text(text, intent) is not None
+
+@st.cache_resource(show_spinner=False)
+def get_chat_store() -> ChatStore:
+    """ที่เก็บประวัติแชตของทุก session (SQLite ไฟล์เดียว แยกกันด้วย session id)"""
+    return ChatStore(MEMORY_DB)
+
+def get_session_id() -> str:
+    """id ของ session นี้ เก็บไว้ใน URL ด้วย (?sid=...) กด refresh แล้วจะได้แชตเดิมกลับมา"""
+    if "session_id" not in st.session_state:
+        sid = st.query_params.get("sid") if hasattr(st, "query_params") else None
+        if not sid:
+            sid = new_session_id()
+            if hasattr(st, "query_params"):
+                st.query_params["sid"] = sid
+        st.session_state.session_id = sid
+    return st.session_state.session_id
 
 def load_memory():
-    """Load chat memory if file exists, but clear on new session"""
-    memory_file = Path("data/chat_memory.json")
-
-    # ถ้ามีการรันใหม่
-    if not st.session_state.get("initialized", False):
-        if memory_file.exists():
-            memory_file.unlink()
-        st.session_state.initialized = True
-
-    # โหลดไฟล์ใหม่
-    if memory_file.exists():
-        with open(memory_file, "r", encoding="utf-8") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return []
-    return []
-
-def save_memory(messages):
-    """บันทึกประวัติแชตลงไฟล์"""
-    MEMORY_DIR.mkdir(exist_ok=True)
-    with open(MEMORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(messages, f, ensure_ascii=False, indent=2)
+    """โหลดประวัติแชตหน้าล่าสุดของ session นี้ (หน้าเก่ากว่าโหลดเมื่อกดดูเท่านั้น)"""
+    messages, has_older = get_chat_store().load(get_session_id(), limit=MEMORY_PAGE_SIZE)
+    st.session_state.has_older_messages = has_older
+    return messages
+
+def load_older_messages():
+    """โหลดข้อความเก่าอีกหนึ่งหน้า (ไว้แสดงอย่างเดียว ไม่ส่งเข้า LLM)"""
+    loaded = st.session_state.older_messages + st.session_state.messages
+    oldest_id = next((m["id"] for m in loaded if "id" in m), None)
+    older, has_older = get_chat_store().load(get_session_id(), limit=MEMORY_PAGE_SIZE, before_id=oldest_id)
+    st.session_state.older_messages = older + st.session_state.older_messages
+    st.session_state.has_older_messages = has_older
+
+def save_message(message):
+    """เพิ่มข้อความเดียวต่อท้ายประวัติแชต (append อย่างเดียว ไม่เขียนทั้งไฟล์ใหม่)"""
+    get_chat_store().append(get_session_id(), message)
+
+def start_new_session():
+    """เปลี่ยนไปใช้ session id ใหม่ (แชตว่าง)"""
+    st.session_state.session_id = new_session_id()
+    if hasattr(st, "query_params"):
+        st.query_params["sid"] = st.session_state.session_id
+    st.session_state.older_messages = []
+    st.session_state.has_older_messages = False
 
 def clear_memory():
     """ล้างหน่วยความจำ"""
-    if MEMORY_FILE.exists():
-        MEMORY_FILE.unlink()
+    get_chat_store().clear(get_session_id())
+    st.session_state.older_messages = []
+    st.session_state.has_older_messages = False
+
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "gpt-3.5-turbo")
+
+# resource หนัก ๆ สร้างครั้งเดียวต่อ process แล้วทุก session ใช้ร่วมกัน (st.cache_resource)
+@st.cache_resource(show_spinner=False)
+def get_llm_client(model: str = DEFAULT_MODEL,
+                   temperature: float = float(os.getenv("TEMPERATURE", 0.7)),
+                   max_tokens: int = int(os.getenv("MAX_TOKENS", 1000))) -> LLMClient:
+    """LLMClient ที่แชร์กันทั้ง process (หนึ่งตัวต่อการตั้งค่า)"""
+    return LLMClient(model=model, temperature=temperature, max_tokens=max_tokens)
+
+@st.cache_resource(show_spinner=False)
+def get_search_tool() -> WebSearchTool:
+    """WebSearchTool ที่แชร์กันทั้ง process"""
+    return WebSearchTool()
+
+@st.cache_resource(show_spinner=False)
+def warm_up_resources() -> bool:
+    """สร้าง resource ทั้งหมดตอนเริ่ม process คำถามแรกของแต่ละ session จะได้ไม่ต้องรอ"""
+    get_llm_client()
+    get_search_tool()
+    get_rag_system()
+    get_session()
+    get_chat_store()
+    catalog = get_catalog()
+    if SteamAPI.API_KEY:
+        # อัปเดตรายชื่อเกมจาก Steam เฉพาะที่เปลี่ยนตั้งแต่ครั้งก่อน (ทำเบื้องหลัง)
+        threading.Thread(target=catalog.refresh_from_steam, args=(SteamAPI.API_KEY,),
+                         name="steam-catalog-refresh", daemon=True).start()
+    warm_up_connections([
+        SteamAPI.SEARCH_URL,
+        "https://google.serper.dev",
+    ])
+    return True
 
 def init_session_state():
     """Initialize Streamlit session state"""
     if "messages" not in st.session_state:
+        st.session_state.older_messages = []
         st.session_state.messages = load_memory()
 
-    if "llm_client" not in st.session_state or st.session_state.llm_client is None:
-        st.session_state.llm_client = LLMClient(
-            model=os.getenv("DEFAULT_MODEL", "gpt-3.5-turbo"),
-            temperature=float(os.getenv("TEMPERATURE", 0.7)),
-            max_tokens=int(os.getenv("MAX_TOKENS", 1000))
-        )
-
-    if "search_tool" not in st.session_state:
-        st.session_state.search_tool = WebSearchTool()
+    # เก็บแค่ชื่อโมเดลใน session ส่วน client จริงใช้ของกลาง (get_llm_client)
+    if "llm_model" not in st.session_state:
+        st.session_state.llm_model = DEFAULT_MODEL
 
     if "search_api" not in st.session_state:
         st.session_state.search_api = "serper"
 
-def get_steam_game_info(game_name: str) -> str:
+    # history ที่ส่งให้ LLM: เก็บเฉพาะเทิร์นล่าสุดที่อยู่ใน token budget ที่เหลือสรุปรวบไว้
+    if "history_manager" not in st.session_state:
+        st.session_state.history_manager = HistoryManager()
+
+@st.cache_resource(show_spinner=False)
+def get_rag_executor() -> ThreadPoolExecutor:
+    """Thread pool สำหรับค้น RAG แบบมี timeout"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag")
+
+@st.cache_resource(show_spinner=False)
+def get_rag_system() -> SimpleRAGSystem:
+    """RAG system ของทั้ง process (โหลด FAISS index / embedding model ครั้งเดียว ไม่โหลดใหม่ทุก rerun)"""
+    rag = SimpleRAGSystem(data_dir=RAG_DATA_DIR, embedding_model=RAG_EMBEDDING_MODEL, min_score=RAG_MIN_SCORE)
+    if rag.num_chunks > 0:
+        # เริ่มโหลด embedding model เบื้องหลังเลย คำถามแรกจะได้ไม่ต้องรอ
+        rag.warm_up_async(get_rag_executor())
+    return rag
+
+@st.cache_resource(show_spinner=False)
+def get_semantic_cache() -> SemanticCache:
+    """แคชคำตอบตามความหมายของคำถาม ใช้ embedding model ตัวเดียวกับ RAG"""
+    rag = get_rag_system()
+    # ใช้ warm-up ตัวเดียวกับ RAG (ถ้ายังไม่เริ่มเพราะไม่มีเอกสาร ก็เริ่มตรงนี้ ไม่โหลดโมเดลซ้ำ)
+    rag.warm_up_async(get_rag_executor())
+    return SemanticCache(encoder=rag.embed_query)
+
+def semantic_cache_allowed(intent, has_history: bool) -> bool:
+    """ใช้แคชคำตอบได้ไหม: ราคา/ข่าวเปลี่ยนเร็วห้ามใช้ และคำถามต่อเนื่องที่ไม่ระบุเกมอาจอ้างถึงเทิร์นก่อน"""
+    if intent is None or any(intent.has(cls) for cls in TIME_SENSITIVE_CLASSES):
+        return False
+    if has_history and not intent.game_name:
+        return False
+    # ยังโหลด embedding model ไม่เสร็จ ไม่รอ
+    return get_rag_system().is_ready
+
+def rag_lookup(query: str) -> str:
+    """ค้น context จาก RAG (ไม่มีเอกสาร หรือโมเดลยังโหลดไม่เสร็จ คืนค่าว่าง)"""
+    rag = get_rag_system()
+    if rag.num_chunks == 0 or not rag.is_ready:
+        # โมเดลยังโหลดไม่เสร็จ (ใช้เวลาหลายวินาที) ข้ามรอบนี้ไปก่อน
+        return ""
+
+    context = rag.get_context_for_query(query)
+    if context.startswith("No relevant context"):
+        return ""
+    return context
+
+def get_steam_game_details(game_name: str, appid=None):
+    """คืน (appid, appdetails) ของเกมจาก Steam (ผ่านแคช) appid หาไม่เจอได้ (None, None)"""
+    if appid is None:
+        # หา appid จาก catalog ในเครื่องก่อน ไม่เจอค่อยถาม Steam search
+        found = get_catalog().resolve(game_name)
+        appid = found[0] if found else SteamAPI.search_game(game_name)
+    if not appid:
+        return None, None
+    return appid, SteamAPI.get_game_details(appid)
+
+@traced("get_steam_game_info")
+def get_steam_game_info(game_name: str, appid=None) -> str:
     """ดึงข้อมูลเกมจริงจาก Steam"""
-    appid = SteamAPI.search_game(game_name)
+    return format_game_info(*get_steam_game_details(game_name, appid))
+
+def format_game_info(appid, data) -> str:
+    """ข้อความข้อมูลเกมจากผลของ get_steam_game_details"""
     if not appid:
         return "❌ ไม่พบเกมนี้ใน Steam Store."
 
-    data = SteamAPI.get_game_details(appid)
     if data:
         return SteamAPI.format_steam_info(appid, data)
 
     return "⚠️ ไม่สามารถดึงข้อมูลเกมจาก Steam ได้."
 
-def handle_tool_calls(message_content: str, llm_client=None) -> Tuple[str, bool]:
+def format_top_games(games) -> str:
+    """จัดรูปแบบลิสต์เกมขายดีบน Steam พร้อมราคา"""
+    lines = ["🟨 **เกมขายดีบน Steam ตอนนี้:**", ""]
+    for i, game in enumerate(games, 1):
+        price = "Free" if game["price"] == "N/A" else game["price"]
+        discount = f" (ลด {game['discount_percent']}%)" if game.get("discount_percent") else ""
+        url = f"https://store.steampowered.com/app/{game['appid']}/"
+        lines.append(f"{i}. [{game['name']}]({url}) — 💰 {price}{discount}")
+    return "  \n".join(lines)
+
+@traced("handle_tool_calls")
+def handle_tool_calls(message_content: str, llm_client=None, rag_budget_ms: int = 0,
+                      search_api: str = "serper") -> Tuple[str, bool, dict]:
+    """
+    เลือก tool ตาม intent แล้วเรียกทุกตัวพร้อมกัน (Steam / web search / RAG) แต่ละตัวมี deadline ของตัวเอง
+    คืนค่า (ข้อความ, ตอบตรงโดยไม่ผ่าน LLM หรือไม่, รายงาน tool: results/late/errors/timings_ms/rag_context)
+    """
+    report = {"results": {}, "late": [], "errors": {}, "timings_ms": {}, "rag_context": "", "intent": None}
     if llm_client is None:
-        return message_content, False
-
-    message_lower = message_content.lower()
-
-    # คีย์เวิร์ด
-    game_name_keywords = [
-        "gta", "fortnite", "valorant", "call of duty", "cod", "pubg",
-        "elden ring", "cyberpunk", "palworld", "counter strike", "cs2",
-        "roblox", "minecraft", "overwatch", "apex", "dota", "league of legends",
-        "lol", "genshin", "starfield", "battlefield", "red dead", "hollow knight"
-    ]
-    steam_keywords = ["ราคา", "price", "ลดราคา", "sale", "discount", "cost", "ซื้อ", "steam", "ข้อมูล", "เพิ่มเติม", "สนใจ", "download","โหลด","โหลดได้ที่ไหน","ดาวน์โหลด","download link"]
-    general_game_keywords = ["คืออะไร", "รู้จัก", "แนว", "เกี่ยวกับ", "review", "รีวิว", "สนุกไหม", "ดีไหม"]
-
-    search_triggers = [
-        "top games", "เกมมาแรง", "ยอดนิยม", "popular", "trending", "best selling",
-        "most played", "update", "news", "ออกใหม่", "เปิดตัว", "เกมใหม่"
-    ]
-
-    #ตรวจจับชื่อเกม
-    game_name = None
-    for g in game_name_keywords:
-        if g in message_lower:
-            game_name = g
-            break
+        return message_content, False, report
+
+    #ตรวจจับชื่อเกม (catalog ของ Steam ในเครื่องก่อน แล้วค่อยคีย์เวิร์ดใน intent router)
+    intent = route_intent(message_content)
+    found = find_game_in_text(message_content, intent)
+    game_appid = found[0] if found else None
+    if found:
+        intent = route_intent(message_content, found[1])
+    game_name = intent.game_name
+    route = intent.route
+    report["intent"] = intent
+
+    # คำถามข้อเท็จจริงสั้น ๆ (ราคา/วันวางขาย/แนวเกม/โหลดที่ไหน) ตอบจากข้อมูล Steam ตรง ๆ ไม่ต้องผ่าน LLM
+    fields = match_fast_path(message_content) if game_name else []
+    fast = None
+    if fields:
+        fast = run_tools({"steam": (lambda: get_steam_game_details(game_name, game_appid), TOOL_DEADLINES_MS["steam"])})
+        appid, data = fast["results"].get("steam") or (None, None)
+        answer = answer_fast_path(appid, data, fields) if appid else None
+        if answer:
+            report.update(fast)
+            report["results"] = {}
+            report["fast_path"] = fields
+            return answer, True, report
+        # ไม่มีข้อมูลพอ หรือ Steam ตอบไม่ทัน: ไปทางปกติ (ถ้า Steam ยังโหลดอยู่ แคชจะอุ่นให้รอบถัดไป)
+        record_fallback(fast["total_ms"])
+
+    tasks = {}
+    if route == ROUTE_TOP_SELLERS:
+        tasks["top_sellers"] = (lambda: SteamAPI.get_top_games_with_prices(10), TOOL_DEADLINES_MS["top_sellers"])
+    else:
+        if route == ROUTE_STEAM and fast is None:
+            tasks["steam"] = (lambda: get_steam_game_info(game_name, game_appid), TOOL_DEADLINES_MS["steam"])
+        elif route == ROUTE_STEAM and "steam" in fast["results"]:
+            # fast path ดึงข้อมูลมาแล้วแต่ตอบไม่ได้ ใช้ข้อมูลเดิม ไม่ถาม Steam ซ้ำ
+            tasks["steam"] = (lambda: format_game_info(appid, data), TOOL_DEADLINES_MS["steam"])
+        if route in (ROUTE_STEAM, ROUTE_SEARCH) and intent.has("search"):
+            tasks["search"] = (lambda: execute_search(message_content, 5, search_api), TOOL_DEADLINES_MS["search"])
+
+    # Steam ช้า/ล้มตอน fast path แล้ว ไม่ถามซ้ำ (รอบที่ยังโหลดอยู่จะอุ่นแคชให้) ให้ LLM ตอบจากที่มี
+    steam_skipped = route == ROUTE_STEAM and fast is not None and "steam" not in fast["results"]
+
+    # tool เดียวตอบตรงได้เลย ที่เหลือต้องผ่าน LLM จึงค้น RAG ไปพร้อมกัน
+    direct = len(tasks) == 1 and not steam_skipped
+    if not direct and rag_budget_ms > 0:
+        tasks["rag"] = (lambda: rag_lookup(message_content), rag_budget_ms)
+
+    if tasks:
+        report.update(run_tools(tasks))
+    if steam_skipped:
+        report["late"] = fast["late"] + report["late"]
+        report["errors"] = {**fast["errors"], **report["errors"]}
+        report["timings_ms"] = {**fast["timings_ms"], **report["timings_ms"]}
+    results = report["results"]
+    report["rag_context"] = results.get("rag", "")
+    if report["late"]:
+        print(f"Tools over deadline: {', '.join(report['late'])}")
 
     #ราคา
-    if game_name and any(k in message_lower for k in steam_keywords):
-        steam_info = get_steam_game_info(game_name)
-        steam_info = steam_info.replace("ราคา: N/A", "ราคา: Free").replace("\n", "  \n")
+    if direct and "steam" in results:
+        steam_info = results["steam"].replace("ราคา: N/A", "ราคา: Free").replace("\n", "  \n")
 
         final_answer = f"""\
 🟨 **นี่คือข้อมูลของเกม:**
@@ -139,45 +328,305 @@ def handle_tool_calls(message_content: str, llm_client=None) -> Tuple[str, bool]
 {steam_info}
     <-- หากสนใจสามารถกด Link นี้ได้ครับ 
 """
-        return final_answer, True
-    
+        return final_answer, True, report
+
+    # เกมขายดีพร้อมราคา: ดึงจาก Steam ทีเดียวทั้งลิสต์
+    if direct and results.get("top_sellers"):
+        return format_top_games(results["top_sellers"]), True, report
+
     # อธิบายเกมllmตอบ
-    if game_name and any(k in message_lower for k in general_game_keywords):
+    if route == ROUTE_GAME_INFO:
         enhanced_prompt = f"""
 ผู้ใช้ถามเกี่ยวกับเกม: {message_content}
 
 ให้ตอบโดยไม่ต้องใช้ Steam API  
 อธิบายว่าเกมนี้คือเกมอะไร แนวไหน และเนื้อหาคร่าว ๆ เป็นภาษาไทย อ่านเข้าใจง่าย
 """
-        return enhanced_prompt, False
+        return enhanced_prompt, False, report
 
-    #คำถามที่ไม่เกี่ยวกับราคา
-    if any(trigger in message_lower for trigger in search_triggers):
-        search_results = execute_search(message_content, 5)
+    # ถามหลายเรื่องพร้อมกัน (เช่น ราคา + ข่าว): รวมผลทุก tool ที่ตอบทันให้ LLM สรุป
+    if "search" in results and route == ROUTE_STEAM:
+        late_note = f"\n(แหล่งข้อมูลที่ตอบไม่ทัน: {', '.join(report['late'])})" if report["late"] else ""
         enhanced_prompt = f"""
 User Query: {message_content}
 
+ข้อมูลจาก Steam:
+{results.get("steam", "(ดึงข้อมูลจาก Steam ไม่ได้หรือไม่ทัน)")}
+
+I searched the web and found:
+{format_search_results(results["search"])}
+{late_note}
+ตอบคำถามเป็นภาษาไทยให้อ่านเข้าใจง่าย โดยใช้ข้อมูลข้างบน
+"""
+        return enhanced_prompt, False, report
+
+    if "steam" in results:
+        late_note = f"\n(แหล่งข้อมูลที่ตอบไม่ทัน: {', '.join(report['late'])})" if report["late"] else ""
+        return f"{message_content}\n\nข้อมูลจาก Steam:\n{results['steam']}{late_note}", False, report
+
+    #คำถามที่ไม่เกี่ยวกับราคา
+    if route in (ROUTE_TOP_SELLERS, ROUTE_SEARCH):
+        search_results = results.get("search")
+        if search_results is None and "search" not in tasks:
+            # top sellers ไม่สำเร็จ ใช้ web search แทน
+            search_results = execute_search(message_content, 5, search_api)
+        if search_results is not None:
+            enhanced_prompt = f"""
+User Query: {message_content}
+
 I searched the web and found:
 {format_search_results(search_results)}
 
 สรุปข้อมูลนี้เป็นภาษาไทยให้อ่านเข้าใจง่าย เหมือนข่าวเกม
 """
-        return enhanced_prompt, True
+            return enhanced_prompt, True, report
 
-    # ไม่เข้าเงื่อนไข ให้ไปที่ llm
-    return message_content, False
+    # ไม่เข้าเงื่อนไข (หรือ tool ตอบไม่ทัน) ให้ไปที่ llm
+    return message_content, False, report
 
-def execute_search(query: str, num_results: int = 5):
-    api = st.session_state.get("search_api", "serper")
-    results = st.session_state.search_tool.search(query, num_results, preferred_api=api)
+@traced("execute_search")
+def execute_search(query: str, num_results: int = 5, api: Optional[str] = None):
+    # อ่าน session_state ได้เฉพาะใน thread ของ Streamlit ตอนรันใน tool pool ต้องส่ง api มาเอง
+    api = api or st.session_state.get("search_api", "serper")
+    results = get_search_tool().search(query, num_results, preferred_api=api)
     return results
 
+# promptบอก Ai
+SYSTEM_PROMPT = """
+You are a professional Game Assistant 🎮.
+You must ONLY answer questions related to *video games*.
+Topics you can talk about include:
+- Game details (story, gameplay, mechanics, reviews, genres)
+- Platforms (PC, PlayStation, Xbox, Nintendo, Mobile)
+- Game recommendations, comparisons, or similar titles
+- Game prices, updates, DLCs, mods, esports, or hardware for gaming
+- Game industry news, trends, or game development concepts
+
+If the user asks about anything unrelated to games:
+Politely refuse in Thai with a short friendly sentence.
+"""
+
+def stream_llm_response(llm_client: LLMClient, messages) -> Tuple[str, dict, bool]:
+    """
+    สตรีมคำตอบจาก LLM ลงในกล่องแชต พร้อมจับเวลา time-to-first-token และเวลารวม
+    คืนค่า (ข้อความ, timings, ครบหรือไม่) ถ้า error กลางทางจะได้ complete=False
+    ถ้าโมเดลหลักล่มก่อนได้ token แรก LLMClient จะ retry/สลับไปโมเดลอื่นให้เอง
+    """
+    parts = []
+    timings = {}
+    info = {}
+    start = time.perf_counter()
+
+    def token_stream():
+        for token in llm_client.stream_chat(messages, raise_errors=True, info=info):
+            if not parts:
+                timings["ttft_ms"] = round((time.perf_counter() - start) * 1000)
+            parts.append(token)
+            yield token
+
+    complete = True
+    try:
+        st.write_stream(token_stream())
+    except LLMError as e:
+        complete = False
+        if e.partial:
+            st.error(f"⚠️ คำตอบขาดกลางทาง ({e.model}: {e.kind}) คำตอบอาจไม่ครบ")
+        else:
+            st.error(f"⚠️ ตอนนี้เรียก LLM ไม่สำเร็จ ({e.kind}) ลองใหม่อีกครั้งภายหลัง")
+        print(f"LLM stream error: {e.to_dict()}")
+    except Exception as e:
+        complete = False
+        st.error(f"⚠️ สร้างคำตอบไม่สำเร็จ (คำตอบอาจไม่ครบ): {e}")
+
+    timings["total_ms"] = round((time.perf_counter() - start) * 1000)
+    if info.get("model"):
+        timings["model"] = info["model"]
+    if info.get("attempts"):
+        timings["failed_attempts"] = len(info["attempts"])
+    if "ttft_ms" in timings:
+        caption = f"⏱️ first token {timings['ttft_ms']} ms · total {timings['total_ms']} ms"
+        if timings.get("model") and timings["model"] != llm_client.model:
+            caption += f" · ตอบโดย {timings['model']} (สำรอง)"
+        st.caption(caption)
+    return "".join(parts), timings, complete
+
 def display_chat_messages():
-    for message in st.session_state.messages:
+    if st.session_state.get("has_older_messages", False):
+        if st.button("⬆️ Load older messages"):
+            load_older_messages()
+
+    for message in st.session_state.older_messages + st.session_state.messages:
         with st.chat_message(message["role"]):
             if message.get("search_used", False):
                 st.markdown("🔍 *Used search or Steam API*")
             st.markdown(message["content"])
+            if message.get("incomplete", False):
+                st.caption("⚠️ คำตอบนี้ไม่สมบูรณ์ (เกิดข้อผิดพลาดระหว่างสร้างคำตอบ)")
+            late_tools = message.get("tools", {}).get("late")
+            if late_tools:
+                st.caption(f"⏱️ ตอบไม่ทันเวลา (ไม่ได้ใช้ผล): {', '.join(late_tools)}")
+
+def display_trace_panel():
+    """แผง debug: เวลาแต่ละขั้นของเทิร์นล่าสุด และ p50/p95/p99 ของแต่ละขั้นตั้งแต่เปิดแอป"""
+    with st.expander("🔬 Debug: เวลาแต่ละขั้น"):
+        trace_id = st.session_state.get("last_trace_id")
+        spans = get_trace(trace_id) if trace_id else []
+        if spans:
+            st.caption("เทิร์นล่าสุด")
+            depth = {}
+            for s in spans:
+                depth[s["span_id"]] = depth.get(s["parent_id"], -1) + 1
+                status = f" ❌ {s['error']}" if s["error"] else ""
+                st.text(f"{'  ' * depth[s['span_id']]}{s['name']}: {s['duration_ms']} ms{status}")
+
+        stats = stage_stats()
+        if stats:
+            st.caption("ทุกเทิร์น (ms)")
+            st.dataframe(
+                [{"stage": name, "count": v["count"], "p50": v["p50_ms"], "p95": v["p95_ms"], "p99": v["p99_ms"],
+                  "errors": v["errors"]} for name, v in stats.items()],
+                hide_index=True
+            )
+
+def prepare_turn(prompt: str, messages, history_manager: HistoryManager, llm_client: LLMClient,
+                 rag_budget_ms: int = RAG_LATENCY_BUDGET_MS, search_api: str = "serper") -> dict:
+    """
+    ส่วนของเทิร์นที่ไม่ยุ่งกับ UI (ใช้ทั้งในแอปและใน bench/): tools / fast path / แคชคำตอบ
+    แล้วเตรียม messages ให้ LLM ถ้ายังต้องเรียก
+    messages คือประวัติแชตที่ต่อท้ายด้วยคำถามล่าสุดแล้ว
+    คืน dict: response, search_used, tool_report, cached, use_cache, llm_messages (None = ไม่ต้องเรียก LLM)
+    """
+    # Steam / web search / RAG ยิงพร้อมกัน รอไม่เกิน deadline ของแต่ละตัว
+    enhanced_prompt, search_used, tool_report = handle_tool_calls(
+        prompt, llm_client, rag_budget_ms=rag_budget_ms, search_api=search_api
+    )
+    turn = {"response": enhanced_prompt, "search_used": search_used, "tool_report": tool_report,
+            "cached": None, "use_cache": False, "llm_messages": None}
+
+    # คำถามที่เคยตอบแล้ว (แม้ใช้คำต่างกัน) ตอบจากแคชได้เลย ไม่ต้องเรียก LLM
+    # แคชแยกตามเกมที่ถาม "elden ring คุ้มไหม" จะไม่ได้คำตอบของ "dark souls คุ้มไหม"
+    semantic_cache = get_semantic_cache()
+    turn["use_cache"] = not search_used and semantic_cache_allowed(tool_report["intent"], len(messages) > 1)
+    if not search_used and not turn["use_cache"]:
+        semantic_cache.bypass()
+    if turn["use_cache"]:
+        try:
+            turn["cached"] = semantic_cache.lookup(prompt, llm_client.model, SYSTEM_PROMPT,
+                                                   tool_report["intent"].game_name)
+        except Exception as e:
+            print(f"Semantic cache error: {e}")
+
+    if turn["cached"] is not None:
+        turn["response"] = turn["cached"]["answer"]
+    elif not search_used:
+        history = history_manager.build(messages[:-1], llm_client.model, llm_client)
+
+        # ข้อมูลอ้างอิงจากเอกสาร RAG (ถ้าหาได้ทันใน budget)
+        rag_messages = []
+        rag_context = tool_report.get("rag_context")
+        if rag_context:
+            rag_messages = [{
+                "role": "system",
+                "content": "Use this reference information if it is relevant:\n\n" + rag_context
+            }]
+
+        turn["llm_messages"] = (
+            [{"role": "system", "content": SYSTEM_PROMPT}]
+            + rag_messages
+            + history
+            + [{"role": "user", "content": enhanced_prompt}]
+        )
+    return turn
+
+def finish_turn(turn: dict, prompt: str, llm_client: LLMClient, turn_start: float,
+                response: str, timings: Optional[dict] = None, complete: bool = True) -> dict:
+    """
+    ปิดเทิร์น (ไม่ยุ่งกับ UI): เก็บคำตอบลงแคช จับเวลาแยกตามทางที่ตอบ แล้วคืน assistant message
+    response / timings / complete มาจาก LLM (หรือคำตอบใน turn ถ้าไม่ได้เรียก LLM)
+    """
+    tool_report = turn["tool_report"]
+    assistant_message = {"role": "assistant", "search_used": turn["search_used"]}
+    if tool_report["timings_ms"] or tool_report["late"]:
+        assistant_message["tools"] = {"timings_ms": tool_report["timings_ms"], "late": tool_report["late"]}
+
+    if turn["search_used"]:
+        answer_path = "fast_path" if tool_report.get("fast_path") else "tool"
+        if tool_report.get("fast_path"):
+            assistant_message["fast_path"] = tool_report["fast_path"]
+    elif turn["cached"] is not None:
+        assistant_message["cached"] = True
+        answer_path = "cache"
+    else:
+        assistant_message["timings"] = timings or {}
+        answer_path = "llm"
+        if not complete:
+            # คำตอบขาดกลางทาง: เก็บไว้ให้เห็นแต่ไม่ส่งกลับเข้า LLM เป็น history
+            assistant_message["incomplete"] = True
+        elif turn["use_cache"] and response and (timings or {}).get("model", llm_client.model) == llm_client.model:
+            try:
+                get_semantic_cache().store(prompt, response, llm_client.model, SYSTEM_PROMPT,
+                                           tool_report["intent"].game_name)
+            except Exception as e:
+                print(f"Semantic cache error: {e}")
+
+    # เวลาทั้งเทิร์นแยกตามทางที่ตอบ (เทียบ fast path กับ LLM ในหน้า Stats)
+    record_answer(answer_path, (time.perf_counter() - turn_start) * 1000,
+                  error=assistant_message.get("incomplete", False) or not response)
+    if response:
+        assistant_message["content"] = response
+    return assistant_message
+
+def chat_turn(prompt: str):
+    """หนึ่งเทิร์นของแชต: gatekeeper -> tools / fast path / cache / LLM -> บันทึกคำตอบ"""
+    #ข้อข่าวล่าสุด
+    with st.chat_message("user"):
+        st.markdown(prompt)
+
+    #ถ้ามันไม่ใช่เรื่องเกม ให้จบ
+    if not is_game_query(prompt):
+        refusal = random_refusal()
+        for message in ({"role": "user", "content": prompt},
+                        {"role": "assistant", "content": refusal, "search_used": False}):
+            st.session_state.messages.append(message)
+            save_message(message)
+
+        with st.chat_message("assistant"):
+            st.markdown(refusal)
+        return
+
+    # เพิ่มลง history หลังผ่าน gatekeeper
+    user_message = {"role": "user", "content": prompt}
+    st.session_state.messages.append(user_message)
+    save_message(user_message)
+
+    with st.chat_message("assistant"):
+        turn_start = time.perf_counter()
+        with st.spinner("Thinking..."):
+            llm_client = get_llm_client(st.session_state.llm_model)
+            turn = prepare_turn(
+                prompt, st.session_state.messages, st.session_state.history_manager, llm_client,
+                rag_budget_ms=st.session_state.get("rag_budget_ms", RAG_LATENCY_BUDGET_MS),
+                search_api=st.session_state.get("search_api", "serper")
+            )
+
+        response, timings, complete = turn["response"], None, True
+        if turn["llm_messages"] is None:
+            st.markdown(response)
+            if turn["cached"] is not None:
+                cached = turn["cached"]
+                st.caption(f"⚡ ตอบจากแคช (คล้ายคำถาม: {cached['question']} · similarity {cached['similarity']})")
+        else:
+            # สตรีมคำตอบทีละ token แทนการรอทั้งก้อน
+            response, timings, complete = stream_llm_response(llm_client, turn["llm_messages"])
+
+        assistant_message = finish_turn(turn, prompt, llm_client, turn_start, response, timings, complete)
+        late_tools = turn["tool_report"]["late"]
+        if late_tools:
+            st.caption(f"⏱️ ตอบไม่ทันเวลา (ไม่ได้ใช้ผล): {', '.join(late_tools)}")
+
+        if response:
+            st.session_state.messages.append(assistant_message)
+            save_message(assistant_message)
 
 def main():
     st.set_page_config(
@@ -195,6 +644,7 @@ def main():
     unsafe_allow_html=True
     )
 
+    warm_up_resources()
     init_session_state()
 
     # Sidebar
@@ -206,20 +656,50 @@ def main():
         st.subheader("🔍 Search Settings")
         st.session_state.search_api = st.selectbox("Search API", ["serper", "tavily"], index=0)
 
+        st.subheader("📚 RAG Settings")
+        st.session_state.rag_budget_ms = st.number_input(
+            "RAG latency budget (ms)", min_value=0, max_value=5000,
+            value=RAG_LATENCY_BUDGET_MS, step=50,
+            help="0 = ไม่ใช้ RAG"
+        )
+
+        with st.expander("📈 Stats"):
+            stats = answer_path_stats()
+            st.caption(f"Fast path: ตอบ {stats['coverage']:.0%} ของคำถาม ({stats['fallbacks']} ครั้งต้องไปทางปกติ)")
+            for name, path_stats in stats["paths"].items():
+                st.caption(f"Answer via {name}: p50 {path_stats['p50_ms']} ms · p95 {path_stats['p95_ms']} ms "
+                           f"({path_stats['count']} answers)")
+            for name, stats in SteamAPI.cache_stats().items():
+                st.caption(f"Steam {name}: hit rate {stats['hit_rate']:.0%} "
+                           f"({stats['hits']} hits / {stats['misses']} misses, {stats['stale_hits']} stale)")
+            stats = get_semantic_cache().stats()
+            st.caption(f"Answer cache: hit rate {stats['hit_rate']:.0%} "
+                       f"({stats['hits']} hits / {stats['misses']} misses, {stats['bypassed']} bypassed)")
+            stats = WebSearchTool.cache_stats()
+            st.caption(f"Web search cache: hit rate {stats['hit_rate']:.0%} "
+                       f"({stats['hits']} hits / {stats['misses']} misses, {stats['stale_hits']} stale)")
+            for name, stats in WebSearchTool.provider_stats().items():
+                st.caption(f"{name}: p50 {stats['p50_ms']} ms · p95 {stats['p95_ms']} ms "
+                           f"({stats['count']} calls, {stats['errors']} errors)")
+
         st.divider()
         if st.button("🧠 Initialize Model"):
             with st.spinner("Initializing..."):
-                st.session_state.llm_client = LLMClient(model=selected_model)
+                st.session_state.llm_model = selected_model
+                get_llm_client(selected_model)
             st.success("✅ Model initialized!")
 
         if st.button("🗑️ Clear Chat"):
+            # เริ่มแชตใหม่ด้วย session id ใหม่ (แชตเก่ายังเปิดได้จากลิงก์ ?sid= เดิม)
+            start_new_session()
             st.session_state.messages = []
-            save_memory([])
+            st.session_state.history_manager.reset()
             st.rerun()
 
         if st.button("🧹 Clear Memory"):
             clear_memory()
             st.session_state.messages = []
+            st.session_state.history_manager.reset()
             st.rerun()
 
     # Display history
@@ -228,60 +708,13 @@ def main():
     prompt = st.chat_input("Ask about any game or topic... 🎮")
 
     if prompt:
-        #ข้อข่าวล่าสุด
-        with st.chat_message("user"):
-            st.markdown(prompt)
+        # ทั้งเทิร์นอยู่ใน span เดียว ขั้นย่อย (Steam, search, RAG, LLM) เป็น span ลูก
+        with span("chat.turn", model=st.session_state.llm_model) as turn:
+            chat_turn(prompt)
+        st.session_state.last_trace_id = turn.trace_id
 
-        #ถ้ามันไม่ใช่เรื่องเกม ให้จบ
-        if not is_game_query(prompt):
-            refusal = random_refusal()
-            st.session_state.messages.append({"role": "user", "content": prompt})
-            st.session_state.messages.append({"role": "assistant", "content": refusal, "search_used": False})
-            save_memory(st.session_state.messages)
-
-            with st.chat_message("assistant"):
-                st.markdown(refusal)
-            st.stop()
-
-        # เพิ่มลง history หลังผ่าน gatekeeper
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        save_memory(st.session_state.messages)
-
-        with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                enhanced_prompt, search_used = handle_tool_calls(prompt, st.session_state.llm_client)
-                response = enhanced_prompt
-
-                # promptบอก Ai
-                SYSTEM_PROMPT = """
-You are a professional Game Assistant 🎮.
-You must ONLY answer questions related to *video games*.
-Topics you can talk about include:
-- Game details (story, gameplay, mechanics, reviews, genres)
-- Platforms (PC, PlayStation, Xbox, Nintendo, Mobile)
-- Game recommendations, comparisons, or similar titles
-- Game prices, updates, DLCs, mods, esports, or hardware for gaming
-- Game industry news, trends, or game development concepts
+    with st.sidebar:
+        display_trace_panel()
 
-If the user asks about anything unrelated to games:
-Politely refuse in Thai with a short friendly sentence.
-"""
-                if not search_used:
-                    history = [
-                        {"role": msg["role"], "content": msg["content"]}
-                        for msg in st.session_state.messages[:-1]
-                    ]
-                    messages = (
-                        [{"role": "system", "content": SYSTEM_PROMPT}]
-                        + history
-                        + [{"role": "user", "content": enhanced_prompt}]
-                    )
-                    response = st.session_state.llm_client.chat(messages)
-
-                st.markdown(response)
-                st.session_state.messages.append(
-                    {"role": "assistant", "content": response, "search_used": search_used}
-                )
-                save_memory(st.session_state.messages)
 if __name__ == "__main__":
     main()
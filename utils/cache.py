@@ -0,0 +1,319 @@
+"""
+Small caching helpers shared by the RAG system and the API tools.
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for use in cache keys (unicode form, case, whitespace)."""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory LRU cache where every entry also expires after a TTL.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600):
+        """
+        Args:
+            maxsize: Maximum number of entries (least recently used are evicted)
+            ttl: Default time-to-live in seconds (None = never expires)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+        """Store a value. ttl overrides the cache's default TTL for this entry."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Any):
+        """Remove an entry if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteCache:
+    """
+    Persistent key/value cache with per-entry expiry, stored in SQLite.
+    Safe to share between threads and between processes using the same file.
+    """
+
+    def __init__(self, db_path: str, namespace: str = "default", ttl: Optional[float] = 86400):
+        """
+        Args:
+            db_path: Path to the SQLite file (created if missing)
+            namespace: Keeps different caches apart inside one file
+            ttl: Default time-to-live in seconds (None = never expires)
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = namespace
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(str(self.db_path), timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired."""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Cache read error: {e}")
+            row = None
+
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a value. ttl overrides the cache's default TTL for this entry."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, pickle.dumps(value), expires_at)
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Cache write error: {e}")
+
+    def delete(self, key: str):
+        """Remove an entry if present."""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """Delete expired entries. Returns the number removed."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (self.namespace, time.time())
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self),
+        }
+
+
+class TieredCache:
+    """
+    Two-level cache: an in-process LRU (TTLCache) in front of a shared
+    SQLite store, with stale-while-revalidate.
+
+    An entry is fresh for ``ttl`` seconds. For ``stale_ttl`` seconds after
+    that it is still served, but a background refresh is started so the next
+    caller gets a fresh value without waiting for the network.
+    """
+
+    _refresh_pool: Optional[ThreadPoolExecutor] = None
+    _refresh_pool_lock = threading.Lock()
+
+    def __init__(self, db_path: Optional[str], namespace: str, maxsize: int = 2048):
+        """
+        Args:
+            db_path: SQLite file for the shared level (None = in-process only)
+            namespace: Keeps different caches apart inside one file
+            maxsize: Entries kept in the in-process level
+        """
+        self.namespace = namespace
+        self.memory = TTLCache(maxsize=maxsize, ttl=None)
+        self.disk = SQLiteCache(db_path, namespace=namespace, ttl=None) if db_path else None
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], Any], ttl: float, stale_ttl: float = 0) -> Any:
+        """
+        Return the cached value for key, calling fetch() on a miss.
+
+        Args:
+            key: Cache key
+            fetch: Loads the value; None results are not cached (treated as errors)
+            ttl: Seconds a value stays fresh
+            stale_ttl: Extra seconds a stale value may be served while it is refreshed
+        """
+        now = time.time()
+        entry = self.memory.get(key)
+        level = "memory"
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            level = "disk"
+            if entry is not None:
+                self.memory.set(key, entry, ttl=max(entry[1] - now, 0))
+
+        if entry is not None:
+            value, expires_at, fresh_until = entry
+            if expires_at > now:
+                if fresh_until <= now:
+                    self.stale_hits += 1
+                    self._refresh_in_background(key, fetch, ttl, stale_ttl)
+                elif level == "memory":
+                    self.memory_hits += 1
+                else:
+                    self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        value = fetch()
+        if value is not None:
+            self.set(key, value, ttl, stale_ttl)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float, stale_ttl: float = 0):
+        """Store a value in both levels."""
+        now = time.time()
+        entry = (value, now + ttl + stale_ttl, now + ttl)
+        self.memory.set(key, entry, ttl=ttl + stale_ttl)
+        if self.disk is not None:
+            self.disk.set(key, entry, ttl=ttl + stale_ttl)
+
+    def delete(self, key: str):
+        """Remove an entry from both levels."""
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring (stale hits count as hits)."""
+        hits = self.memory_hits + self.disk_hits + self.stale_hits
+        total = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "memory_size": len(self.memory),
+        }
+
+    def _refresh_in_background(self, key: str, fetch: Callable[[], Any], ttl: float, stale_ttl: float):
+        """Re-fetch a stale entry once, off the caller's thread."""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value = fetch()
+                if value is not None:
+                    self.set(key, value, ttl, stale_ttl)
+                    self.refreshes += 1
+                else:
+                    self.refresh_errors += 1
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"Cache refresh error ({self.namespace}): {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._get_refresh_pool().submit(refresh)
+
+    @classmethod
+    def _get_refresh_pool(cls) -> ThreadPoolExecutor:
+        with cls._refresh_pool_lock:
+            if cls._refresh_pool is None:
+                cls._refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+            return cls._refresh_pool
@@ -0,0 +1,223 @@
+"""
+Token-budgeted conversation history for the LLM.
+
+Only the newest turns that fit the model's history budget are sent as they
+are; older turns are rolled into a running summary, so the prompt stays
+about the same size however long the chat gets.
+"""
+
+import hashlib
+import os
+from typing import Dict, List, Any, Optional
+
+import litellm
+
+from .cache import TTLCache
+from .llm_client import LLMError
+
+# Token budget for the history part of the prompt (summary + recent turns).
+# Matched by prefix, longest first; HISTORY_TOKEN_BUDGET overrides all of them.
+HISTORY_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 2000,
+    "gpt-4-turbo": 6000,
+    "gpt-4": 3000,
+    "claude-3": 6000,
+    "gemini": 6000,
+    "groq/": 3000,
+}
+DEFAULT_HISTORY_TOKEN_BUDGET = 3000
+
+# Counting is done with one tiktoken encoding for every model. It is close
+# enough for budgeting and never downloads a tokenizer on the request path.
+TOKENIZER_MODEL = "gpt-3.5-turbo"
+
+# Tokens added per message for role and formatting
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a user and a video game assistant. "
+    "Keep the games, prices, platforms, preferences and open questions that were mentioned. "
+    "Write at most {max_words} words, in the language the user used.\n\n"
+    "Previous summary:\n{summary}\n\nNew messages:\n{messages}"
+)
+
+_token_counts = TTLCache(maxsize=20_000, ttl=None)
+
+
+def count_tokens(text: str) -> int:
+    """Token count of a text, cached by content."""
+    key = hashlib.sha1(text.encode("utf-8")).digest()
+    tokens = _token_counts.get(key)
+    if tokens is None:
+        try:
+            tokens = litellm.token_counter(model=TOKENIZER_MODEL, text=text)
+        except Exception:
+            tokens = len(text) // 3 + 1
+        _token_counts.set(key, tokens)
+    return tokens
+
+
+def get_history_budget(model: str) -> int:
+    """History token budget for a model."""
+    override = os.getenv("HISTORY_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    for prefix in sorted(HISTORY_TOKEN_BUDGETS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return HISTORY_TOKEN_BUDGETS[prefix]
+    return DEFAULT_HISTORY_TOKEN_BUDGET
+
+
+class HistoryManager:
+    """
+    Builds the history messages for one chat session.
+
+    The summary only moves forward: once a message is rolled into it, it is
+    never summarized again. When the history overflows, it is cut back to
+    ``keep_ratio`` of the budget, so a summary call is needed only every few
+    turns instead of on every turn.
+    """
+
+    def __init__(self, budget: Optional[int] = None, keep_ratio: float = 0.6,
+                 max_message_share: float = 0.25, summary_share: float = 0.2):
+        """
+        Args:
+            budget: History token budget (None = per model, see get_history_budget)
+            keep_ratio: Fraction of the budget kept as recent turns after a roll-up
+            max_message_share: A single message may use at most this fraction of the budget
+                (long Steam cards and search dumps are clipped)
+            summary_share: Fraction of the budget reserved for the summary
+        """
+        self.budget = budget
+        self.keep_ratio = keep_ratio
+        self.max_message_share = max_message_share
+        self.summary_share = summary_share
+        self.summary = ""
+        self.summarized_count = 0  # messages[:summarized_count] are covered by the summary
+        self.summary_calls = 0
+
+    def reset(self):
+        """Forget the summary (e.g. when the chat is cleared)."""
+        self.summary = ""
+        self.summarized_count = 0
+
+    def build(self, messages: List[Dict[str, Any]], model: str, llm_client=None) -> List[Dict[str, str]]:
+        """
+        History to send to the LLM for the next turn.
+
+        Args:
+            messages: The full chat so far (st.session_state.messages, without the new prompt)
+            model: Model name, used to pick the budget
+            llm_client: LLMClient used to write the summary (None = extractive summary)
+
+        Returns:
+            Messages in LiteLLM format: an optional summary system message, then recent turns
+        """
+        if len(messages) < self.summarized_count:
+            self.reset()
+
+        budget = self.budget or get_history_budget(model)
+        summary_budget = int(budget * self.summary_share)
+        turns_budget = budget - summary_budget
+        max_message_tokens = max(64, int(budget * self.max_message_share))
+
+        pending = messages[self.summarized_count:]
+        sizes = [self._message_tokens(m, max_message_tokens) for m in pending]
+
+        if sum(sizes) > turns_budget:
+            # Keep the newest messages that fit keep_ratio of the budget, summarize the rest
+            keep_budget = int(turns_budget * self.keep_ratio)
+            kept_tokens = 0
+            first_kept = len(pending)
+            while first_kept > 0 and kept_tokens + sizes[first_kept - 1] <= keep_budget:
+                first_kept -= 1
+                kept_tokens += sizes[first_kept]
+            # Don't start the recent part with an assistant reply whose question is in the summary:
+            # take the question too if it still fits the budget, else drop the reply as well
+            if 0 < first_kept < len(pending) and pending[first_kept]["role"] == "assistant":
+                if kept_tokens + sizes[first_kept - 1] <= turns_budget:
+                    first_kept -= 1
+                else:
+                    first_kept += 1
+
+            self._roll_up(pending[:first_kept], summary_budget, max_message_tokens, llm_client)
+            self.summarized_count += first_kept
+            pending = pending[first_kept:]
+
+        history = []
+        if self.summary:
+            history.append({
+                "role": "system",
+                "content": "Summary of the earlier conversation:\n" + self.summary
+            })
+        for message in pending:
+            if message.get("incomplete", False):
+                continue
+            history.append({
+                "role": message["role"],
+                "content": self._clip(message["content"], max_message_tokens)
+            })
+        return history
+
+    def stats(self) -> Dict[str, Any]:
+        """Summary state for monitoring."""
+        return {
+            "summarized_messages": self.summarized_count,
+            "summary_tokens": count_tokens(self.summary) if self.summary else 0,
+            "summary_calls": self.summary_calls,
+            "token_cache": _token_counts.stats(),
+        }
+
+    def _roll_up(self, messages: List[Dict[str, Any]], summary_budget: int,
+                 max_message_tokens: int, llm_client):
+        """Fold messages into the running summary."""
+        messages = [m for m in messages if not m.get("incomplete", False)]
+        if not messages:
+            return
+
+        transcript = "\n".join(
+            f"{m['role']}: {self._clip(m['content'], max_message_tokens)}" for m in messages
+        )
+        if llm_client is not None:
+            prompt = SUMMARY_PROMPT.format(
+                max_words=max(50, summary_budget // 2),
+                summary=self.summary or "(none)",
+                messages=transcript
+            )
+            self.summary_calls += 1
+            try:
+                summary = llm_client.chat([{"role": "user", "content": prompt}], raise_errors=True,
+                                          temperature=0, max_tokens=summary_budget)
+            except LLMError as e:
+                print(f"History summary error: {e.kind}: {e}")
+                summary = None
+            if summary:
+                self.summary = self._clip(summary.strip(), summary_budget)
+                return
+
+        # No LLM (or it failed): keep the start of each message, newest last
+        self.summary = self._clip_start(
+            "\n".join(part for part in (self.summary, transcript) if part), summary_budget
+        )
+
+    @staticmethod
+    def _message_tokens(message: Dict[str, Any], max_message_tokens: int) -> int:
+        if message.get("incomplete", False):
+            return 0
+        return min(count_tokens(message["content"]), max_message_tokens) + MESSAGE_OVERHEAD_TOKENS
+
+    @staticmethod
+    def _clip(text: str, max_tokens: int) -> str:
+        """Cut a text to roughly max_tokens, keeping the start."""
+        tokens = count_tokens(text)
+        if tokens <= max_tokens:
+            return text
+        return text[:max(1, len(text) * max_tokens // tokens)].rstrip() + " …"
+
+    @staticmethod
+    def _clip_start(text: str, max_tokens: int) -> str:
+        """Cut a text to roughly max_tokens, keeping the end."""
+        tokens = count_tokens(text)
+        if tokens <= max_tokens:
+            return text
+        return "… " + text[-max(1, len(text) * max_tokens // tokens):].lstrip()
@@ -0,0 +1,150 @@
+"""
+Append-only chat history storage (SQLite, WAL mode).
+
+Every message is one INSERT, so saving a turn costs the same however long
+the chat is. Each session has its own ID, so sessions running in the same
+process never overwrite each other, and history is read back a page at a time.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+# Keys stored in their own columns; everything else goes into the "extra" JSON
+BASE_KEYS = ("role", "content")
+
+
+def new_session_id() -> str:
+    """Random ID for a new chat session."""
+    return uuid.uuid4().hex
+
+
+class ChatStore:
+    """
+    Stores chat messages of all sessions in a single SQLite file.
+
+    With WAL and synchronous=NORMAL a commit only appends to the WAL file;
+    it is fsynced in batches at checkpoints instead of on every message.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open (or create) a chat store.
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=5, check_same_thread=False)
+
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                extra TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id)")
+        self._conn.commit()
+
+    def append(self, session_id: str, message: Dict[str, Any]) -> int:
+        """
+        Append one message to a session.
+
+        Returns:
+            The message's row ID (also written to message["id"])
+        """
+        extra = {k: v for k, v in message.items() if k not in BASE_KEYS and k != "id"}
+        try:
+            with self._lock:
+                cursor = self._conn.execute(
+                    "INSERT INTO messages (session_id, role, content, extra, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (session_id, message["role"], message["content"],
+                     json.dumps(extra, ensure_ascii=False) if extra else None, time.time())
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error saving chat message: {e}")
+            return -1
+
+        message["id"] = cursor.lastrowid
+        return cursor.lastrowid
+
+    def load(self, session_id: str, limit: int = 50,
+             before_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Read the newest messages of a session, one page at a time.
+
+        Args:
+            session_id: Session to read
+            limit: Page size
+            before_id: Only messages older than this ID (for the next page back)
+
+        Returns:
+            (messages oldest first, whether older messages exist)
+        """
+        query = "SELECT id, role, content, extra FROM messages WHERE session_id = ?"
+        params: list = [session_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        try:
+            with self._lock:
+                rows = self._conn.execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error loading chat history: {e}")
+            return [], False
+
+        has_more = len(rows) > limit
+        messages = []
+        for row_id, role, content, extra in reversed(rows[:limit]):
+            message = {"id": row_id, "role": role, "content": content}
+            if extra:
+                message.update(json.loads(extra))
+            messages.append(message)
+        return messages, has_more
+
+    def count(self, session_id: str) -> int:
+        """Number of messages in a session."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def clear(self, session_id: str):
+        """Delete all messages of a session."""
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def delete_older_than(self, days: float) -> int:
+        """Delete messages of all sessions older than the given age. Returns the number removed."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM messages WHERE created_at < ?", (time.time() - days * 86400,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        """Checkpoint the WAL and close the database connection."""
+        with self._lock:
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error:
+                pass
+            self._conn.close()
@@ -0,0 +1,180 @@
+"""
+Append-only chunk storage for the RAG system (SQLite).
+Chunk texts, metadata and embeddings are read by ID only when needed,
+so startup time and memory don't grow with the size of the corpus.
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+
+import numpy as np
+
+
+class ChunkStore:
+    """
+    Stores RAG chunks in a single SQLite file.
+
+    Every chunk gets an integer ID which is also used as its vector ID in
+    FAISS, so search results map straight back to rows here.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open (or create) a chunk store.
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+
+        # WAL lets readers keep working while chunks are appended
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                embedding BLOB
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks(doc_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    def add_chunks(self, texts: List[str], metadata: List[Dict[str, Any]],
+                   embeddings: np.ndarray) -> np.ndarray:
+        """
+        Append chunks with their embeddings.
+
+        Returns:
+            Array of the new chunk IDs (int64), in the same order as the input
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM chunks").fetchone()
+            first_id = (row[0] if row[0] is not None else -1) + 1
+            ids = np.arange(first_id, first_id + len(texts), dtype='int64')
+
+            self._conn.executemany(
+                "INSERT INTO chunks (id, doc_id, text, metadata, embedding) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (int(chunk_id), meta.get("doc_id", ""), text,
+                     json.dumps(meta, ensure_ascii=False), embedding.tobytes())
+                    for chunk_id, text, meta, embedding in zip(ids, texts, metadata, embeddings)
+                ]
+            )
+            self._conn.commit()
+        return ids
+
+    def get_chunks(self, ids: List[int]) -> Dict[int, Tuple[str, Dict[str, Any]]]:
+        """Read chunk texts and metadata by ID. Missing IDs are left out."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        return {row[0]: (row[1], json.loads(row[2])) for row in rows}
+
+    def get_ids(self, doc_id: str) -> np.ndarray:
+        """IDs of all chunks that belong to a document."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM chunks WHERE doc_id = ?", (doc_id,)).fetchall()
+        return np.array([row[0] for row in rows], dtype='int64')
+
+    def delete_document(self, doc_id: str) -> np.ndarray:
+        """Delete all chunks of a document. Returns the deleted chunk IDs."""
+        ids = self.get_ids(doc_id)
+        if len(ids):
+            with self._lock:
+                self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+                self._conn.commit()
+        return ids
+
+    def iter_embeddings(self, min_id: int = 0, batch_size: int = 10_000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yield (ids, embeddings) batches for chunks with id >= min_id, in ID order."""
+        last_id = min_id - 1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, embedding FROM chunks WHERE id > ? AND embedding IS NOT NULL "
+                    "ORDER BY id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+
+            ids = np.array([row[0] for row in rows], dtype='int64')
+            embeddings = np.frombuffer(b"".join(row[1] for row in rows), dtype='float32')
+            yield ids, embeddings.reshape(len(rows), -1)
+            last_id = int(ids[-1])
+
+    def load_embeddings(self, min_id: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """All (ids, embeddings) with id >= min_id as two arrays."""
+        batches = list(self.iter_embeddings(min_id))
+        if not batches:
+            return np.empty(0, dtype='int64'), np.empty((0, 0), dtype='float32')
+        return (np.concatenate([ids for ids, _ in batches]),
+                np.concatenate([emb for _, emb in batches]))
+
+    def max_id(self) -> int:
+        """Highest chunk ID in the store (-1 if empty)."""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM chunks").fetchone()
+        return row[0] if row[0] is not None else -1
+
+    def count(self) -> int:
+        """Number of chunks."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def count_documents(self) -> int:
+        """Number of distinct documents."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT doc_id) FROM chunks").fetchone()[0]
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        """One entry per document with its chunk count and first chunk's metadata."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id, COUNT(*), (SELECT metadata FROM chunks c2 WHERE c2.doc_id = c.doc_id "
+                "ORDER BY id LIMIT 1) FROM chunks c GROUP BY doc_id ORDER BY MIN(id)"
+            ).fetchall()
+
+        documents = []
+        for doc_id, chunks, metadata in rows:
+            meta = json.loads(metadata)
+            # Remove chunk-specific metadata for display
+            meta.pop('chunk_id', None)
+            meta.pop('chunk_index', None)
+            documents.append({'doc_id': doc_id, 'chunks': chunks, 'metadata': meta})
+        return documents
+
+    def get_info(self, key: str, default: Any = None) -> Any:
+        """Read a value from the store's key/value info table."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_info(self, **values: Any):
+        """Write values to the store's key/value info table."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in values.items()]
+            )
+            self._conn.commit()
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
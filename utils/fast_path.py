@@ -0,0 +1,229 @@
+"""
+Deterministic answers for simple factual questions about one game.
+
+"how much is cyberpunk now?", "elden ring ออกวันไหน", "hollow knight แนวอะไร",
+"where can I download palworld" are answered from the (cached) Steam
+appdetails with fixed templates, without calling the LLM, which could not
+know live prices anyway. Anything more open-ended (reviews, comparisons,
+recommendations, news) is left to the normal path.
+"""
+
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from .intent_router import KeywordAutomaton
+from .metrics import get_histogram, histogram_snapshots
+
+# Fields the fast path can answer, in the order they are shown
+FAST_PATH_FIELDS = {
+    "price": [
+        "price", "prices", "how much", "cost", "costs", "on sale", "discount", "cheap",
+        "ราคา", "เท่าไหร่", "เท่าไร", "กี่บาท", "ลดราคา", "ลดกี่",
+    ],
+    "release_date": [
+        "release date", "released", "release", "come out", "came out", "comes out",
+        "launch", "launched", "when does", "when did", "when is",
+        "วันวางจำหน่าย", "วางจำหน่าย", "วันวางขาย", "ออกวันไหน", "ออกเมื่อไหร่", "ออกเมื่อไร", "ออกปีไหน", "วันออก",
+    ],
+    "genre": [
+        "genre", "genres", "what kind of game", "what type of game", "kind of game", "type of game",
+        "แนวอะไร", "แนวไหน", "เกมแนว", "ประเภทอะไร", "ประเภทไหน",
+    ],
+    "download": [
+        "download", "where to buy", "where can i buy", "where can i get", "where to get",
+        "run on mac", "run on linux", "run on windows",
+        "ดาวน์โหลด", "โหลดได้ที่ไหน", "โหลดที่ไหน", "ซื้อที่ไหน", "ซื้อได้ที่ไหน",
+    ],
+}
+
+# Words that ask for more than a fact from the store page
+FAST_PATH_BLOCKERS = [
+    "review", "worth", "good", "fun", "better", "best", "vs", "versus", "compare", "recommend",
+    "similar", "like", "why", "how to", "tips", "guide", "news", "update", "patch", "mod", "story",
+    "รีวิว", "คุ้ม", "ดีไหม", "สนุกไหม", "เปรียบเทียบ", "แนะนำ", "คล้าย", "ทำไม", "วิธี", "ข่าว", "อัปเดต", "เนื้อเรื่อง",
+    # Other products than the base game: its appdetails would give the wrong price/date
+    "dlc", "expansion", "season pass", "edition", "bundle", "soundtrack", "ภาคเสริม", "ภาคต่อ",
+    # Other platforms: Steam only knows Windows, Mac and Linux
+    "platform", "platforms", "console", "playstation", "ps4", "ps5", "xbox", "switch", "nintendo",
+    "mobile", "android", "ios", "iphone", "เล่นบน", "มือถือ",
+]
+
+_automaton = KeywordAutomaton({**FAST_PATH_FIELDS, "blocker": FAST_PATH_BLOCKERS})
+
+# Latency histograms per answer path, for comparing the fast path with the LLM
+ANSWER_PATHS = ("fast_path", "tool", "cache", "llm")
+
+
+def match_fast_path(text: str) -> List[str]:
+    """
+    Fields a message asks for, or [] when the fast path should not answer it.
+
+    The game itself is resolved separately (Steam catalog); this only looks
+    at what is being asked.
+    """
+    lowered = unicodedata.normalize("NFKC", text).lower()
+    fields = set()
+    for _, _, index in _automaton.find(lowered):
+        classes = _automaton.classes[index]
+        if "blocker" in classes:
+            return []
+        fields.update(classes)
+    return [field for field in FAST_PATH_FIELDS if field in fields]
+
+
+def _price(game: Dict[str, Any]) -> Optional[str]:
+    if game.get("is_free"):
+        return "💰 ราคา: Free (เล่นฟรี)"
+    overview = game.get("price_overview")
+    if not overview:
+        if game.get("release_date", {}).get("coming_soon"):
+            return "💰 ราคา: ยังไม่เปิดขาย (ยังไม่มีราคาบน Steam)"
+        return None
+    line = f"💰 ราคา: {overview.get('final_formatted', 'N/A')}"
+    if overview.get("discount_percent"):
+        line += f" (ลด {overview['discount_percent']}% จาก {overview.get('initial_formatted', '?')})"
+    return line
+
+
+def _release_date(game: Dict[str, Any]) -> Optional[str]:
+    release = game.get("release_date") or {}
+    if not release.get("date"):
+        return None
+    if release.get("coming_soon"):
+        return f"🗓️ วันที่วางจำหน่าย: {release['date']} (ยังไม่วางจำหน่าย)"
+    return f"🗓️ วันที่วางจำหน่าย: {release['date']}"
+
+
+def _genre(game: Dict[str, Any]) -> Optional[str]:
+    genres = [g["description"] for g in game.get("genres", []) if g.get("description")]
+    return f"🏷️ แนวเกม: {', '.join(genres)}" if genres else None
+
+
+def _download(game: Dict[str, Any]) -> Optional[str]:
+    platforms = [name.capitalize() for name, available in (game.get("platforms") or {}).items() if available]
+    line = "⬇️ ดาวน์โหลด/ซื้อได้ที่ Steam (ลิงก์ด้านล่าง)"
+    if platforms:
+        line += f" · เล่นได้บน: {', '.join(platforms)}"
+    return line
+
+
+_TEMPLATES = {"price": _price, "release_date": _release_date, "genre": _genre, "download": _download}
+
+
+def answer_fast_path(appid, data: dict, fields: List[str]) -> Optional[str]:
+    """
+    Answer from Steam appdetails, in the style of SteamAPI.format_steam_info.
+
+    Args:
+        appid: Steam app id
+        data: Raw appdetails response ({appid: {"success", "data"}})
+        fields: Fields from match_fast_path
+
+    Returns:
+        Markdown answer, or None when Steam has no data for one of the fields
+    """
+    entry = (data or {}).get(str(appid)) or {}
+    if not entry.get("success") or not fields:
+        return None
+
+    game = entry["data"]
+    lines = [f"🎮 **{game.get('name', 'Unknown Game')}**"]
+    for field in fields:
+        line = _TEMPLATES[field](game)
+        if line is None:
+            return None
+        lines.append(line)
+    lines.append(f"🔗 [ดูบน Steam](https://store.steampowered.com/app/{appid}/)")
+    return "  \n".join(lines)
+
+
+def record_answer(path: str, ms: float, error: bool = False):
+    """Record how long a chat turn took to answer, by path (see ANSWER_PATHS)."""
+    get_histogram(f"answer.{path}").observe(ms, error)
+
+
+def answer_path_stats() -> Dict[str, Any]:
+    """
+    Fast-path coverage (share of answered turns) and latency per answer path.
+
+    Returns:
+        {"coverage": float, "fallbacks": int, "paths": {path: histogram snapshot}}
+    """
+    paths = {name.split(".", 1)[1]: snap for name, snap in histogram_snapshots("answer.").items()}
+    total = sum(snap["count"] for snap in paths.values())
+    fast = paths.get("fast_path", {}).get("count", 0)
+    fallbacks = histogram_snapshots("fast_path.fallback").get("fast_path.fallback", {}).get("count", 0)
+    return {"coverage": round(fast / total, 3) if total else 0.0, "fallbacks": fallbacks, "paths": paths}
+
+
+def record_fallback(ms: float):
+    """A question matched the fast path but had to go the normal way (no data, Steam too slow)."""
+    get_histogram("fast_path.fallback").observe(ms)
+
+
+# Labelled examples: (message, expected fields)
+LABELLED_EXAMPLES = [
+    ("how much is cyberpunk now?", ["price"]),
+    ("elden ring price?", ["price"]),
+    ("ราคา elden ring เท่าไหร่", ["price"]),
+    ("palworld กี่บาท", ["price"]),
+    ("is hollow knight on sale", ["price"]),
+    ("when did elden ring come out", ["release_date"]),
+    ("starfield ออกวันไหน", ["release_date"]),
+    ("release date of hollow knight", ["release_date"]),
+    ("what genre is stardew valley", ["genre"]),
+    ("hollow knight แนวอะไร", ["genre"]),
+    ("what kind of game is terraria", ["genre"]),
+    ("where can i download palworld", ["download"]),
+    ("gta โหลดได้ที่ไหน", ["download"]),
+    ("does cyberpunk run on mac", ["download"]),
+    ("how much is elden ring and when did it come out", ["price", "release_date"]),
+    # Left to the LLM
+    ("is elden ring worth the price", []),
+    ("รีวิว cyberpunk หน่อย", []),
+    ("elden ring vs dark souls which is better", []),
+    ("cyberpunk 2.0 update news", []),
+    ("แนะนำเกมคล้าย hollow knight", []),
+    ("how to beat malenia", []),
+    ("tell me about minecraft", []),
+    ("elden ring dlc price", []),
+    ("how much is the elden ring dlc", []),
+    ("elden ring deluxe edition price", []),
+    ("ราคาภาคเสริม elden ring", []),
+    ("elden ring เล่นบน ps5 ได้ไหม", []),
+    ("which platforms is elden ring on", []),
+    ("can i download palworld on xbox", []),
+]
+
+
+if __name__ == "__main__":
+    import time
+
+    failures = 0
+    for text, expected in LABELLED_EXAMPLES:
+        fields = match_fast_path(text)
+        ok = fields == expected
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {text!r}: {fields}")
+    covered = sum(1 for _, expected in LABELLED_EXAMPLES if expected)
+    print(f"\n{len(LABELLED_EXAMPLES) - failures}/{len(LABELLED_EXAMPLES)} labelled examples matched, "
+          f"{covered}/{len(LABELLED_EXAMPLES)} answerable by the fast path\n")
+
+    # Latency of match + template with the appdetails already cached
+    sample = {"1245620": {"success": True, "data": {
+        "name": "ELDEN RING", "is_free": False,
+        "price_overview": {"final_formatted": "$35.99", "initial_formatted": "$59.99", "discount_percent": 40},
+        "release_date": {"coming_soon": False, "date": "24 Feb, 2022"},
+        "genres": [{"description": "Action"}, {"description": "RPG"}],
+        "platforms": {"windows": True, "mac": False, "linux": False},
+    }}}
+    rounds = 2000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text, expected in LABELLED_EXAMPLES:
+            fields = match_fast_path(text)
+            if fields:
+                answer_fast_path(1245620, sample, fields)
+    elapsed = time.perf_counter() - start
+    print(f"fast path: {elapsed / (rounds * len(LABELLED_EXAMPLES)) * 1e6:.1f} us/message "
+          f"(an LLM answer takes roughly 1-10 s; see answer_path_stats() in the app for live numbers)")
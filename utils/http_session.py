@@ -0,0 +1,127 @@
+"""
+Shared HTTP session for the API tools (Steam, Serper, Tavily).
+"""
+import random
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from typing import Iterable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# Status codes worth retrying: throttled or a temporary server error
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def get_session() -> requests.Session:
+    """
+    Process-wide requests session with connection pooling.
+
+    The underlying urllib3 pools are thread-safe. Cookies are disabled so the
+    session has no per-request state and can be shared by every Streamlit
+    session thread.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                session.headers.update({"User-Agent": "GameChatAssistant/1.0"})
+                _session = session
+    return _session
+
+
+def warm_up_connections(urls: Iterable[str], timeout: float = 3.0):
+    """
+    Open pooled connections (DNS + TLS handshake) to the given hosts in a
+    background thread, so the first real request doesn't pay for them.
+    """
+    def run():
+        session = get_session()
+        for url in urls:
+            try:
+                session.head(url, timeout=timeout)
+            except requests.RequestException:
+                pass
+
+    threading.Thread(target=run, name="http-warm-up", daemon=True).start()
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+
+    Allows bursts of up to ``capacity`` requests, refilled at ``rate``
+    requests per second.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wait for one token. Returns False if it would take longer than timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def drain(self):
+        """Use up all tokens, e.g. after the server answered 429."""
+        with self._lock:
+            self._tokens = 0
+            self._updated = time.monotonic()
+
+
+def request_with_retry(method: str, url: str, retries: int = 3, backoff: float = 0.5,
+                       max_backoff: float = 8.0, rate_limiter: Optional[TokenBucket] = None,
+                       **kwargs) -> requests.Response:
+    """
+    Send a request on the shared session, retrying on 429/5xx and connection
+    errors with exponential backoff and full jitter (Retry-After is honoured).
+
+    Raises:
+        requests.RequestException: When the last attempt still fails
+    """
+    session = get_session()
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            response = session.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUS or attempt == retries:
+                response.raise_for_status()
+                return response
+            if response.status_code == 429 and rate_limiter is not None:
+                rate_limiter.drain()
+            retry_after = response.headers.get("Retry-After")
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            retry_after = None
+
+        delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), max_backoff))
+        time.sleep(delay)
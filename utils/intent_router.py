@@ -0,0 +1,257 @@
+"""
+Keyword-based intent routing for the chat.
+
+All keyword classes are compiled into one Aho-Corasick automaton at import
+time, so a message is scanned once no matter how many keywords there are.
+Latin keywords only match whole words ("pc" does not match "spec", "lol"
+does not match "lollipop"); Thai keywords match anywhere, since Thai is
+written without spaces between words.
+"""
+
+import unicodedata
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+KEYWORD_CLASSES = {
+    # คำที่บอกว่าเป็นคำถามเรื่องเกม
+    "game_hint": [
+        "เกม", "game", "video game", "steam", "playstation", "ps4", "ps5",
+        "xbox", "switch", "nintendo", "pc", "mobile", "android", "ios",
+        "dlc", "mod", "patch", "fps", "rpg", "moba", "open world", "survival",
+        "multiplayer", "singleplayer", "esports", "rank", "รีวิว", "แนว", "สเปค", "ราคา",
+    ],
+    # ชื่อเกมยอดฮิต (ใช้เมื่อหาใน Steam catalog ไม่เจอ)
+    "game_name": [
+        "gta", "fortnite", "valorant", "call of duty", "cod", "pubg",
+        "elden ring", "cyberpunk", "palworld", "counter strike", "cs2",
+        "roblox", "minecraft", "overwatch", "apex", "dota", "league of legends",
+        "lol", "genshin", "starfield", "battlefield", "red dead", "hollow knight",
+    ],
+    # ถามราคา/ซื้อ/ดาวน์โหลด -> Steam
+    "steam": [
+        "ราคา", "price", "ลดราคา", "sale", "discount", "cost", "ซื้อ", "steam", "ข้อมูล", "เพิ่มเติม",
+        "สนใจ", "download", "โหลด", "โหลดได้ที่ไหน", "ดาวน์โหลด", "download link",
+    ],
+    # ถามว่าเกมคืออะไร -> ให้ LLM อธิบาย
+    "general": ["คืออะไร", "รู้จัก", "แนว", "เกี่ยวกับ", "review", "รีวิว", "สนุกไหม", "ดีไหม"],
+    # ข่าว/เทรนด์ -> web search
+    "search": [
+        "top games", "เกมมาแรง", "ยอดนิยม", "popular", "trending", "best selling",
+        "most played", "update", "news", "ออกใหม่", "เปิดตัว", "เกมใหม่",
+    ],
+    "top_seller": ["top games", "top sellers", "top seller", "best selling", "ขายดี", "ยอดนิยม", "เกมมาแรง"],
+    "price": ["ราคา", "price", "ลดราคา", "sale", "discount"],
+}
+
+# Routes, in the order handle_tool_calls checks them
+ROUTE_STEAM = "steam"
+ROUTE_GAME_INFO = "game_info"
+ROUTE_TOP_SELLERS = "top_sellers"
+ROUTE_SEARCH = "search"
+ROUTE_LLM = "llm"
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over lowercase keywords, each tagged with its classes."""
+
+    def __init__(self, keyword_classes: Dict[str, List[str]]):
+        self.keywords: List[str] = []
+        self.classes: List[Tuple[str, ...]] = []
+        tags: Dict[str, List[str]] = {}
+        for cls, keywords in keyword_classes.items():
+            for keyword in keywords:
+                keyword = unicodedata.normalize("NFKC", keyword).lower()
+                tags.setdefault(keyword, [])
+                if cls not in tags[keyword]:
+                    tags[keyword].append(cls)
+        for keyword, classes in tags.items():
+            self.keywords.append(keyword)
+            self.classes.append(tuple(classes))
+
+        # Trie: goto[state][char] -> state; out[state] = keyword indexes ending here
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[List[int]] = [[]]
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for ch in keyword:
+                if ch not in self._goto[state]:
+                    self._goto.append({})
+                    self._out.append([])
+                    self._goto[state][ch] = len(self._goto) - 1
+                state = self._goto[state][ch]
+            self._out[state].append(index)
+
+        # Failure links (BFS); outputs of the failure state are merged in
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text: str) -> List[Tuple[int, int, int]]:
+        """
+        All keyword matches in text (already lowercased).
+
+        Returns:
+            (start, end, keyword index) for every match that passes the word-boundary rule
+        """
+        matches = []
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for position, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in out[state]:
+                end = position + 1
+                start = end - len(self.keywords[index])
+                if self._at_word_boundary(text, start, end, self.keywords[index]):
+                    matches.append((start, end, index))
+        return matches
+
+    @staticmethod
+    def _at_word_boundary(text: str, start: int, end: int, keyword: str) -> bool:
+        """Latin keywords must be whole words (a plural "s" is allowed); Thai ones match anywhere."""
+        if _is_word_char(keyword[0]) and start > 0 and _is_word_char(text[start - 1]):
+            return False
+        if _is_word_char(keyword[-1]) and end < len(text) and _is_word_char(text[end]):
+            if text[end] != "s" or (end + 1 < len(text) and _is_word_char(text[end + 1])):
+                return False
+        return True
+
+
+class Intent:
+    """What a message asks for: matched keywords per class and the resulting route."""
+
+    def __init__(self, text: str, matches: Dict[str, List[str]], game_name: Optional[str] = None):
+        self.text = text
+        self.matches = matches
+        self.game_name = game_name or self.first("game_name")
+
+    def has(self, cls: str) -> bool:
+        """Whether any keyword of a class was found."""
+        return bool(self.matches.get(cls))
+
+    def first(self, cls: str) -> Optional[str]:
+        """First keyword of a class in the message, or None."""
+        found = self.matches.get(cls)
+        return found[0] if found else None
+
+    @property
+    def is_game(self) -> bool:
+        """Passes the games-only gatekeeper."""
+        return self.has("game_hint") or self.has("game_name")
+
+    @property
+    def route(self) -> str:
+        """Which tool should answer."""
+        if self.game_name and self.has("steam"):
+            return ROUTE_STEAM
+        if self.game_name and self.has("general"):
+            return ROUTE_GAME_INFO
+        if self.has("top_seller") and self.has("price"):
+            return ROUTE_TOP_SELLERS
+        if self.has("search"):
+            return ROUTE_SEARCH
+        return ROUTE_LLM
+
+    def to_dict(self) -> Dict:
+        return {"route": self.route, "is_game": self.is_game, "game_name": self.game_name, "matches": self.matches}
+
+    def __repr__(self) -> str:
+        return f"Intent({self.to_dict()})"
+
+
+_automaton = KeywordAutomaton(KEYWORD_CLASSES)
+
+
+def route_intent(text: str, game_name: Optional[str] = None) -> Intent:
+    """
+    Classify a message in one pass over the text.
+
+    Args:
+        text: User message
+        game_name: Game already resolved elsewhere (e.g. the Steam catalog); overrides keyword detection
+    """
+    lowered = unicodedata.normalize("NFKC", text).lower()
+    matches: Dict[str, List[str]] = {}
+    for _, _, index in _automaton.find(lowered):
+        keyword = _automaton.keywords[index]
+        for cls in _automaton.classes[index]:
+            found = matches.setdefault(cls, [])
+            if keyword not in found:
+                found.append(keyword)
+    return Intent(text, matches, game_name)
+
+
+# Labelled routing examples: (message, is_game, route)
+LABELLED_EXAMPLES = [
+    ("ราคา elden ring เท่าไหร่", True, ROUTE_STEAM),
+    ("elden ring price?", True, ROUTE_STEAM),
+    ("gta โหลดได้ที่ไหน", True, ROUTE_STEAM),
+    ("valorant คืออะไร", True, ROUTE_GAME_INFO),
+    ("รีวิว cyberpunk หน่อย", True, ROUTE_GAME_INFO),
+    ("minecraft สนุกไหม", True, ROUTE_GAME_INFO),
+    ("top games on steam with prices", True, ROUTE_TOP_SELLERS),
+    ("เกมขายดีราคาเท่าไหร่บ้าง", True, ROUTE_TOP_SELLERS),
+    ("เกมมาแรงตอนนี้มีอะไรบ้าง", True, ROUTE_SEARCH),
+    ("latest game news", True, ROUTE_SEARCH),
+    ("ps5 เกมใหม่เดือนนี้", True, ROUTE_SEARCH),
+    ("most played games this week", True, ROUTE_SEARCH),
+    ("แนะนำเกม rpg หน่อย", True, ROUTE_LLM),
+    ("what mods should I install for skyrim", True, ROUTE_LLM),
+    ("best fps games for low end pc", True, ROUTE_LLM),
+    ("lol ranked tips", True, ROUTE_LLM),
+    ("ดูสเปคคอมให้หน่อย", True, ROUTE_LLM),
+    # False hits of plain substring matching
+    ("what's your favourite lollipop flavour", False, ROUTE_LLM),
+    ("spec sheet for my car", False, ROUTE_LLM),
+    ("I love codfish and chips", False, ROUTE_LLM),
+    ("how does photosynthesis work", False, ROUTE_LLM),
+    ("recommend a good apexification dentist", False, ROUTE_LLM),
+    ("what's the capital of france", False, ROUTE_LLM),
+    ("วันนี้อากาศดีไหม", False, ROUTE_LLM),
+    ("switching careers to teaching", False, ROUTE_LLM),
+    # Single everyday words that are also Steam app names (the app only takes
+    # two-word catalog matches when no keyword says the message is about games)
+    ("what should i cook for dinner tonight", False, ROUTE_LLM),
+    ("help me with my homework", False, ROUTE_LLM),
+]
+
+
+if __name__ == "__main__":
+    import time
+
+    # Labelled routing set
+    failures = 0
+    for text, is_game, route in LABELLED_EXAMPLES:
+        intent = route_intent(text)
+        ok = intent.is_game == is_game and intent.route == route
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {text!r}: is_game={intent.is_game} route={intent.route}")
+    print(f"\n{len(LABELLED_EXAMPLES) - failures}/{len(LABELLED_EXAMPLES)} labelled examples routed correctly\n")
+
+    # Microbenchmark: one automaton pass vs. the old per-list substring scans
+    def substring_scan(text):
+        lowered = text.lower()
+        return {cls: [k for k in keywords if k in lowered] for cls, keywords in KEYWORD_CLASSES.items()}
+
+    messages = [text for text, _, _ in LABELLED_EXAMPLES]
+    rounds = 2000
+    for name, fn in (("aho-corasick", route_intent), ("substring scans", substring_scan)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in messages:
+                fn(text)
+        elapsed = time.perf_counter() - start
+        print(f"{name:16s} {elapsed / (rounds * len(messages)) * 1e6:7.2f} us/message")
@@ -1,14 +1,144 @@
 """
 Utility functions for LiteLLM integration
 """
+import asyncio
 import os
+import random
+import threading
+import time
 from typing import Dict, List, Any, Optional
 import litellm
 from dotenv import load_dotenv
 
+from .tracing import traced, span, current_span, record_exception
+
 # Load environment variables
 load_dotenv()
 
+# Seconds for one attempt, and for the whole call including retries and failover
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 90))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", 2))
+LLM_BACKOFF = 0.5
+LLM_MAX_BACKOFF = 8.0
+# Requests in flight per model, shared by all sessions of the process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+
+# Model name prefix -> environment variables that hold its API key
+PROVIDER_KEYS = {
+    "gpt": ("OPENAI_API_KEY",),
+    "claude": ("ANTHROPIC_API_KEY",),
+    "gemini": ("GOOGLE_API_KEY", "GEMINI_API_KEY"),
+    "groq/": ("GROQ_API_KEY",),
+}
+
+
+def _configure_http_pool():
+    """Share one pooled, thread-safe HTTP client between all LiteLLM calls in the process."""
+    if getattr(litellm, "client_session", None) is None:
+        try:
+            import httpx
+            litellm.client_session = httpx.Client(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                timeout=600
+            )
+        except ImportError:
+            pass
+
+
+_configure_http_pool()
+
+
+class LLMError(Exception):
+    """
+    A failed completion, with enough detail for the caller to decide what to do.
+
+    kind is one of: timeout, rate_limit, unavailable, overloaded (local
+    concurrency limit), auth, not_found, context_window, bad_request, unknown.
+    """
+
+    RETRYABLE = ("timeout", "rate_limit", "unavailable", "overloaded")
+
+    def __init__(self, message: str, kind: str = "unknown", model: Optional[str] = None,
+                 attempts: Optional[List[Dict[str, Any]]] = None, partial: bool = False,
+                 cause: Optional[BaseException] = None):
+        super().__init__(message)
+        self.kind = kind
+        self.model = model
+        self.attempts = attempts or []
+        self.partial = partial
+        self.cause = cause
+
+    @property
+    def retryable(self) -> bool:
+        """Worth trying again (same model after a backoff, or the next one)."""
+        return self.kind in self.RETRYABLE
+
+    @property
+    def failover(self) -> bool:
+        """Another model may succeed where this one failed (not true for a bad request)."""
+        return self.kind != "bad_request"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "model": self.model, "message": str(self),
+                "partial": self.partial, "attempts": self.attempts}
+
+
+def classify_error(error: BaseException, model: str) -> LLMError:
+    """Map a LiteLLM / asyncio exception to an LLMError."""
+    if isinstance(error, LLMError):
+        return error
+    # Order matters: Timeout is a subclass of APIConnectionError, and
+    # ContextWindowExceededError of BadRequestError
+    kinds = [
+        ((asyncio.TimeoutError, litellm.Timeout), "timeout"),
+        ((litellm.RateLimitError,), "rate_limit"),
+        ((litellm.AuthenticationError,), "auth"),
+        ((litellm.NotFoundError,), "not_found"),
+        ((litellm.ContextWindowExceededError,), "context_window"),
+        ((litellm.BadRequestError,), "bad_request"),
+        ((litellm.ServiceUnavailableError, litellm.InternalServerError, litellm.APIConnectionError), "unavailable"),
+    ]
+    for types, kind in kinds:
+        if isinstance(error, types):
+            break
+    else:
+        kind = "unknown"
+    message = str(error) or type(error).__name__
+    return LLMError(message, kind=kind, model=model, cause=error)
+
+
+def has_credentials(model: str) -> bool:
+    """Whether the API key for a model's provider is set (unknown providers count as yes)."""
+    for prefix, names in PROVIDER_KEYS.items():
+        if model.startswith(prefix):
+            return any(os.getenv(name) for name in names)
+    return True
+
+
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_semaphores_lock = threading.Lock()
+
+
+def get_model_semaphore(model: str) -> threading.BoundedSemaphore:
+    """
+    Process-wide limit of concurrent requests to one model.
+
+    A thread semaphore rather than an asyncio one, so that the sync and the
+    async methods (each Streamlit script thread may run its own event loop)
+    share the same limit.
+    """
+    semaphore = _semaphores.get(model)
+    if semaphore is None:
+        with _semaphores_lock:
+            semaphore = _semaphores.setdefault(model, threading.BoundedSemaphore(LLM_MAX_CONCURRENCY))
+    return semaphore
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(LLM_MAX_BACKOFF, LLM_BACKOFF * 2 ** attempt))
+
 
 class LLMClient:
     """Wrapper class for LiteLLM operations"""
@@ -32,55 +162,269 @@ class LLMClient:
         if groq_key:
             os.environ["GROQ_API_KEY"] = groq_key
 
-    def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
+    def failover_models(self, failover: bool = True) -> List[str]:
+        """This client's model first, then the other available models that have an API key."""
+        models = [self.model]
+        if failover:
+            models += [m for m in get_available_models() if m != self.model and has_credentials(m)]
+        return models
+
+    def _params(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        params = dict(kwargs)
+        params["temperature"] = params.pop("temperature", self.temperature)
+        params["max_tokens"] = params.pop("max_tokens", self.max_tokens)
+        return params
+
+    def _attempt_plan(self, failover: bool, retries: int):
+        """(model, attempt number) pairs, in the order they are tried."""
+        for model in self.failover_models(failover):
+            for attempt in range(retries + 1):
+                yield model, attempt
+
+    @staticmethod
+    def _trace_answer(model: str, attempts: List[Dict[str, Any]]):
+        """Note on the current span which model answered and how many attempts failed before."""
+        current = current_span()
+        if current is not None:
+            current.set_attribute("llm.model", model)
+            current.set_attribute("llm.failed_attempts", len(attempts))
+
+    @staticmethod
+    def _give_up(attempts: List[Dict[str, Any]], last: LLMError) -> LLMError:
+        models = ", ".join(dict.fromkeys(a["model"] for a in attempts)) or last.model
+        return LLMError(f"All attempts failed ({models}): {last}", kind=last.kind,
+                        model=last.model, attempts=attempts, cause=last.cause)
+
+    @traced("llm.chat")
+    def chat(self, messages: List[Dict[str, str]], raise_errors: bool = False,
+             timeout: float = LLM_TIMEOUT, deadline: float = LLM_DEADLINE,
+             retries: int = LLM_RETRIES, failover: bool = True, **kwargs) -> str:
         """
         Send a chat completion request
 
         Args:
             messages: List of message dictionaries with 'role' and 'content'
+            raise_errors: Raise LLMError instead of returning an "Error: ..." string
+            timeout: Seconds for one attempt
+            deadline: Seconds for the whole call, retries and failover included
+            retries: Retries per model for retryable errors (timeouts, 429, 5xx)
+            failover: Try the other available models when this one keeps failing
             **kwargs: Additional parameters for the completion
 
         Returns:
             str: The response content
         """
-        try:
-            response = litellm.completion(
-                model=self.model,
-                messages=messages,
-                temperature=kwargs.get('temperature', self.temperature),
-                max_tokens=kwargs.get('max_tokens', self.max_tokens),
-                **kwargs
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Error: {str(e)}"
+        params = self._params(kwargs)
+        end = time.monotonic() + deadline
+        attempts: List[Dict[str, Any]] = []
+        last: Optional[LLMError] = None
+
+        for model, attempt in self._attempt_plan(failover, retries):
+            if last is not None and last.model == model and not last.retryable:
+                continue
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempt:
+                time.sleep(min(_backoff_delay(attempt - 1), remaining))
 
-    def stream_chat(self, messages: List[Dict[str, str]], **kwargs):
+            semaphore = get_model_semaphore(model)
+            started = time.perf_counter()
+            if not semaphore.acquire(timeout=max(end - time.monotonic(), 0)):
+                last = LLMError(f"{model}: too many requests in flight", kind="overloaded", model=model)
+            else:
+                try:
+                    response = litellm.completion(
+                        model=model,
+                        messages=messages,
+                        timeout=min(timeout, max(end - time.monotonic(), 0.1)),
+                        **params
+                    )
+                    self._trace_answer(model, attempts)
+                    return response.choices[0].message.content
+                except Exception as e:
+                    last = classify_error(e, model)
+                finally:
+                    semaphore.release()
+
+            attempts.append({"model": model, "kind": last.kind,
+                             "ms": round((time.perf_counter() - started) * 1000)})
+            print(f"LLM error ({model}, attempt {attempt + 1}): {last.kind}: {last}")
+            if not last.failover:
+                break
+
+        error = self._give_up(attempts, last or LLMError("LLM deadline exceeded", kind="timeout", model=self.model))
+        record_exception(error)
+        if raise_errors:
+            raise error
+        return f"Error: {error}"
+
+    @traced("llm.achat")
+    async def achat(self, messages: List[Dict[str, str]], timeout: float = LLM_TIMEOUT,
+                    deadline: float = LLM_DEADLINE, retries: int = LLM_RETRIES,
+                    failover: bool = True, **kwargs) -> str:
+        """
+        Async chat completion (litellm.acompletion) with the same per-model
+        concurrency limit, deadlines, retries and failover as chat().
+
+        Returns:
+            str: The response content
+
+        Raises:
+            LLMError: When every attempt failed or the deadline passed
+        """
+        params = self._params(kwargs)
+        end = time.monotonic() + deadline
+        attempts: List[Dict[str, Any]] = []
+        last: Optional[LLMError] = None
+
+        for model, attempt in self._attempt_plan(failover, retries):
+            if last is not None and last.model == model and not last.retryable:
+                continue
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempt:
+                await asyncio.sleep(min(_backoff_delay(attempt - 1), remaining))
+
+            semaphore = get_model_semaphore(model)
+            started = time.perf_counter()
+            acquired = semaphore.acquire(blocking=False)
+            while not acquired and time.monotonic() < end:
+                await asyncio.sleep(0.05)
+                acquired = semaphore.acquire(blocking=False)
+
+            if not acquired:
+                last = LLMError(f"{model}: too many requests in flight", kind="overloaded", model=model)
+            else:
+                try:
+                    attempt_timeout = min(timeout, max(end - time.monotonic(), 0.1))
+                    response = await asyncio.wait_for(
+                        litellm.acompletion(model=model, messages=messages, timeout=attempt_timeout, **params),
+                        timeout=attempt_timeout
+                    )
+                    self._trace_answer(model, attempts)
+                    return response.choices[0].message.content
+                except Exception as e:
+                    last = classify_error(e, model)
+                finally:
+                    semaphore.release()
+
+            attempts.append({"model": model, "kind": last.kind,
+                             "ms": round((time.perf_counter() - started) * 1000)})
+            print(f"LLM error ({model}, attempt {attempt + 1}): {last.kind}: {last}")
+            if not last.failover:
+                break
+
+        raise self._give_up(attempts, last or LLMError("LLM deadline exceeded", kind="timeout", model=self.model))
+
+    def stream_chat(self, messages: List[Dict[str, str]], raise_errors: bool = False,
+                    timeout: float = LLM_TIMEOUT, deadline: float = LLM_DEADLINE,
+                    retries: int = LLM_RETRIES, failover: bool = True,
+                    info: Optional[Dict[str, Any]] = None, **kwargs):
         """
         Send a streaming chat completion request
 
+        Retries and failover only happen before the first token; a stream that
+        breaks after that raises LLMError with partial=True, since restarting
+        it would repeat text the user has already seen.
+
         Args:
             messages: List of message dictionaries with 'role' and 'content'
+            raise_errors: Raise LLMError (also in the middle of a stream) instead
+                of yielding an "Error: ..." chunk, so callers can tell a broken
+                answer from a complete one
+            timeout: Seconds to wait for the provider (per attempt / between chunks)
+            deadline: Seconds until the first token, retries and failover included
+            retries: Retries per model for retryable errors
+            failover: Try the other available models when this one keeps failing
+            info: Filled with "model" (the model that answered) and "attempts" (failed attempts)
             **kwargs: Additional parameters for the completion
 
         Yields:
             str: Chunks of the response content
         """
+        info = {} if info is None else info
+        stream_span = span("llm.stream", model=self.model)
         try:
-            response = litellm.completion(
-                model=self.model,
-                messages=messages,
-                temperature=kwargs.get('temperature', self.temperature),
-                max_tokens=kwargs.get('max_tokens', self.max_tokens),
-                stream=True,
-                **kwargs
-            )
+            for token in self._stream_chat(messages, raise_errors, timeout, deadline, retries, failover, info, **kwargs):
+                if "ttft_ms" not in stream_span.attributes and not info.get("error"):
+                    stream_span.set_attribute("ttft_ms", stream_span.duration_ms)
+                yield token
+        except LLMError as e:
+            stream_span.record_exception(e)
+            raise
+        finally:
+            stream_span.set_attribute("llm.model", info.get("model", ""))
+            stream_span.set_attribute("llm.failed_attempts", len(info.get("attempts", [])))
+            if info.get("error"):
+                stream_span.error = info["error"]
+            stream_span.end()
+
+    def _stream_chat(self, messages, raise_errors, timeout, deadline, retries, failover, info, **kwargs):
+        """Retry / failover loop behind stream_chat()."""
+        params = self._params(kwargs)
+        end = time.monotonic() + deadline
+        attempts: List[Dict[str, Any]] = []
+        last: Optional[LLMError] = None
+        info["attempts"] = attempts
+
+        for model, attempt in self._attempt_plan(failover, retries):
+            if last is not None and last.model == model and not last.retryable:
+                continue
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempt:
+                time.sleep(min(_backoff_delay(attempt - 1), remaining))
+
+            semaphore = get_model_semaphore(model)
+            started = time.perf_counter()
+            if not semaphore.acquire(timeout=max(end - time.monotonic(), 0)):
+                last = LLMError(f"{model}: too many requests in flight", kind="overloaded", model=model)
+            else:
+                streamed = False
+                try:
+                    response = litellm.completion(
+                        model=model,
+                        messages=messages,
+                        timeout=min(timeout, max(end - time.monotonic(), 0.1)),
+                        stream=True,
+                        **params
+                    )
+                    for chunk in response:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if not streamed:
+                                streamed = True
+                                info["model"] = model
+                            yield chunk.choices[0].delta.content
+                    if not streamed:
+                        info["model"] = model
+                    return
+                except Exception as e:
+                    last = classify_error(e, model)
+                    if streamed:
+                        last.partial = True
+                        last.attempts = attempts
+                        if raise_errors:
+                            raise last from e
+                        info["error"] = str(last)
+                        yield f"Error: {last}"
+                        return
+                finally:
+                    semaphore.release()
+
+            attempts.append({"model": model, "kind": last.kind,
+                             "ms": round((time.perf_counter() - started) * 1000)})
+            print(f"LLM error ({model}, attempt {attempt + 1}): {last.kind}: {last}")
+            if not last.failover:
+                break
 
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-        except Exception as e:
-            yield f"Error: {str(e)}"
+        error = self._give_up(attempts, last or LLMError("LLM deadline exceeded", kind="timeout", model=self.model))
+        if raise_errors:
+            raise error
+        info["error"] = str(error)
+        yield f"Error: {error}"
 
 
 def get_available_models() -> List[str]:
@@ -0,0 +1,87 @@
+"""
+In-process latency metrics: fixed-bucket histograms with percentiles.
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Optional, Any
+
+# Bucket upper bounds in ms, roughly x1.25 apart from 1 ms to 60 s
+DEFAULT_BUCKETS_MS = [round(1.25 ** i, 1) for i in range(0, 50)]
+
+
+class LatencyHistogram:
+    """
+    Thread-safe latency histogram.
+
+    Memory is constant (one counter per bucket), and percentiles are
+    accurate to the bucket width (about 25%), which is enough for
+    picking timeouts and for dashboards.
+    """
+
+    def __init__(self, buckets_ms: Optional[List[float]] = None):
+        self.buckets_ms = list(buckets_ms or DEFAULT_BUCKETS_MS)
+        self.counts = [0] * (len(self.buckets_ms) + 1)  # last bucket: above the largest bound
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, ms: float, error: bool = False):
+        """Record one duration in milliseconds."""
+        index = bisect.bisect_left(self.buckets_ms, ms)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+            if error:
+                self.errors += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Approximate q-th percentile (0-100) in ms, or None without data."""
+        with self._lock:
+            if self.count == 0:
+                return None
+            rank = q / 100 * self.count
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    if index == len(self.buckets_ms):
+                        return round(self.max_ms, 1)
+                    return round(min(self.buckets_ms[index], self.max_ms), 1)
+            return round(self.max_ms, 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Count, error count, mean and p50/p95/p99 for monitoring."""
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 1) if self.count else None,
+        }
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def get_histogram(name: str) -> LatencyHistogram:
+    """Process-wide histogram by name (created on first use)."""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, LatencyHistogram())
+    return histogram
+
+
+def histogram_snapshots(prefix: str = "") -> Dict[str, Dict[str, Any]]:
+    """Snapshots of all histograms whose name starts with prefix."""
+    with _histograms_lock:
+        names = sorted(n for n in _histograms if n.startswith(prefix))
+    return {name: _histograms[name].snapshot() for name in names}
@@ -5,11 +5,19 @@ Simple and educational implementation for CS203 lab.
 
 import os
 import pickle
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Iterable, Tuple, Union
 from pathlib import Path
 import numpy as np
 import tempfile
 
+from .cache import TTLCache, SQLiteCache, normalize_text
+from .chunk_store import ChunkStore
+from .text_chunker import TokenChunker
+from .tracing import traced, span, record_exception
+
 # Suppress PyTorch warnings that conflict with Streamlit
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="torch")
@@ -22,42 +30,224 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 try:
     import PyPDF2
 except ImportError:
-    PyPDF2 = None
+    try:
+        import pypdf as PyPDF2  # PyPDF2's maintained successor, listed in requirements.txt
+    except ImportError:
+        PyPDF2 = None
 
 # Lazy imports to avoid PyTorch conflicts
 faiss = None
 SentenceTransformer = None
 
+# Chunking strategies: "token" = embedding model's tokenizer (see text_chunker), "char" = characters
+CHUNKERS = ["token", "char"]
+
+# Supported FAISS index backends ("auto" picks one from the number of chunks)
+INDEX_TYPES = ["flat", "ivf_flat", "ivf_pq", "hnsw", "auto"]
+
+# Similarity metrics: "cosine" = inner product on normalized vectors, "l2" = Euclidean distance
+METRICS = ["cosine", "l2"]
+
+# Chunk counts at which "auto" switches to an approximate index
+AUTO_HNSW_MIN_CHUNKS = 20_000
+AUTO_IVF_PQ_MIN_CHUNKS = 200_000
+
+# Threads used by FAISS/PyTorch. 1 avoids conflicts with Streamlit; raise it
+# (RAG_NUM_THREADS or the num_threads argument) for offline ingestion.
+DEFAULT_NUM_THREADS = int(os.getenv("RAG_NUM_THREADS", "1"))
+
 
-def _lazy_imports():
+def _lazy_imports(num_threads: Optional[int] = None):
     """Lazy import of heavy dependencies."""
     global faiss, SentenceTransformer
+    num_threads = num_threads or DEFAULT_NUM_THREADS
     if faiss is None:
         # Additional environment setup to prevent conflicts
-        os.environ["OMP_NUM_THREADS"] = "1"
+        os.environ.setdefault("OMP_NUM_THREADS", str(num_threads))
         os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
         import faiss as _faiss  # type: ignore
         faiss = _faiss
+        faiss.omp_set_num_threads(num_threads)
     if SentenceTransformer is None:
         from sentence_transformers import SentenceTransformer as _ST  # type: ignore
         SentenceTransformer = _ST
 
 
+def _set_num_threads(num_threads: int):
+    """Apply a thread count to FAISS and PyTorch after they are imported."""
+    faiss.omp_set_num_threads(num_threads)
+    try:
+        import torch  # type: ignore
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def _extract_pdf_text(pdf_path: str) -> Tuple[str, int]:
+    """Extract the text of a PDF. Returns (text, number of pages)."""
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        pages = [page.extract_text() or "" for page in pdf_reader.pages]
+    return "\n".join(pages), len(pages)
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
+    """
+    Split text into overlapping chunks.
+
+    Args:
+        text: Input text to chunk
+        chunk_size: Target size of each chunk
+        overlap: Number of characters to overlap between chunks
+
+    Returns:
+        List of text chunks
+    """
+    if len(text) <= chunk_size:
+        return [text]
+
+    chunks = []
+    start = 0
+
+    while start < len(text):
+        end = start + chunk_size
+
+        # Try to end at a sentence boundary
+        if end < len(text):
+            # Look for sentence endings near the chunk boundary
+            for i in range(end, max(start + chunk_size - 100, start), -1):
+                if text[i] in '.!?':
+                    end = i + 1
+                    break
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+
+        start = end - overlap
+
+        # Prevent infinite loops
+        if start >= end:
+            start = end
+
+    return chunks
+
+
+# Token chunkers built inside ingestion worker processes, one per configuration
+_worker_chunkers: Dict[Tuple, TokenChunker] = {}
+# Configurations whose tokenizer failed to load in this worker (not retried per file)
+_worker_chunker_errors: Dict[Tuple, str] = {}
+
+
+def _get_worker_chunker(config: Optional[Tuple[str, int, int]]) -> Optional[TokenChunker]:
+    """
+    Load (once per worker process) the token chunker for (tokenizer name or
+    path, max tokens, overlap). Raises if the tokenizer can't be loaded, so the
+    caller can chunk the file with the main process' chunker instead of
+    silently mixing character and token chunks in one ingest.
+    """
+    if config is None:
+        return None
+    if config in _worker_chunker_errors:
+        raise RuntimeError(_worker_chunker_errors[config])
+    if config not in _worker_chunkers:
+        tokenizer_name, max_tokens, overlap = config
+        try:
+            _worker_chunkers[config] = TokenChunker.for_model(tokenizer_name, max_tokens, overlap)
+        except Exception as e:
+            _worker_chunker_errors[config] = str(e)
+            raise
+    return _worker_chunkers[config]
+
+
+def _extract_and_chunk(path: str, chunker_config: Optional[Tuple[str, int, int]] = None) -> Dict[str, Any]:
+    """
+    Read one .txt or .pdf file and split it into chunks.
+    Runs inside an ingest_files worker process.
+    """
+    try:
+        chunker = _get_worker_chunker(chunker_config)
+    except Exception as e:
+        return {"doc_id": Path(path).stem, "path": path, "chunker_error": str(e)}
+    return _chunk_file(path, chunker)
+
+
+def _chunk_file(path: str, chunker: Optional[TokenChunker]) -> Dict[str, Any]:
+    """Read one .txt or .pdf file and split it with chunker (None = character chunks)."""
+    file_path = Path(path)
+    result: Dict[str, Any] = {"doc_id": file_path.stem, "path": path}
+    try:
+        start_time = time.perf_counter()
+        if file_path.suffix.lower() == ".pdf":
+            if PyPDF2 is None:
+                raise RuntimeError("PyPDF2 not installed")
+            text, num_pages = _extract_pdf_text(path)
+            result["metadata"] = {"source_type": "pdf", "source_path": path, "num_pages": num_pages}
+        elif chunker is not None:
+            # Stream large text files through the chunker instead of reading them whole
+            text = None
+            result["metadata"] = {"source_type": "text", "source_path": path}
+        else:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            result["metadata"] = {"source_type": "text", "source_path": path}
+        extracted_time = time.perf_counter()
+
+        if chunker is None:
+            result["chunks"] = chunk_text(text)
+        elif text is None:
+            result["chunks"] = list(chunker.iter_file_chunks(path))
+        else:
+            result["chunks"] = chunker.chunk(text)
+        result["extract_s"] = extracted_time - start_time
+        result["chunk_s"] = time.perf_counter() - extracted_time
+    except Exception as e:
+        result["error"] = f"{path}: {e}"
+    return result
+
+
 class SimpleRAGSystem:
     """
     A simple RAG system using FAISS for vector similarity search.
     Educational implementation with clear, understandable code.
     """
 
-    def __init__(self, data_dir: str = "rag_data", embedding_model: str = "all-MiniLM-L6-v2"):
+    def __init__(self, data_dir: str = "rag_data", embedding_model: str = "all-MiniLM-L6-v2",
+                 index_type: str = "flat", nprobe: int = 8, ef_search: int = 64,
+                 metric: str = "cosine", min_score: Optional[float] = None,
+                 index_save_interval: float = 30.0, query_cache_size: int = 1024,
+                 query_cache_ttl: float = 3600, persist_query_cache: bool = False,
+                 num_threads: Optional[int] = None, chunker: str = "token",
+                 chunk_tokens: Optional[int] = None, chunk_overlap: int = 32):
         """
         Initialize the RAG system.
 
         Args:embedding_model="sentence-transformers/all-mpnet-base-v2"
             data_dir: Directory to store FAISS index and metadata
             embedding_model: SentenceTransformer model name
+            index_type: FAISS backend - "flat", "ivf_flat", "ivf_pq", "hnsw" or "auto"
+            nprobe: Default number of IVF lists to visit per query
+            ef_search: Default HNSW search depth per query
+            metric: "cosine" (inner product) or "l2"; scores are cosine similarity either way
+            min_score: Default minimum similarity for search results (None = no threshold)
+            index_save_interval: Minimum seconds between FAISS index writes for single-document
+                adds (chunks are always stored right away; see save_index)
+            query_cache_size: Number of query embeddings kept in memory (0 = no cache)
+            query_cache_ttl: Seconds a cached query embedding stays valid
+            persist_query_cache: Also keep query embeddings on disk across restarts
+            num_threads: Threads for FAISS/PyTorch (defaults to RAG_NUM_THREADS, or 1)
+            chunker: "token" (model tokenizer, Thai-aware boundaries) or "char" (1000 characters)
+            chunk_tokens: Maximum tokens per chunk (defaults to the model's max sequence length)
+            chunk_overlap: Tokens shared between consecutive chunks
         """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index_type '{index_type}', expected one of {INDEX_TYPES}")
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+        if chunker not in CHUNKERS:
+            raise ValueError(f"Unknown chunker '{chunker}', expected one of {CHUNKERS}")
+
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
 
@@ -66,25 +256,98 @@ class SimpleRAGSystem:
         self.embedding_model = embedding_model
         self.embedding_dimension = None
         self.index = None
-
-        # Storage for documents and metadata
-        self.documents: List[str] = []
-        self.metadata: List[Dict[str, Any]] = []
+        self.num_threads = num_threads or DEFAULT_NUM_THREADS
+        # Model load and index (re)builds run under one lock; _ready is set
+        # by warm_up once both are done, so other threads can check is_ready
+        self._ready_lock = threading.RLock()
+        self._ready = threading.Event()
+        self._warm_up_future: Optional[Future] = None
+        self._warm_up_submit_lock = threading.Lock()
+
+        # Chunking settings (the token chunker is created with the model)
+        self.chunker = chunker
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self._token_chunker: Optional[TokenChunker] = None
+
+        # Index backend settings
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.metric = metric
+        self.min_score = min_score
+        self.active_index_type = "flat"  # backend actually built (may differ for "auto")
+        self.active_metric = metric  # metric of the index actually built
+        self._trained_on = 0  # number of vectors the IVF quantizer was trained on
+        self._index_dirty = False  # index needs (re)training before use
+
+        # Chunk texts, metadata and normalized embeddings live in an append-only
+        # store on disk and are read by ID. FAISS vector IDs are the chunk IDs.
+        self.store = ChunkStore(self.data_dir / "chunks.db")
+        self._num_chunks = 0
+        self._indexed_max_id = -1  # highest chunk ID contained in self.index
+        self._index_mmapped = False  # index is a read-only memory map of the index file
+        self.index_save_interval = index_save_interval
+        self._unsaved_chunks = 0
+        self._last_index_save = 0.0
+
+        # Cache of query embeddings, keyed by model name + normalized query
+        self.query_cache = TTLCache(maxsize=query_cache_size, ttl=query_cache_ttl) if query_cache_size > 0 else None
+        self.query_cache_disk = None
+        if self.query_cache is not None and persist_query_cache:
+            self.query_cache_disk = SQLiteCache(self.data_dir / "query_cache.db",
+                                                namespace="query_embeddings", ttl=query_cache_ttl)
 
         # Try to load existing data
         self.load_index()
 
     def _ensure_model_loaded(self):
         """Lazy load the model to avoid PyTorch conflicts with Streamlit."""
-        if self.model is None:
-            _lazy_imports()
+        if self.model is not None:
+            return
+        with self._ready_lock:
+            if self.model is not None:
+                return
+            _lazy_imports(self.num_threads)
+            _set_num_threads(self.num_threads)
             print(f"Loading embedding model: {self.embedding_model}")
-            self.model = SentenceTransformer(self.embedding_model)
-            self.embedding_dimension = self.model.get_sentence_embedding_dimension()
+            model = SentenceTransformer(self.embedding_model)
+            self.embedding_dimension = model.get_sentence_embedding_dimension()
+
+            if self.store.get_info("embedding_model") is None:
+                self.store.set_info(embedding_model=self.embedding_model,
+                                    embedding_dimension=self.embedding_dimension)
 
             if self.index is None:
-                # Initialize FAISS index (L2 distance)
-                self.index = faiss.IndexFlatL2(self.embedding_dimension)
+                # Initialize an empty FAISS index
+                self.active_index_type = self._resolve_index_type(0)
+                self.active_metric = self.metric
+                self.index = self._create_index(self.active_index_type, 0)
+            self.model = model
+
+    @property
+    def num_chunks(self) -> int:
+        """Number of chunks in the system."""
+        return self._num_chunks
+
+    @property
+    def is_ready(self) -> bool:
+        """True once warm_up has loaded the model and built the index (search will not block)."""
+        return self._ready.is_set()
+
+    def warm_up(self):
+        """Load the embedding model and make sure the index is ready, so the first search is fast."""
+        with self._ready_lock:
+            self._ensure_model_loaded()
+            self._refresh_index()
+        self._ready.set()
+
+    def warm_up_async(self, executor: Executor) -> Future:
+        """Run warm_up on an executor once; later calls return the same future."""
+        with self._warm_up_submit_lock:
+            if self._warm_up_future is None:
+                self._warm_up_future = executor.submit(self.warm_up)
+            return self._warm_up_future
 
     def add_text_document(self, text: str, doc_id: str, metadata: Optional[Dict[str, Any]] = None):
         """
@@ -99,38 +362,322 @@ class SimpleRAGSystem:
             # Ensure model is loaded
             self._ensure_model_loaded()
 
-            # Split text into chunks
-            chunks = self._chunk_text(text)
+            # Split text into chunks and embed them in one batch
+            chunks, chunk_metadata = self._prepare_chunks(text, doc_id, metadata)
+            self._add_chunks(chunks, chunk_metadata)
 
-            for i, chunk in enumerate(chunks):
-                if len(chunk.strip()) < 10:  # Skip very short chunks
-                    continue
+            # Save updated data
+            self.save_index()
+            return f"Added document '{doc_id}' with {len(chunks)} chunks"
 
-                # Create embeddings for the chunk
-                embedding = self.model.encode([chunk])
-                # Normalize for cosine similarity
-                faiss.normalize_L2(embedding)
+        except Exception as e:
+            return f"Error adding document: {str(e)}"
 
-                # Add to index
-                self.index.add(embedding.astype('float32'))
+    def add_documents(self, documents: Iterable[Union[Dict[str, Any], Tuple]], batch_size: int = 64) -> Dict[str, Any]:
+        """
+        Add many text documents at once (bulk ingestion).
 
-                # Store the chunk and metadata
-                chunk_metadata = metadata.copy() if metadata else {}
-                chunk_metadata.update({
-                    "doc_id": doc_id,
-                    "chunk_id": f"{doc_id}_chunk_{i}",
-                    "chunk_index": i
-                })
+        Chunks are collected across documents and embedded in batches of
+        ``batch_size``, each batch is added to FAISS with a single call and
+        the index is saved only once at the end.
 
-                self.documents.append(chunk)
-                self.metadata.append(chunk_metadata)
+        Args:
+            documents: Iterable of dicts with 'text', 'doc_id' and optional 'metadata',
+                or tuples (text, doc_id) / (text, doc_id, metadata)
+            batch_size: Number of chunks to encode per model call
 
-            # Save updated data
-            self.save_index()
-            return f"Added document '{doc_id}' with {len(chunks)} chunks"
+        Returns:
+            Ingestion report with document/chunk counts and throughput (chunks/sec)
+        """
+        start_time = time.perf_counter()
+        num_documents = 0
+        num_chunks = 0
+        pending_chunks: List[str] = []
+        pending_metadata: List[Dict[str, Any]] = []
 
+        try:
+            self._ensure_model_loaded()
+
+            for doc in documents:
+                if isinstance(doc, dict):
+                    text, doc_id, metadata = doc["text"], doc["doc_id"], doc.get("metadata")
+                else:
+                    text, doc_id = doc[0], doc[1]
+                    metadata = doc[2] if len(doc) > 2 else None
+
+                chunks, chunk_metadata = self._prepare_chunks(text, doc_id, metadata)
+                pending_chunks.extend(chunks)
+                pending_metadata.extend(chunk_metadata)
+                num_documents += 1
+
+                # Flush full batches as soon as we have them
+                while len(pending_chunks) >= batch_size:
+                    self._add_chunks(pending_chunks[:batch_size], pending_metadata[:batch_size], batch_size)
+                    num_chunks += batch_size
+                    del pending_chunks[:batch_size]
+                    del pending_metadata[:batch_size]
+
+            if pending_chunks:
+                self._add_chunks(pending_chunks, pending_metadata, batch_size)
+                num_chunks += len(pending_chunks)
+
+            error = None
         except Exception as e:
-            return f"Error adding document: {str(e)}"
+            error = f"Error adding documents: {str(e)}"
+
+        # Persist once for the whole batch (also keeps whatever was added before an error)
+        if num_chunks:
+            self.save_index(force=True)
+
+        elapsed = time.perf_counter() - start_time
+        report = {
+            "documents": num_documents,
+            "chunks": num_chunks,
+            "batch_size": batch_size,
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(num_chunks / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        if error:
+            report["error"] = error
+
+        print(f"Ingested {num_documents} documents ({num_chunks} chunks) in "
+              f"{elapsed:.2f}s - {report['chunks_per_sec']} chunks/sec")
+        return report
+
+    def ingest_files(self, paths: Iterable[Union[str, Path]], workers: Optional[int] = None,
+                     batch_size: int = 64, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Ingest many .txt/.pdf files using a pool of worker processes.
+
+        Workers read and chunk files in parallel; their chunks are streamed
+        into a single embedding stage in this process, which embeds them in
+        batches. The index is saved once at the end.
+
+        Args:
+            paths: Files to ingest (the file name without extension is the doc_id)
+            workers: Number of worker processes (defaults to the CPU count, 1 = no pool)
+            batch_size: Number of chunks to encode per model call
+            metadata: Extra metadata added to every document
+
+        Returns:
+            Report with counts, errors and per-stage timings in seconds
+            (extract/chunk are summed over workers, embed/store run here)
+        """
+        start_time = time.perf_counter()
+        workers = workers or os.cpu_count() or 1
+        timings = {"extract_s": 0.0, "chunk_s": 0.0, "embed_s": 0.0, "store_s": 0.0}
+        errors = []
+        num_documents = 0
+        num_chunks = 0
+        pending_chunks: List[str] = []
+        pending_metadata: List[Dict[str, Any]] = []
+
+        def handle(result: Dict[str, Any]):
+            nonlocal num_documents, num_chunks
+            if "chunker_error" in result:
+                # The worker couldn't load the tokenizer: chunk here with the same
+                # token chunker, so the ingest doesn't mix chunk schemes
+                errors.append(f"{result['path']}: token chunker unavailable in worker "
+                              f"({result['chunker_error']}), chunked in the main process")
+                result = _chunk_file(result["path"], self._get_token_chunker())
+            if "error" in result:
+                errors.append(result["error"])
+                return
+            print(f"Loading {Path(result['path']).name}...")
+            timings["extract_s"] += result["extract_s"]
+            timings["chunk_s"] += result["chunk_s"]
+
+            doc_metadata = {**(metadata or {}), **result["metadata"]}
+            chunks, chunk_metadata = self._label_chunks(result["chunks"], result["doc_id"], doc_metadata)
+            pending_chunks.extend(chunks)
+            pending_metadata.extend(chunk_metadata)
+            num_documents += 1
+
+            # Embed full batches as soon as we have them
+            while len(pending_chunks) >= batch_size:
+                self._add_chunks(pending_chunks[:batch_size], pending_metadata[:batch_size], batch_size, timings)
+                num_chunks += batch_size
+                del pending_chunks[:batch_size]
+                del pending_metadata[:batch_size]
+
+        try:
+            self._ensure_model_loaded()
+            paths = [str(p) for p in paths]
+
+            chunker_config = self._chunker_config()
+
+            if workers <= 1:
+                token_chunker = self._get_token_chunker()
+                for path in paths:
+                    handle(_chunk_file(path, token_chunker))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    # Keep a bounded number of files in flight so memory stays flat
+                    path_iter = iter(paths)
+                    in_flight = set()
+                    while True:
+                        for path in path_iter:
+                            in_flight.add(executor.submit(_extract_and_chunk, path, chunker_config))
+                            if len(in_flight) >= workers * 2:
+                                break
+                        if not in_flight:
+                            break
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            handle(future.result())
+
+            if pending_chunks:
+                self._add_chunks(pending_chunks, pending_metadata, batch_size, timings)
+                num_chunks += len(pending_chunks)
+
+        except Exception as e:
+            errors.append(f"Error ingesting files: {str(e)}")
+
+        if num_chunks:
+            save_start = time.perf_counter()
+            self.save_index(force=True)
+            timings["save_s"] = time.perf_counter() - save_start
+
+        elapsed = time.perf_counter() - start_time
+        report = {
+            "documents": num_documents,
+            "chunks": num_chunks,
+            "workers": workers,
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(num_chunks / elapsed, 1) if elapsed > 0 else 0.0,
+            "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+            "errors": errors,
+        }
+
+        print(f"Ingested {num_documents} files ({num_chunks} chunks) in {elapsed:.2f}s "
+              f"with {workers} workers - {report['chunks_per_sec']} chunks/sec")
+        print("  " + ", ".join(f"{stage}={seconds}" for stage, seconds in report["timings"].items()))
+        return report
+
+    def _prepare_chunks(self, text: str, doc_id: str,
+                        metadata: Optional[Dict[str, Any]] = None) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """Split a document into chunks and build the metadata for each chunk."""
+        return self._label_chunks(self._chunk_text(text), doc_id, metadata)
+
+    def _label_chunks(self, raw_chunks: List[str], doc_id: str,
+                      metadata: Optional[Dict[str, Any]] = None) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """Drop very short chunks and build the metadata for the rest."""
+        chunks = []
+        chunk_metadata = []
+
+        for i, chunk in enumerate(raw_chunks):
+            if len(chunk.strip()) < 10:  # Skip very short chunks
+                continue
+
+            meta = metadata.copy() if metadata else {}
+            meta.update({
+                "doc_id": doc_id,
+                "chunk_id": f"{doc_id}_chunk_{i}",
+                "chunk_index": i
+            })
+
+            chunks.append(chunk)
+            chunk_metadata.append(meta)
+
+        return chunks, chunk_metadata
+
+    def _add_chunks(self, chunks: List[str], chunk_metadata: List[Dict[str, Any]], batch_size: int = 64,
+                    timings: Optional[Dict[str, float]] = None):
+        """
+        Embed chunks in batches, append them to the store and add them to the FAISS index.
+        If timings is given, time spent embedding/storing is added to it.
+        """
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            start_time = time.perf_counter()
+
+            # Create embeddings for the whole batch in one model call
+            embeddings = self.model.encode(batch, batch_size=batch_size, show_progress_bar=False)
+            embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+            # Normalize for cosine similarity
+            faiss.normalize_L2(embeddings)
+            embedded_time = time.perf_counter()
+
+            # Store the chunks, metadata and embeddings
+            ids = self.store.add_chunks(batch, chunk_metadata[start:start + batch_size], embeddings)
+            self._num_chunks += len(ids)
+
+            # Add to index (untrained IVF indexes are built later from the stored embeddings)
+            if self.index.is_trained and not self._index_dirty:
+                self._ensure_index_writable()
+                self.index.add_with_ids(embeddings, ids)
+                self._indexed_max_id = int(ids[-1])
+                self._unsaved_chunks += len(ids)
+            else:
+                self._index_dirty = True
+
+            if timings is not None:
+                timings["embed_s"] = timings.get("embed_s", 0.0) + embedded_time - start_time
+                timings["store_s"] = timings.get("store_s", 0.0) + time.perf_counter() - embedded_time
+
+        if self._needs_rebuild():
+            self._index_dirty = True
+
+    def _ensure_index_writable(self):
+        """Replace a memory-mapped (read-only) index with an in-memory copy before changing it."""
+        if self._index_mmapped:
+            self.index = faiss.read_index(str(self.data_dir / "faiss_index.bin"))
+            self._index_mmapped = False
+
+    def _sync_index(self):
+        """Add chunks that are in the store but not yet in the index (e.g. after a crash)."""
+        self._ensure_index_writable()
+        added = 0
+        for ids, embeddings in self.store.iter_embeddings(min_id=self._indexed_max_id + 1):
+            self.index.add_with_ids(embeddings, ids)
+            self._indexed_max_id = int(ids[-1])
+            added += len(ids)
+        if added:
+            print(f"Added {added} chunks missing from the saved index")
+            self._unsaved_chunks += added
+
+    def _migrate_pickle_storage(self, data_path: Path, index_path: Path):
+        """Move documents.pkl (and embeddings.npy) from older versions into the chunk store."""
+        with open(data_path, 'rb') as f:
+            data = pickle.load(f)
+        documents = data.get('documents', [])
+        metadata = data.get('metadata', [])
+
+        embeddings = None
+        embeddings_path = self.data_dir / "embeddings.npy"
+        if embeddings_path.exists():
+            embeddings = np.load(embeddings_path)
+        elif index_path.exists():
+            # Read the vectors back from the old flat index
+            _lazy_imports()
+            try:
+                old_index = faiss.read_index(str(index_path))
+                if old_index.ntotal == len(documents):
+                    embeddings = old_index.reconstruct_n(0, old_index.ntotal)
+            except Exception:
+                pass
+
+        if embeddings is None or len(embeddings) != len(documents):
+            self._ensure_model_loaded()
+            print("Re-encoding documents to migrate them to the chunk store")
+            embeddings = np.ascontiguousarray(
+                self.model.encode(documents, show_progress_bar=False), dtype='float32')
+            faiss.normalize_L2(embeddings)
+
+        if documents:
+            self.store.add_chunks(documents, metadata, embeddings)
+        self.store.set_info(embedding_model=data.get('embedding_model'),
+                            embedding_dimension=data.get('embedding_dimension'),
+                            index_type=data.get('index_type', 'flat'),
+                            # Indexes saved before the metric option always used L2
+                            metric=data.get('metric', 'l2'),
+                            trained_on=data.get('trained_on', 0),
+                            indexed_max_id=-1)
+
+        data_path.rename(data_path.with_name(data_path.name + ".migrated"))
+        if embeddings_path.exists():
+            embeddings_path.unlink()
+        print(f"Migrated {len(documents)} chunks from {data_path.name} to the chunk store")
 
     def add_pdf_document(self, pdf_path: str, doc_id: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None):
         """
@@ -146,11 +693,7 @@ class SimpleRAGSystem:
 
         try:
             # Extract text from PDF
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
+            text, num_pages = _extract_pdf_text(pdf_path)
 
             # Use filename as doc_id if not provided
             if doc_id is None:
@@ -161,7 +704,7 @@ class SimpleRAGSystem:
             pdf_metadata.update({
                 "source_type": "pdf",
                 "source_path": pdf_path,
-                "num_pages": len(pdf_reader.pages)
+                "num_pages": num_pages
             })
 
             return self.add_text_document(text, doc_id, pdf_metadata)
@@ -169,60 +712,122 @@ class SimpleRAGSystem:
         except Exception as e:
             return f"Error processing PDF: {str(e)}"
 
-    def search(self, query: str, n_results: int = 15) -> List[Dict[str, Any]]:
+    @traced("rag.search")
+    def search(self, query: str, n_results: int = 15, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None, min_score: Optional[float] = None) -> List[Dict[str, Any]]:
         """
         Search for relevant documents using FAISS
 
         Args:
             query: Search query text
             n_results: Number of results to return
+            nprobe: IVF lists to visit for this query (defaults to self.nprobe)
+            ef_search: HNSW search depth for this query (defaults to self.ef_search)
+            min_score: Drop results with a lower cosine similarity (defaults to self.min_score)
 
         Returns:
-            List of search results with content and metadata
+            List of search results with content and metadata, best match first.
+            "score" is the cosine similarity (higher is better).
         """
         try:
-            if len(self.documents) == 0:
+            if self._num_chunks == 0:
                 return [{"error": "No documents in the system"}]
 
             # Ensure model is loaded
             self._ensure_model_loaded()
-            # Create embedding for query
-            query_embedding = self.model.encode([query])
-            # Normalize for cosine similarity
-            faiss.normalize_L2(query_embedding)
+            self._refresh_index()
+            self._set_search_params(self.index, nprobe or self.nprobe, ef_search or self.ef_search)
+            # Create (or reuse) embedding for query
+            query_embedding = self._encode_query(query)
 
             # Search using FAISS
-            n_results = min(n_results, len(self.documents))
-            scores, indices = self.index.search(
+            n_results = min(n_results, self._num_chunks)
+            scores, ids = self.index.search(
                 query_embedding.astype('float32'), n_results)
 
+            if min_score is None:
+                min_score = self.min_score
+
+            hits = []
+            for score, chunk_id in zip(self._to_similarity(scores[0]), ids[0]):
+                if chunk_id < 0:  # No more results
+                    break
+                if min_score is not None and score < min_score:
+                    # Results are sorted, everything after this is less relevant
+                    break
+                hits.append((int(chunk_id), float(score)))
+
+            # Read only the matching chunks from the store
+            chunks = self.store.get_chunks([chunk_id for chunk_id, _ in hits])
+
             search_results = []
-            for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-                if idx >= 0:  # Valid index
-                    search_results.append({
-                        "content": self.documents[idx],
-                        "metadata": self.metadata[idx],
-                        "score": float(score),
-                        "rank": i + 1
-                    })
+            for chunk_id, score in hits:
+                if chunk_id not in chunks:  # Deleted after the index was saved
+                    continue
+                content, metadata = chunks[chunk_id]
+                search_results.append({
+                    "content": content,
+                    "metadata": metadata,
+                    "score": score,
+                    "rank": len(search_results) + 1
+                })
 
             return search_results
 
         except Exception as e:
+            record_exception(e)
             return [{"error": f"Search failed: {str(e)}"}]
 
-    def get_context_for_query(self, query: str, max_context_length: int = 2000) -> str:
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Normalized embedding of a query, shape (1, dimension). Uses the query
+        cache, so other components (e.g. the semantic answer cache) can share
+        the model and its cached embeddings.
+        """
+        self._ensure_model_loaded()
+        return self._encode_query(query)
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        """Embed and normalize a query, using the query cache when possible."""
+        query = normalize_text(query)
+        key = f"{self.embedding_model}\x00{query}"
+
+        query_embedding = None
+        if self.query_cache is not None:
+            query_embedding = self.query_cache.get(key)
+            if query_embedding is None and self.query_cache_disk is not None:
+                query_embedding = self.query_cache_disk.get(key)
+                if query_embedding is not None:
+                    self.query_cache.set(key, query_embedding)
+
+        if query_embedding is None:
+            with span("rag.embed", model=self.embedding_model):
+                query_embedding = np.ascontiguousarray(self.model.encode([query]), dtype='float32')
+            # Normalize for cosine similarity
+            faiss.normalize_L2(query_embedding)
+
+            if self.query_cache is not None:
+                self.query_cache.set(key, query_embedding)
+                if self.query_cache_disk is not None:
+                    self.query_cache_disk.set(key, query_embedding)
+
+        return query_embedding
+
+    def get_context_for_query(self, query: str, max_context_length: int = 2000, n_results: int = 5,
+                              min_score: Optional[float] = None) -> str:
         """
         Get relevant context for a query, formatted for LLM consumption.
 
         Args:
             query: The user's query
             max_context_length: Maximum length of context to return
+            n_results: Maximum number of chunks to include
+            min_score: Skip chunks below this cosine similarity (defaults to self.min_score)
 
         Returns:
             Formatted context string
         """
-        search_results = self.search(query, n_results=5)
+        search_results = self.search(query, n_results=n_results, min_score=min_score)
 
         if not search_results or "error" in search_results[0]:
             return "No relevant context found."
@@ -255,213 +860,466 @@ class SimpleRAGSystem:
 
     def list_documents(self) -> List[Dict[str, Any]]:
         """List all documents in the RAG system with their metadata."""
-        doc_info = {}
-
-        # Group chunks by document ID
-        for i, meta in enumerate(self.metadata):
-            doc_id = meta.get('doc_id', f'unknown_{i}')
-            if doc_id not in doc_info:
-                doc_info[doc_id] = {
-                    'doc_id': doc_id,
-                    'chunks': 0,
-                    'metadata': meta.copy()
-                }
-                # Remove chunk-specific metadata for display
-                doc_info[doc_id]['metadata'].pop('chunk_id', None)
-                doc_info[doc_id]['metadata'].pop('chunk_index', None)
-
-            doc_info[doc_id]['chunks'] += 1
-
-        return list(doc_info.values())
+        return self.store.list_documents()
 
     def delete_document(self, doc_id: str) -> str:
         """Delete a document and all its chunks from the RAG system."""
         try:
-            # Find indices of chunks belonging to this document
-            indices_to_remove = []
-            for i, meta in enumerate(self.metadata):
-                if meta.get('doc_id') == doc_id:
-                    indices_to_remove.append(i)
-
-            if not indices_to_remove:
+            removed = self._remove_chunks(doc_id)
+            if not removed:
                 return f"Document '{doc_id}' not found"
 
-            # Remove chunks in reverse order to maintain indices
-            for i in sorted(indices_to_remove, reverse=True):
-                del self.documents[i]
-                del self.metadata[i]
+            # Save the updated index
+            self.save_index(force=True)
 
-            # Rebuild the FAISS index
-            self._rebuild_index()
-
-            # Save the updated data
-            self.save_index()
-
-            return f"Successfully deleted document '{doc_id}' ({len(indices_to_remove)} chunks)"
+            return f"Successfully deleted document '{doc_id}' ({removed} chunks)"
 
         except Exception as e:
             return f"Error deleting document '{doc_id}': {str(e)}"
 
-    def _rebuild_index(self):
-        """Rebuild the FAISS index from current documents."""
-        if not self.documents:
-            # Create empty index if no documents
+    def upsert_document(self, text: str, doc_id: str, metadata: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Replace a document (or add it if it doesn't exist yet).
+
+        Only the new document's chunks are embedded; the remaining chunks
+        keep their stored embeddings.
+        """
+        try:
             self._ensure_model_loaded()
-            self.index = faiss.IndexFlatL2(
-                self.embedding_dimension)  # type: ignore
-            return
+            removed = self._remove_chunks(doc_id)
 
-        # Ensure model is loaded
-        self._ensure_model_loaded()
+            chunks, chunk_metadata = self._prepare_chunks(text, doc_id, metadata)
+            self._add_chunks(chunks, chunk_metadata)
 
-        # Create new index
-        self.index = faiss.IndexFlatL2(
-            self.embedding_dimension)  # type: ignore
+            self.save_index(force=True)
+            action = "Replaced" if removed else "Added"
+            return f"{action} document '{doc_id}' with {len(chunks)} chunks"
 
-        # Generate embeddings for all documents
-        embeddings = self.model.encode(self.documents)
-        # Normalize for cosine similarity
-        faiss.normalize_L2(embeddings)  # type: ignore
-        # Add to index
-        self.index.add(embeddings.astype('float32'))  # type: ignore
+        except Exception as e:
+            return f"Error updating document '{doc_id}': {str(e)}"
+
+    def _remove_chunks(self, doc_id: str) -> int:
+        """Remove all chunks of a document from the store and the index. Returns the number removed."""
+        ids = self.store.delete_document(doc_id)
+        if not len(ids):
+            return 0
+        self._num_chunks -= len(ids)
+
+        if self.index is not None and not self._index_dirty:
+            self._ensure_index_writable()
+            try:
+                # Drop the vectors by ID - no re-encoding, no rebuild
+                self.index.remove_ids(ids)
+            except RuntimeError:
+                # HNSW can't remove vectors; rebuild it from the stored embeddings
+                self._rebuild_index()
+        return len(ids)
 
-    def _chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
+    def _rebuild_index(self):
+        """Rebuild (and train, if needed) the FAISS index from the stored embeddings."""
+        with self._ready_lock:
+            if self.embedding_dimension is None:
+                self._ensure_model_loaded()
+            _lazy_imports()
+
+            ids, embeddings = self.store.load_embeddings()
+            n = len(ids)
+
+            # Create new index
+            self.active_index_type = self._resolve_index_type(n)
+            self.active_metric = self.metric
+            self.index = self._build_index(self.active_index_type, embeddings if n else None, ids)
+            self._index_mmapped = False
+            self._indexed_max_id = int(ids[-1]) if n else self.store.max_id()
+            self._trained_on = n if self.active_index_type in ("ivf_flat", "ivf_pq") else 0
+            self._num_chunks = n
+            self._index_dirty = False
+            self._unsaved_chunks += max(n, 1)
+
+    def build_index(self, index_type: Optional[str] = None) -> str:
         """
-        Split text into overlapping chunks.
+        Switch to another index backend and train/rebuild it from the stored
+        embeddings (the embedding model is not needed).
 
         Args:
-            text: Input text to chunk
-            chunk_size: Target size of each chunk
-            overlap: Number of characters to overlap between chunks
+            index_type: New backend; keeps the current setting if not given
+        """
+        try:
+            if index_type is not None:
+                if index_type not in INDEX_TYPES:
+                    return f"Error: unknown index_type '{index_type}'"
+                self.index_type = index_type
 
-        Returns:
-            List of text chunks
+            start_time = time.perf_counter()
+            self._rebuild_index()
+            self.save_index(force=True)
+            elapsed = time.perf_counter() - start_time
+            return (f"Built {self.active_index_type} index with {self._num_chunks} chunks "
+                    f"in {elapsed:.2f}s")
+
+        except Exception as e:
+            return f"Error building index: {str(e)}"
+
+    def _resolve_index_type(self, n: int, index_type: Optional[str] = None) -> str:
+        """
+        Decide which backend to build for n vectors. "auto" grows from flat to
+        HNSW to IVF-PQ, and IVF backends fall back when there is too little
+        data to train them.
+        """
+        index_type = index_type or self.index_type
+        if index_type == "auto":
+            if n < AUTO_HNSW_MIN_CHUNKS:
+                index_type = "flat"
+            elif n < AUTO_IVF_PQ_MIN_CHUNKS:
+                index_type = "hnsw"
+            else:
+                index_type = "ivf_pq"
+
+        # PQ needs 256 centroids per sub-quantizer, IVF needs a few points per list
+        if index_type == "ivf_pq" and n < 256 * 39:
+            index_type = "ivf_flat"
+        if index_type == "ivf_flat" and n < 39 * 4:
+            index_type = "flat"
+        return index_type
+
+    def _create_index(self, index_type: str, n: int):
+        """Create an empty FAISS index of the given type, sized for n vectors."""
+        d = self.embedding_dimension
+        cosine = self.metric == "cosine"
+        metric_type = faiss.METRIC_INNER_PRODUCT if cosine else faiss.METRIC_L2
+
+        if index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(d, 32, metric_type)
+            index.hnsw.efConstruction = 40
+            # Map FAISS vector IDs to chunk IDs
+            return faiss.IndexIDMap2(index)
+
+        if index_type in ("ivf_flat", "ivf_pq"):
+            # Rule of thumb: about 4 * sqrt(n) lists with at least 39 training points each
+            nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+            quantizer = faiss.IndexFlatIP(d) if cosine else faiss.IndexFlatL2(d)
+            if index_type == "ivf_pq":
+                # Largest sub-quantizer count (<= d / 4) that divides the dimension
+                m = next(m for m in range(max(1, d // 4), 0, -1) if d % m == 0)
+                return faiss.IndexIVFPQ(quantizer, d, nlist, m, 8, metric_type)
+            return faiss.IndexIVFFlat(quantizer, d, nlist, metric_type)
+
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(d) if cosine else faiss.IndexFlatL2(d))
+
+    def _build_index(self, index_type: str, embeddings: Optional[np.ndarray], ids: Optional[np.ndarray] = None):
+        """Create an index, train it on the embeddings and add them with their chunk IDs."""
+        n = 0 if embeddings is None else len(embeddings)
+        index = self._create_index(index_type, n)
+        if n:
+            if not index.is_trained:
+                index.train(embeddings)
+            index.add_with_ids(embeddings, ids if ids is not None else np.arange(n, dtype='int64'))
+        return index
+
+    def _set_search_params(self, index, nprobe: int, ef_search: int):
+        """Apply query-time search parameters to an index."""
+        if hasattr(index, "id_map"):
+            # Look through the ID map to the real index
+            index = faiss.downcast_index(index.index)
+        if hasattr(index, "nprobe"):
+            index.nprobe = nprobe
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = ef_search
+
+    def _to_similarity(self, raw_scores: np.ndarray) -> np.ndarray:
+        """
+        Convert raw FAISS scores to cosine similarity. Vectors are normalized,
+        so a squared L2 distance d equals 2 - 2 * cos.
+        """
+        if self.active_metric == "l2":
+            return 1.0 - raw_scores / 2.0
+        return raw_scores
+
+    def _needs_rebuild(self) -> bool:
+        """Check whether the index should be (re)built for the current number of chunks."""
+        n = self._num_chunks
+        if self._resolve_index_type(n) != self.active_index_type or self.metric != self.active_metric:
+            return True
+        # Retrain IVF centroids once the corpus has grown a lot since training
+        return self._trained_on > 0 and n > 4 * self._trained_on
+
+    def _refresh_index(self):
+        """Make sure the index is trained and contains every stored chunk."""
+        if not self._index_dirty:
+            return
+        with self._ready_lock:
+            if self._index_dirty:
+                print(f"Building {self._resolve_index_type(self._num_chunks)} index "
+                      f"on {self._num_chunks} chunks")
+                self._rebuild_index()
+
+    def evaluate_index(self, index_types: Optional[List[str]] = None, n_queries: int = 100,
+                       k: int = 10, nprobe_values: Optional[List[int]] = None,
+                       ef_search_values: Optional[List[int]] = None) -> List[Dict[str, Any]]:
         """
-        if len(text) <= chunk_size:
-            return [text]
+        Compare approximate backends against exact (flat) search on the stored
+        embeddings and report recall@k and query latency for each setting.
 
-        chunks = []
-        start = 0
+        Stored chunk embeddings are used as queries, so the model is not needed.
 
-        while start < len(text):
-            end = start + chunk_size
+        Args:
+            index_types: Backends to try (default: all approximate backends)
+            n_queries: Number of sampled queries
+            k: Number of neighbours compared for recall
+            nprobe_values: nprobe settings to try for IVF backends
+            ef_search_values: efSearch settings to try for HNSW
+
+        Returns:
+            One row per setting with recall@k, average/p95 latency in ms and build time
+        """
+        ids, embeddings = self.store.load_embeddings()
+        if len(ids) == 0:
+            return [{"error": "No stored embeddings to evaluate"}]
+
+        _lazy_imports()
+        index_types = index_types or ["ivf_flat", "ivf_pq", "hnsw"]
+        nprobe_values = nprobe_values or [1, 4, 16, 64]
+        ef_search_values = ef_search_values or [16, 64, 256]
+        k = min(k, len(embeddings))
+
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)
+        queries = embeddings[sample]
+
+        def run(index, label, params):
+            latencies = []
+            found = []
+            for q in queries:
+                t0 = time.perf_counter()
+                _, ids = index.search(q.reshape(1, -1), k)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                found.append(ids[0])
+            recall = float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+            row = {"index_type": label, **params, "recall_at_k": round(recall, 4),
+                   "avg_ms": round(float(np.mean(latencies)), 3),
+                   "p95_ms": round(float(np.percentile(latencies, 95)), 3)}
+            return row, found
+
+        # Exact results from a flat index are the ground truth
+        t0 = time.perf_counter()
+        flat = self._build_index("flat", embeddings, ids)
+        flat_build = time.perf_counter() - t0
+        truth = [ids for ids in flat.search(queries, k)[1]]
+        row, _ = run(flat, "flat", {})
+        row["build_s"] = round(flat_build, 2)
+        report = [row]
+
+        for index_type in index_types:
+            actual = self._resolve_index_type(len(embeddings), index_type)
+            if actual != index_type:
+                report.append({"index_type": index_type,
+                               "error": f"not enough chunks to train (would use {actual})"})
+                continue
 
-            # Try to end at a sentence boundary
-            if end < len(text):
-                # Look for sentence endings near the chunk boundary
-                for i in range(end, max(start + chunk_size - 100, start), -1):
-                    if text[i] in '.!?':
-                        end = i + 1
-                        break
+            t0 = time.perf_counter()
+            index = self._build_index(index_type, embeddings, ids)
+            build_s = round(time.perf_counter() - t0, 2)
+
+            if index_type == "hnsw":
+                settings = [{"ef_search": ef} for ef in ef_search_values]
+            else:
+                settings = [{"nprobe": p} for p in nprobe_values]
+
+            for params in settings:
+                self._set_search_params(index, params.get("nprobe", self.nprobe),
+                                        params.get("ef_search", self.ef_search))
+                row, _ = run(index, index_type, params)
+                row["build_s"] = build_s
+                report.append(row)
+
+        print(f"{'index':<10}{'setting':<16}{'recall@' + str(k):>10}{'avg ms':>10}{'p95 ms':>10}")
+        for row in report:
+            setting = ", ".join(f"{key}={row[key]}" for key in ("nprobe", "ef_search") if key in row)
+            if "error" in row:
+                print(f"{row['index_type']:<10}{row['error']}")
+            else:
+                print(f"{row['index_type']:<10}{setting:<16}{row['recall_at_k']:>10.3f}"
+                      f"{row['avg_ms']:>10.3f}{row['p95_ms']:>10.3f}")
+
+        return report
 
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
+    def _chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
+        """
+        Split text into overlapping chunks with the configured chunker.
+        chunk_size/overlap (characters) only apply to the "char" chunker.
+        """
+        token_chunker = self._get_token_chunker()
+        if token_chunker is not None:
+            return token_chunker.chunk(text)
+        return chunk_text(text, chunk_size, overlap)
 
-            start = end - overlap
+    def _get_token_chunker(self) -> Optional[TokenChunker]:
+        """Create the token chunker from the loaded model (None for the "char" chunker)."""
+        if self.chunker != "token":
+            return None
 
-            # Prevent infinite loops
-            if start >= end:
-                start = end
+        if self._token_chunker is None:
+            self._ensure_model_loaded()
+            try:
+                # Leave room for the special tokens the model adds
+                max_tokens = self.chunk_tokens or self.model.max_seq_length - 2
+                self._token_chunker = TokenChunker(self.model.tokenizer, max_tokens, self.chunk_overlap)
+            except Exception as e:
+                print(f"Token chunker unavailable ({e}), using character chunks")
+                self.chunker = "char"
+        return self._token_chunker
+
+    def _chunker_config(self) -> Optional[Tuple[str, int, int]]:
+        """
+        Settings needed to rebuild the token chunker inside a worker process.
+        Workers load the tokenizer the model here already uses (its local path
+        when known), not whatever the model name resolves to in their process.
+        """
+        token_chunker = self._get_token_chunker()
+        if token_chunker is None:
+            return None
+        tokenizer_name = getattr(token_chunker.tokenizer, "name_or_path", None) or self.embedding_model
+        return (tokenizer_name, token_chunker.max_tokens, token_chunker.overlap)
 
-        return chunks
+    def save_index(self, force: bool = False):
+        """
+        Save the FAISS index and its settings to disk.
 
-    def save_index(self):
-        """Save the FAISS index and metadata to disk."""
+        Chunks are already stored when they are added, so the index is only a
+        cache of the stored embeddings. Unless ``force`` is set, it is written
+        at most every ``index_save_interval`` seconds; chunks that are missing
+        from the saved index are added back by load_index.
+        """
         try:
-            if self.index is not None:
-                # Save FAISS index
-                index_path = self.data_dir / "faiss_index.bin"
-                faiss.write_index(self.index, str(index_path))
+            if self.index is None:
+                return
+            self._refresh_index()
 
-            # Save documents and metadata
-            data_path = self.data_dir / "documents.pkl"
-            with open(data_path, 'wb') as f:
-                pickle.dump({
-                    'documents': self.documents,
-                    'metadata': self.metadata,
-                    'embedding_dimension': self.embedding_dimension,
-                    'embedding_model': self.embedding_model
-                }, f)
+            elapsed = time.monotonic() - self._last_index_save
+            if not force and (self._unsaved_chunks == 0 or elapsed < self.index_save_interval):
+                return
+
+            # Save FAISS index
+            index_path = self.data_dir / "faiss_index.bin"
+            faiss.write_index(self.index, str(index_path))
+
+            self.store.set_info(
+                embedding_model=self.embedding_model,
+                embedding_dimension=self.embedding_dimension,
+                index_type=self.active_index_type,
+                metric=self.active_metric,
+                trained_on=self._trained_on,
+                indexed_max_id=self._indexed_max_id
+            )
+            self._unsaved_chunks = 0
+            self._last_index_save = time.monotonic()
 
         except Exception as e:
             print(f"Error saving index: {e}")
 
     def load_index(self):
-        """Load the FAISS index and metadata from disk."""
+        """
+        Open the chunk store and load the FAISS index from disk.
+
+        The index is memory-mapped when FAISS supports it, and chunk texts stay
+        on disk until a search needs them, so startup doesn't read the corpus.
+        """
         try:
             index_path = self.data_dir / "faiss_index.bin"
             data_path = self.data_dir / "documents.pkl"
 
-            if data_path.exists():
-                # Load documents and metadata
-                with open(data_path, 'rb') as f:
-                    data = pickle.load(f)
-                    self.documents = data.get('documents', [])
-                    self.metadata = data.get('metadata', [])
-                    self.embedding_dimension = data.get('embedding_dimension')
-                    saved_model = data.get('embedding_model')
-
-                    # Check if model changed
-                    if saved_model != self.embedding_model:
-                        print(
-                            f"Model changed from {saved_model} to {self.embedding_model}")
-                        return
-
-                # Load FAISS index if it exists
-                if index_path.exists() and self.embedding_dimension:
-                    _lazy_imports()
+            # Storage from older versions
+            if data_path.exists() and self.store.count() == 0:
+                self._migrate_pickle_storage(data_path, index_path)
+
+            self._num_chunks = self.store.count()
+            self.embedding_dimension = self.store.get_info("embedding_dimension")
+            saved_model = self.store.get_info("embedding_model")
+
+            # Check if model changed
+            if saved_model is not None and saved_model != self.embedding_model:
+                print(
+                    f"Model changed from {saved_model} to {self.embedding_model}")
+                return
+
+            self.active_index_type = self.store.get_info("index_type", "flat")
+            self.active_metric = self.store.get_info("metric", self.metric)
+            self._trained_on = self.store.get_info("trained_on", 0)
+            self._indexed_max_id = self.store.get_info("indexed_max_id", -1)
+
+            # Load FAISS index if it exists
+            if index_path.exists() and self.embedding_dimension:
+                _lazy_imports()
+                try:
+                    self.index = faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP)
+                    self._index_mmapped = True
+                except RuntimeError:
                     self.index = faiss.read_index(str(index_path))
-                    print(f"Loaded {len(self.documents)} documents from disk")
+                print(f"Loaded {self._num_chunks} chunks from disk")
+
+                if self._needs_rebuild() or not hasattr(self.index, "id_map") and \
+                        self.active_index_type not in ("ivf_flat", "ivf_pq"):
+                    # Settings changed (or an index without chunk IDs from an older version)
+                    self._index_dirty = True
+                elif self.store.max_id() > self._indexed_max_id:
+                    self._sync_index()
+            elif self._num_chunks and self.embedding_dimension:
+                # Chunks were stored but the index was never saved
+                self._index_dirty = True
 
         except Exception as e:
             print(f"Error loading index: {e}")
-            self.documents = []
-            self.metadata = []
+            self.index = None
+            self._num_chunks = self.store.count()
+            self._index_dirty = self._num_chunks > 0
+
+    def _query_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Hit/miss counters of the query embedding cache."""
+        if self.query_cache is None:
+            return None
+        stats = self.query_cache.stats()
+        if self.query_cache_disk is not None:
+            stats["disk"] = self.query_cache_disk.stats()
+        return stats
 
     def get_stats(self) -> Dict[str, Any]:
         """Get statistics about the RAG system."""
-        doc_ids = set()
-        for meta in self.metadata:
-            if 'doc_id' in meta:
-                doc_ids.add(meta['doc_id'])
-
         return {
-            "total_chunks": len(self.documents),
-            "total_documents": len(doc_ids),
+            "total_chunks": self._num_chunks,
+            "total_documents": self.store.count_documents(),
             "embedding_model": self.embedding_model,
             "embedding_dimension": self.embedding_dimension,
             "has_index": self.index is not None,
+            "index_type": self.index_type,
+            "metric": self.metric,
+            "active_index_type": self.active_index_type,
+            "nprobe": self.nprobe,
+            "ef_search": self.ef_search,
+            "index_mmapped": self._index_mmapped,
+            "query_cache": self._query_cache_stats(),
+            "chunker": self.chunker,
             "data_directory": str(self.data_dir)
         }
 
 
-def load_sample_documents(rag_system: SimpleRAGSystem, data_dir: str = "./data"):
+def load_sample_documents(rag_system: SimpleRAGSystem, data_dir: str = "./data", workers: Optional[int] = None):
     """
     Load sample documents into the RAG system for testing.
+    Files are read and chunked in parallel (see SimpleRAGSystem.ingest_files).
     """
     data_path = Path(data_dir)
     if not data_path.exists():
         print(f"Sample data directory {data_dir} not found")
         return
 
-    # Load sample text documents
-    for txt_file in data_path.glob("*.txt"):
-        print(f"Loading {txt_file.name}...")
-        with open(txt_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        rag_system.add_text_document(
-            content,
-            txt_file.stem,
-            {"source_type": "text", "source_path": str(txt_file)}
-        )
-
-    # Load sample PDF documents
-    for pdf_file in data_path.glob("*.pdf"):
-        print(f"Loading {pdf_file.name}...")
-        rag_system.add_pdf_document(str(pdf_file))
+    # Sample text and PDF documents
+    files = sorted(data_path.glob("*.txt")) + sorted(data_path.glob("*.pdf"))
+    report = rag_system.ingest_files(files, workers=workers)
+    for error in report["errors"]:
+        print(f"Error loading {error}")
 
     print("Sample documents loaded!")
+    return report
 
 
 def load_sample_documents_for_demo(rag_system: SimpleRAGSystem, data_dir: str = "./data"):
@@ -538,12 +1396,14 @@ def load_sample_documents_for_demo(rag_system: SimpleRAGSystem, data_dir: str =
         }
     ]
 
-    for doc in sample_docs:
-        rag_system.add_text_document(
-            text=doc["content"],
-            doc_id=doc["id"],
-            metadata={"title": doc["title"], "type": "sample_document"}
-        )
+    rag_system.add_documents(
+        {
+            "text": doc["content"],
+            "doc_id": doc["id"],
+            "metadata": {"title": doc["title"], "type": "sample_document"}
+        }
+        for doc in sample_docs
+    )
 
     return f"Loaded {len(sample_docs)} sample documents into RAG system"
 
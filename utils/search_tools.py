@@ -2,16 +2,164 @@
 Web search utilities for tool calling functionality
 """
 import os
-import requests
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing import List, Dict, Any
+from urllib.parse import urlsplit, parse_qsl, urlencode
 from dotenv import load_dotenv
 
+try:
+    from pythainlp.tokenize import word_tokenize as thai_word_tokenize  # type: ignore
+except ImportError:
+    thai_word_tokenize = None
+
+from .http_session import get_session
+from .metrics import get_histogram, histogram_snapshots
+from .tracing import span, in_current_context
+from .cache import TieredCache, normalize_text
+
 load_dotenv()
 
+# Read timeouts per provider (seconds); connecting may take at most CONNECT_TIMEOUT
+PROVIDER_TIMEOUTS = {
+    "serper": float(os.getenv("SERPER_TIMEOUT", 5)),
+    "tavily": float(os.getenv("TAVILY_TIMEOUT", 8)),
+}
+CONNECT_TIMEOUT = 3.05
+
+# Start the backup provider when the first one is slower than its p95,
+# or after HEDGE_DEFAULT_MS while there are too few samples for a p95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_MS = 1500
+HEDGE_MIN_MS = 200
+
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+
+# Result cache: SQLite file shared by all worker processes ("" = in-process only)
+SEARCH_CACHE_DB = os.getenv("SEARCH_CACHE_DB", "data/search_cache.db")
+
+# Phrases that mean the same search, mapped to one canonical word (longest first)
+QUERY_SYNONYMS = {
+    "เกมมาแรง": "trending", "มาแรง": "trending", "กำลังฮิต": "trending", "trending": "trending",
+    "hot games": "trending", "ยอดนิยม": "popular", "most played": "popular", "popular": "popular",
+    "ขายดี": "bestselling", "best selling": "bestselling", "best sellers": "bestselling",
+    "top sellers": "bestselling", "top games": "bestselling",
+    "ข่าว": "news", "news": "news", "อัปเดต": "update", "อัพเดท": "update", "update": "update",
+    "เกมใหม่": "new", "ออกใหม่": "new", "เปิดตัว": "release", "new release": "release",
+}
+# Words that don't change what is searched for (every question here is about games)
+QUERY_FILLERS = {
+    "the", "a", "an", "what", "what's", "are", "is", "right", "now", "today", "please", "me", "show",
+    "list", "of", "on", "latest", "game", "games", "video",
+    "เกม", "ตอนนี้", "มีอะไรบ้าง", "อะไรบ้าง", "มีอะไร", "บ้าง", "หน่อย", "ครับ", "คะ", "ค่ะ", "นะ", "ๆ", "ล่าสุด",
+}
+# (query class, canonical words that mark it, fresh TTL in seconds)
+QUERY_CLASSES = [
+    ("news", {"news", "update"}, 5 * 60),
+    ("trending", {"trending", "popular", "bestselling", "new", "release"}, 10 * 60),
+    ("general", set(), 60 * 60),
+]
+_PHRASE_MAX_WORDS = 4
+# Thai runs and runs of anything else that is not a space
+_QUERY_TOKEN_RE = re.compile(r"[\u0E00-\u0E7F]+|[^\s\u0E00-\u0E7F]+")
+
+
+def _query_words(query: str) -> List[str]:
+    """Words of a query. Thai has no spaces, so Thai runs are cut with pythainlp when it is installed."""
+    # NFKC splits sara am (ำ) into two characters; put it back so Thai words still match
+    text = normalize_text(query).replace("\u0E4D\u0E32", "\u0E33")
+    words = []
+    for match in _QUERY_TOKEN_RE.finditer(text):
+        token = match.group()
+        if "\u0E00" <= token[0] <= "\u0E7F":
+            if thai_word_tokenize is not None:
+                words.extend(thai_word_tokenize(token, keep_whitespace=False))
+            else:
+                words.append(token)
+        else:
+            token = token.strip("?!.,")
+            if token:
+                words.append(token)
+    return words
+
+
+# Synonyms and fillers by their spaceless form, matched against whole words
+# (or runs of whole words), never inside a longer word
+_QUERY_REPLACEMENTS = dict({w: "" for w in QUERY_FILLERS}, **QUERY_SYNONYMS)
+_QUERY_PHRASES = {"".join(_query_words(k)): v for k, v in _QUERY_REPLACEMENTS.items()}
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key of a query: case, spacing, Thai/English synonyms, filler words
+    and word order are normalized, so "เกมมาแรงตอนนี้" and "Trending games
+    right now" share one entry (Thai needs pythainlp to be split into words).
+    """
+    words = _query_words(query)
+    kept = set()
+    i = 0
+    while i < len(words):
+        # Longest run of words that is a synonym or filler phrase
+        for size in range(min(_PHRASE_MAX_WORDS, len(words) - i), 0, -1):
+            replacement = _QUERY_PHRASES.get("".join(words[i:i + size]))
+            if replacement is not None:
+                if replacement:
+                    kept.add(replacement)
+                i += size
+                break
+        else:
+            kept.add(words[i])
+            i += 1
+    return " ".join(sorted(kept))
+
+
+def classify_query(key: str):
+    """(query class, fresh TTL) of a normalized query."""
+    words = set(key.split())
+    for name, markers, ttl in QUERY_CLASSES:
+        if not markers or words & markers:
+            return name, ttl
+    return QUERY_CLASSES[-1][0], QUERY_CLASSES[-1][2]
+
+
+def normalize_link(link: str) -> str:
+    """Link key for deduplication: no scheme, www., fragment, tracking parameters or trailing slash."""
+    parts = urlsplit(link.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if not k.startswith("utm_")])
+    return f"{host}{parts.path.rstrip('/')}" + (f"?{query}" if query else "")
+
+
+def merge_results(*result_lists: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge result lists in order, dropping errors and duplicate links."""
+    merged = []
+    seen = set()
+    for results in result_lists:
+        for r in results:
+            if "error" in r:
+                continue
+            key = normalize_link(r.get("link", "")) or r.get("title", "")
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(r)
+    return merged
+
+
+def _is_error(results: List[Dict[str, Any]]) -> bool:
+    return bool(results) and all("error" in r for r in results)
+
 
 class WebSearchTool:
     """Web search tool using Serper API"""
 
+    _cache = None
+    _cache_lock = threading.Lock()
+
     def __init__(self):
         self.serper_api_key = os.getenv("SERPER_API_KEY")
         self.tavily_api_key = os.getenv("TAVILY_API_KEY")
@@ -35,7 +183,8 @@ class WebSearchTool:
         }
 
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = get_session().post(url, json=payload, headers=headers,
+                                          timeout=(CONNECT_TIMEOUT, PROVIDER_TIMEOUTS["serper"]))
             response.raise_for_status()
             data = response.json()
             return [
@@ -77,7 +226,8 @@ class WebSearchTool:
         }
 
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = get_session().post(url, json=payload, headers=headers,
+                                          timeout=(CONNECT_TIMEOUT, PROVIDER_TIMEOUTS["tavily"]))
             response.raise_for_status()
 
             data = response.json()
@@ -100,7 +250,7 @@ class WebSearchTool:
     def search_steam(self, query: str, num_results: int = 5):
         """Search games on Steam"""
         try:
-            resp = requests.get(
+            resp = get_session().get(
                 "https://store.steampowered.com/api/storesearch/",
                 params={"term": query, "l": "english", "cc": "us"},
                 timeout=10,
@@ -123,12 +273,113 @@ class WebSearchTool:
     def search(self, query: str, num_results: int = 5, preferred_api: str = "serper"):
         """
         Search using preferred API with fallback
-        """
 
-        """Unified search"""
+        The other configured provider is used when the preferred one fails,
+        and is also started early (hedged) when the preferred one is slower
+        than its usual p95. Results of providers that answered are merged
+        without duplicate links.
+        """
         if preferred_api == "steam":
             return self.search_steam(query, num_results)
-        return self.search_serper(query, num_results)
+
+        # Same question in other words / language -> same cache entry; errors are not cached.
+        # The preferred provider is part of the key: serper and tavily return different results
+        key = normalize_query(query) or normalize_text(query)
+        query_class, ttl = classify_query(key)
+        failed = []
+
+        def fetch():
+            results = self._search_providers(query, num_results, preferred_api)
+            if _is_error(results):
+                failed.extend(results)
+                return None
+            return results
+
+        results = self._get_cache().get_or_fetch(f"{preferred_api}:{num_results}:{key}", fetch, ttl=ttl, stale_ttl=ttl)
+        return results if results is not None else failed
+
+    def _search_providers(self, query: str, num_results: int, preferred_api: str) -> List[Dict[str, Any]]:
+        """Search the providers (preferred first, hedged backup) without the cache."""
+        providers = self._provider_order(preferred_api)
+        if len(providers) < 2:
+            return self._timed_search(providers[0], query, num_results)
+
+        primary, backup = providers[0], providers[1]
+        futures = {_hedge_pool.submit(in_current_context(self._timed_search), primary, query, num_results): primary}
+        deadline = time.monotonic() + CONNECT_TIMEOUT + max(PROVIDER_TIMEOUTS[p] for p in providers) + 1
+
+        done, _ = wait(futures, timeout=self._hedge_delay(primary))
+        first = next(iter(done), None)
+        if first is not None and not _is_error(first.result()):
+            return merge_results(first.result())
+
+        # Primary failed or is slow: start the backup and take whichever succeeds first
+        futures[_hedge_pool.submit(in_current_context(self._timed_search), backup, query, num_results)] = backup
+        pending = set(futures)
+        errors = []
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                results = future.result()
+                if _is_error(results):
+                    errors.extend(results)
+                    continue
+                # Also keep results of the other provider if it is already finished
+                others = [f.result() for f in futures if f is not future and f.done()]
+                return merge_results(results, *others)
+
+        return errors or [{"error": "Search failed: all providers timed out"}]
+
+    def _provider_order(self, preferred_api: str) -> List[str]:
+        """Preferred provider first, then the others that have an API key."""
+        configured = {"serper": bool(self.serper_api_key), "tavily": bool(self.tavily_api_key)}
+        order = [preferred_api] if preferred_api in configured else []
+        order += [p for p in ("serper", "tavily") if p not in order]
+        usable = [p for p in order if configured[p]]
+        # Without any key, call the preferred one anyway so the user sees its error message
+        return usable or order[:1]
+
+    def _timed_search(self, provider: str, query: str, num_results: int) -> List[Dict[str, Any]]:
+        """Run one provider and record its latency."""
+        start = time.perf_counter()
+        with span(f"search.{provider}") as provider_span:
+            if provider == "tavily":
+                results = self.search_tavily(query, num_results)
+            else:
+                results = self.search_serper(query, num_results)
+            if _is_error(results):
+                provider_span.error = str(results[0]["error"])
+        get_histogram(f"search.{provider}").observe((time.perf_counter() - start) * 1000,
+                                                    error=_is_error(results))
+        return results
+
+    @staticmethod
+    def _hedge_delay(provider: str) -> float:
+        """Seconds to wait for a provider before hedging: its p95, once there are enough samples."""
+        histogram = get_histogram(f"search.{provider}")
+        p95 = histogram.percentile(95) if histogram.count >= HEDGE_MIN_SAMPLES else None
+        delay_ms = HEDGE_DEFAULT_MS if p95 is None else max(p95, HEDGE_MIN_MS)
+        return min(delay_ms / 1000, PROVIDER_TIMEOUTS[provider])
+
+    @classmethod
+    def _get_cache(cls) -> TieredCache:
+        with cls._cache_lock:
+            if cls._cache is None:
+                cls._cache = TieredCache(SEARCH_CACHE_DB or None, namespace="web_search", maxsize=1024)
+            return cls._cache
+
+    @classmethod
+    def cache_stats(cls) -> Dict[str, Any]:
+        """Hit rate of the search result cache."""
+        return cls._get_cache().stats()
+
+    @staticmethod
+    def provider_stats() -> Dict[str, Dict[str, Any]]:
+        """Latency histograms (count, errors, p50/p95/p99) per provider."""
+        return histogram_snapshots("search.")
 
 
 def format_search_results(results):
@@ -0,0 +1,164 @@
+"""
+Semantic answer cache for the LLM.
+
+Questions are embedded with the RAG system's sentence-transformers model
+and looked up in a small FAISS inner-product index, so a question that was
+already answered in other words ("elden ring คือเกมแนวอะไร" / "what genre is
+elden ring") is served without a paid completion. Entries are kept apart by
+model, system prompt and the game the question is about, expire after a TTL
+and are evicted least recently used first.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Any
+
+import numpy as np
+
+from .cache import normalize_text
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", 24 * 3600))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 2000))
+
+# Keyword classes (see intent_router) whose answers go out of date quickly
+TIME_SENSITIVE_CLASSES = ("price", "steam", "search", "top_seller")
+
+
+def cache_namespace(model: str, system_prompt: str, game: Optional[str] = None) -> str:
+    """
+    Entries are only shared between requests with the same model, system
+    prompt and game: "is elden ring worth it" and "is dark souls worth it"
+    embed close together but must not share an answer.
+    """
+    digest = hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()[:16]
+    return f"{model}\x00{digest}\x00{normalize_text(game or '')}"
+
+
+class SemanticCache:
+    """
+    Near-duplicate question -> answer cache.
+
+    One FAISS IndexIDMap2(IndexFlatIP) per namespace; embeddings are
+    L2-normalized, so the inner product is the cosine similarity.
+    """
+
+    def __init__(self, encoder: Callable[[str], np.ndarray], threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 maxsize: int = SEMANTIC_CACHE_SIZE, ttl: float = SEMANTIC_CACHE_TTL):
+        """
+        Args:
+            encoder: Text -> normalized float32 embedding of shape (1, dimension)
+            threshold: Minimum cosine similarity for a hit
+            maxsize: Maximum number of cached answers (least recently used are evicted)
+            ttl: Seconds an answer stays valid
+        """
+        self.encoder = encoder
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._indexes: Dict[str, Any] = {}
+        # id -> (namespace, question, answer, expires_at), in LRU order
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def lookup(self, question: str, model: str, system_prompt: str,
+               game: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Cached answer for a question, or None.
+
+        Args:
+            game: Game the question is about (name or appid), if any
+
+        Returns:
+            {"answer", "question" (the cached one), "similarity"} on a hit
+        """
+        embedding = self.encoder(normalize_text(question))
+        namespace = cache_namespace(model, system_prompt, game)
+
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None or index.ntotal == 0:
+                self.misses += 1
+                return None
+
+            scores, ids = index.search(embedding, min(5, index.ntotal))
+            now = time.time()
+            expired = []
+            for score, entry_id in zip(scores[0], ids[0]):
+                if entry_id < 0 or score < self.threshold:
+                    break
+                entry = self._entries.get(int(entry_id))
+                if entry is None:
+                    continue
+                if entry[3] <= now:
+                    expired.append(int(entry_id))
+                    continue
+
+                self._entries.move_to_end(int(entry_id))
+                self._remove(expired)
+                self.hits += 1
+                return {"answer": entry[2], "question": entry[1], "similarity": round(float(score), 3)}
+
+            self._remove(expired)
+            self.misses += 1
+            return None
+
+    def store(self, question: str, answer: str, model: str, system_prompt: str, game: Optional[str] = None):
+        """Cache an answer for a question (game as in lookup)."""
+        import faiss  # type: ignore
+
+        embedding = np.ascontiguousarray(self.encoder(normalize_text(question)), dtype="float32")
+        namespace = cache_namespace(model, system_prompt, game)
+
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatIP(embedding.shape[1]))
+                self._indexes[namespace] = index
+
+            entry_id = self._next_id
+            self._next_id += 1
+            index.add_with_ids(embedding, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = (namespace, question, answer, time.time() + self.ttl)
+
+            if len(self._entries) > self.maxsize:
+                self._remove(list(self._entries)[:len(self._entries) - self.maxsize])
+
+    def bypass(self):
+        """Count a request that skipped the cache on purpose (time-sensitive intent)."""
+        self.bypassed += 1
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._indexes.clear()
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self._entries),
+        }
+
+    def _remove(self, entry_ids):
+        """Drop entries from the LRU and their vectors from FAISS (caller holds the lock)."""
+        by_namespace: Dict[str, list] = {}
+        for entry_id in entry_ids:
+            entry = self._entries.pop(entry_id, None)
+            if entry is not None:
+                by_namespace.setdefault(entry[0], []).append(entry_id)
+        for namespace, ids in by_namespace.items():
+            self._indexes[namespace].remove_ids(np.array(ids, dtype="int64"))
@@ -1,19 +1,75 @@
-import requests
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
 from dotenv import load_dotenv
+
+from .http_session import get_session, request_with_retry, TokenBucket
+from .cache import TieredCache, normalize_text
+from .tracing import traced, record_exception, in_current_context
 load_dotenv()
 
+# แคช Steam: ชื่อเกม→appid แทบไม่เปลี่ยน เก็บนาน / ราคาเปลี่ยนบ่อย เก็บสั้น
+STEAM_CACHE_DB = os.getenv("STEAM_CACHE_DB", "data/steam_cache.db")
+SEARCH_TTL = int(os.getenv("STEAM_SEARCH_TTL", 7 * 86400))
+SEARCH_STALE_TTL = 30 * 86400
+DETAILS_TTL = int(os.getenv("STEAM_DETAILS_TTL", 15 * 60))
+DETAILS_STALE_TTL = 60 * 60
+
+# Steam จำกัด appdetails ไว้ประมาณ 200 request ต่อ 5 นาที ยอมให้ burst ได้สำหรับลิสต์สั้น ๆ
+STEAM_RATE_PER_SEC = float(os.getenv("STEAM_RATE_PER_SEC", 200 / 300))
+STEAM_RATE_BURST = int(os.getenv("STEAM_RATE_BURST", 20))
+STEAM_BULK_WORKERS = 8
+
 class SteamAPI:
     BASE_URL = "https://store.steampowered.com/api/appdetails"
     SEARCH_URL = "https://store.steampowered.com/api/storesearch/"
     FEATURED_URL = "https://store.steampowered.com/api/featuredcategories/"
     API_KEY = os.getenv("STEAM_API_KEY")
-    
+
+    _search_cache = None
+    _details_cache = None
+    _caches_lock = threading.Lock()
+    _rate_limiter = TokenBucket(STEAM_RATE_PER_SEC, STEAM_RATE_BURST)
+    _bulk_pool: Optional[ThreadPoolExecutor] = None
+    _bulk_pool_lock = threading.Lock()
+
+    @classmethod
+    def _caches(cls):
+        """แคช 2 ชั้น (LRU ใน process + SQLite ที่ทุก process ใช้ร่วมกัน) สร้างครั้งแรกที่ใช้"""
+        if cls._details_cache is None:
+            with cls._caches_lock:
+                if cls._details_cache is None:
+                    # สร้างครบทั้งคู่ก่อนค่อยตั้งค่า thread อื่นจะไม่เห็นแคชแค่ตัวเดียว
+                    db_path = STEAM_CACHE_DB or None
+                    search_cache = TieredCache(db_path, namespace="steam_search", maxsize=4096)
+                    details_cache = TieredCache(db_path, namespace="steam_details", maxsize=1024)
+                    cls._search_cache = search_cache
+                    cls._details_cache = details_cache
+        return cls._search_cache, cls._details_cache
+
+    @staticmethod
+    def cache_stats() -> dict:
+        """hit rate ของแคช Steam"""
+        search_cache, details_cache = SteamAPI._caches()
+        return {"search": search_cache.stats(), "details": details_cache.stats()}
+
     @staticmethod
     def search_game(query: str, country: str = "us"):
+        search_cache, _ = SteamAPI._caches()
+        key = f"{country}:{normalize_text(query)}"
+        return search_cache.get_or_fetch(
+            key, lambda: SteamAPI._search_game(query, country),
+            ttl=SEARCH_TTL, stale_ttl=SEARCH_STALE_TTL
+        )
+
+    @staticmethod
+    @traced("steam.search")
+    def _search_game(query: str, country: str = "us"):
         try:
             params = {"term": query, "l": "english", "cc": country}
-            resp = requests.get(SteamAPI.SEARCH_URL, params=params, timeout=10)
+            resp = get_session().get(SteamAPI.SEARCH_URL, params=params, timeout=10)
             resp.raise_for_status()
             data = resp.json()
             if data.get("total", 0) > 0:
@@ -21,19 +77,46 @@ class SteamAPI:
             return None
         except Exception as e:
             print(f"Steam search error: {e}")
+            record_exception(e)
             return None
 
     @staticmethod
     def get_game_details(appid: str):
+        _, details_cache = SteamAPI._caches()
+        return details_cache.get_or_fetch(
+            f"us:{appid}", lambda: SteamAPI._get_game_details(appid),
+            ttl=DETAILS_TTL, stale_ttl=DETAILS_STALE_TTL
+        )
+
+    @staticmethod
+    @traced("steam.appdetails")
+    def _get_game_details(appid: str):
         try:
-            url = f"{SteamAPI.BASE_URL}?appids={appid}&cc=us&l=english"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
+            response = request_with_retry(
+                "GET", SteamAPI.BASE_URL,
+                params={"appids": appid, "cc": "us", "l": "english"},
+                rate_limiter=SteamAPI._rate_limiter, retries=2, timeout=10
+            )
             return response.json()
         except Exception as e:
             print(f"Steam API error: {e}")
+            record_exception(e)
             return None
 
+    @staticmethod
+    def get_games_details(appids: List[str]) -> List[Optional[dict]]:
+        """
+        ดึง appdetails หลายเกมพร้อมกัน (ใช้แคชก่อน ที่เหลือยิงขนานผ่าน session กลาง + rate limit)
+        คืนผลเรียงตาม appids ที่ส่งเข้ามา ตัวที่ดึงไม่ได้เป็น None
+        """
+        if not appids:
+            return []
+        with SteamAPI._bulk_pool_lock:
+            if SteamAPI._bulk_pool is None:
+                SteamAPI._bulk_pool = ThreadPoolExecutor(max_workers=STEAM_BULK_WORKERS, thread_name_prefix="steam")
+        calls = [in_current_context(SteamAPI.get_game_details) for _ in appids]
+        return list(SteamAPI._bulk_pool.map(lambda call, appid: call(appid), calls, appids))
+
     @staticmethod
     def format_steam_info(appid: str, data: dict) -> str:
         try:
@@ -60,14 +143,30 @@ class SteamAPI:
             return f"⚠️ Error formatting data: {e}"
 
     @staticmethod
+    @traced("steam.top_games")
     def get_top_games(count=10):
         """ดึง Top Games จาก Steam"""
         try:
-            resp = requests.get(SteamAPI.FEATURED_URL, timeout=10)
+            resp = get_session().get(SteamAPI.FEATURED_URL, timeout=10)
             resp.raise_for_status()
             data = resp.json()
             top = data.get("top_sellers", {}).get("items", [])[:count]
             return [{"name": g.get("name"), "appid": g.get("id")} for g in top]
         except Exception as e:
             print(f"Steam API error (get_top_games): {e}")
+            record_exception(e)
             return []
+
+    @staticmethod
+    def get_top_games_with_prices(count=10):
+        """Top Games จาก Steam พร้อมราคา (ดึงรายละเอียดทุกเกมพร้อมกันในรอบเดียว)"""
+        games = SteamAPI.get_top_games(count)
+        details = SteamAPI.get_games_details([g["appid"] for g in games])
+
+        for game, data in zip(games, details):
+            app = (data or {}).get(str(game["appid"]), {})
+            game_data = app.get("data", {}) if app.get("success") else {}
+            price = game_data.get("price_overview", {})
+            game["price"] = price.get("final_formatted") or ("Free" if game_data.get("is_free") else "N/A")
+            game["discount_percent"] = price.get("discount_percent", 0)
+        return games
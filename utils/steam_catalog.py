@@ -0,0 +1,382 @@
+"""
+Local Steam catalog index for resolving game names to appids without a
+network call.
+
+Built from a Steam app list dump (JSON from ISteamApps/GetAppList or
+IStoreService/GetAppList). Exact names are a dict lookup; misspelled names
+are found through a trigram index, and common Thai spellings of game names
+are mapped to their English titles first.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Iterable
+
+import numpy as np
+
+try:
+    from pythainlp.transliterate import romanize as thai_romanize  # type: ignore
+except ImportError:
+    thai_romanize = None
+
+from .http_session import get_session
+
+STEAM_CATALOG_PATH = os.getenv("STEAM_CATALOG_PATH", "data/steam_applist.json")
+STORE_APPLIST_URL = "https://api.steampowered.com/IStoreService/GetAppList/v1/"
+
+# Thai spellings and short names -> Steam title
+NAME_ALIASES = {
+    "gta": "Grand Theft Auto V",
+    "gta5": "Grand Theft Auto V",
+    "gtav": "Grand Theft Auto V",
+    "จีทีเอ": "Grand Theft Auto V",
+    "cod": "Call of Duty",
+    "cs2": "Counter-Strike 2",
+    "csgo": "Counter-Strike 2",
+    "counterstrike": "Counter-Strike 2",
+    "เคาเตอร์สไตรค์": "Counter-Strike 2",
+    "pubg": "PUBG: BATTLEGROUNDS",
+    "พับจี": "PUBG: BATTLEGROUNDS",
+    "dota": "Dota 2",
+    "โดต้า": "Dota 2",
+    "rdr2": "Red Dead Redemption 2",
+    "reddead": "Red Dead Redemption 2",
+    "เรดเดด": "Red Dead Redemption 2",
+    "เอลเดนริง": "ELDEN RING",
+    "ไซเบอร์พังค์": "Cyberpunk 2077",
+    "cyberpunk": "Cyberpunk 2077",
+    "พาลเวิลด์": "Palworld",
+    "ฮอลโลว์ไนท์": "Hollow Knight",
+    "สตาร์ฟิลด์": "Starfield",
+    "แบทเทิลฟิลด์": "Battlefield 2042",
+    "apex": "Apex Legends",
+    "เอเพ็กซ์": "Apex Legends",
+    "เอเพกซ์": "Apex Legends",
+    "มอนฮัน": "Monster Hunter: World",
+    "monhun": "Monster Hunter: World",
+    "มายคราฟ": "Minecraft",
+    "เกนชิน": "Genshin Impact",
+    "baldursgate": "Baldur's Gate 3",
+    "bg3": "Baldur's Gate 3",
+    "ดาร์คโซล": "DARK SOULS III",
+    "เซลด้า": "The Legend of Zelda",
+    "เทอราเรีย": "Terraria",
+    "สตาร์ดิววัลเลย์": "Stardew Valley",
+}
+
+# Words that never identify a game on their own
+STOP_WORDS = {
+    "a", "an", "the", "of", "and", "or", "in", "on", "for", "to", "is", "it", "what", "how",
+    "game", "games", "steam", "price", "prices", "sale", "discount", "cost", "buy", "download",
+    "link", "review", "reviews", "top", "best", "new", "news", "update", "play", "free", "pc",
+    "release", "date", "genre", "about", "info", "much", "does", "where", "when", "trending",
+    "popular", "selling", "seller", "sellers", "most", "played", "please", "tell", "me",
+}
+
+LATIN_WORD_RE = re.compile(r"[a-z0-9]+(?:['’][a-z]+)?")
+THAI_RUN_RE = re.compile(r"[\u0E00-\u0E7F]+")
+
+
+def normalize_name(name: str) -> str:
+    """Lookup key of a name: case, width, symbols, spaces and punctuation removed."""
+    name = unicodedata.normalize("NFKC", name).lower().replace("&", "and")
+    return "".join(ch for ch in name if ch.isalnum())
+
+
+def _trigrams(key: str) -> List[str]:
+    padded = f"^{key}$"
+    return list({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+class SteamCatalog:
+    """
+    In-memory name -> appid index over the Steam app list.
+
+    Apps can be added incrementally (refresh from a newer dump or from the
+    Steam API) without rebuilding the index.
+    """
+
+    def __init__(self, path: Optional[str] = STEAM_CATALOG_PATH, refresh_interval: float = 3600):
+        """
+        Args:
+            path: App list JSON dump (None = start empty)
+            refresh_interval: Seconds between checks whether the dump file changed
+        """
+        self.path = Path(path) if path else None
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+
+        self.appids = array("q")        # position -> appid
+        self.names: List[str] = []      # position -> display name
+        self._keys: List[str] = []      # position -> normalized name
+        self._by_key: Dict[str, int] = {}
+        self._by_appid: Dict[int, int] = {}
+        self._postings: Dict[str, array] = {}
+        self._aliases = {normalize_name(k): v for k, v in NAME_ALIASES.items()}
+
+        self.last_modified = 0          # newest change time seen from the Steam API
+        self._file_mtime = 0.0
+        self._checked_at = 0.0
+
+        if self.path is not None and self.path.exists():
+            self.load_file(self.path)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    # ---------- building ----------
+
+    def load_file(self, path: Path) -> int:
+        """Add apps from a JSON dump. Returns the number of new apps."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error loading Steam catalog {path}: {e}")
+            return 0
+
+        if isinstance(data, dict):
+            data_apps = data.get("applist", data.get("response", data)).get("apps", [])
+            self.last_modified = max(self.last_modified, int(data.get("last_modified", 0)))
+        else:
+            data_apps = data
+        self._file_mtime = path.stat().st_mtime
+        return self.add_apps(data_apps)
+
+    def add_apps(self, apps: Iterable[dict]) -> int:
+        """Add or rename apps ({"appid", "name"} dicts). Returns the number of new apps."""
+        added = 0
+        with self._lock:
+            for app in apps:
+                appid = int(app.get("appid", 0))
+                name = (app.get("name") or "").strip()
+                key = normalize_name(name)
+                if not appid or not key:
+                    continue
+
+                position = self._by_appid.get(appid)
+                if position is not None:
+                    if self._keys[position] != key:
+                        # Renamed: the new name is searchable too, the old one still resolves
+                        self.names[position] = name
+                        self._keys[position] = key
+                        self._index_key(key, position)
+                    continue
+
+                position = len(self.names)
+                self.appids.append(appid)
+                self.names.append(name)
+                self._keys.append(key)
+                self._by_appid[appid] = position
+                self._index_key(key, position)
+                added += 1
+        return added
+
+    def _index_key(self, key: str, position: int):
+        current = self._by_key.get(key)
+        # Same name used twice (re-releases, tools): keep the oldest (lowest) appid
+        if current is None or self.appids[position] < self.appids[current]:
+            self._by_key[key] = position
+        for gram in _trigrams(key):
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array("q")
+            postings.append(position)
+
+    # ---------- refresh ----------
+
+    def maybe_refresh(self):
+        """Reload new apps from the dump if the file changed (checked at most every refresh_interval)."""
+        now = time.time()
+        if self.path is None or now - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = now
+        try:
+            if self.path.stat().st_mtime > self._file_mtime:
+                added = self.load_file(self.path)
+                print(f"Steam catalog refreshed: {added} new apps")
+        except OSError:
+            pass
+
+    def refresh_from_steam(self, api_key: str, timeout: float = 30) -> int:
+        """
+        Fetch apps changed since the last refresh from IStoreService/GetAppList
+        and save the updated dump. Returns the number of new apps.
+        """
+        params = {"key": api_key, "max_results": 50000, "include_games": "true"}
+        if self.last_modified:
+            params["if_modified_since"] = self.last_modified
+
+        apps = []
+        last_appid = 0
+        while True:
+            if last_appid:
+                params["last_appid"] = last_appid
+            try:
+                resp = get_session().get(STORE_APPLIST_URL, params=params, timeout=timeout)
+                resp.raise_for_status()
+                data = resp.json().get("response", {})
+            except Exception as e:
+                print(f"Steam catalog refresh error: {e}")
+                break
+
+            page = data.get("apps", [])
+            apps.extend(page)
+            if not data.get("have_more_results") or not page:
+                break
+            last_appid = data.get("last_appid", page[-1]["appid"])
+
+        if not apps:
+            return 0
+        self.last_modified = max([self.last_modified] + [int(a.get("last_modified", 0)) for a in apps])
+        added = self.add_apps(apps)
+        self.save()
+        return added
+
+    def save(self, path: Optional[str] = None):
+        """Write the catalog as an app list dump."""
+        path = Path(path) if path else self.path
+        if path is None:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = {
+                "last_modified": self.last_modified,
+                "applist": {"apps": [{"appid": a, "name": n} for a, n in zip(self.appids, self.names)]},
+            }
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._file_mtime = path.stat().st_mtime
+
+    # ---------- lookup ----------
+
+    def resolve(self, name: str, min_score: float = 0.6) -> Optional[Tuple[int, str]]:
+        """Best (appid, name) for a game name, or None."""
+        results = self.lookup(name, limit=1, min_score=min_score)
+        return (results[0][0], results[0][1]) if results else None
+
+    def lookup(self, name: str, limit: int = 5, min_score: float = 0.5) -> List[Tuple[int, str, float]]:
+        """
+        Find apps by name, tolerant to typos, spacing and Thai spellings.
+
+        Returns:
+            Up to limit (appid, name, score) tuples, best first (score 1.0 = exact)
+        """
+        self.maybe_refresh()
+        key = normalize_name(name)
+        if not key:
+            return []
+        key = normalize_name(self._aliases.get(key, key))
+
+        position = self._by_key.get(key)
+        if position is not None:
+            return [(int(self.appids[position]), self.names[position], 1.0)]
+
+        if THAI_RUN_RE.search(key) and thai_romanize is not None:
+            key = normalize_name(thai_romanize(name))
+            position = self._by_key.get(key)
+            if position is not None:
+                return [(int(self.appids[position]), self.names[position], 1.0)]
+
+        return self._fuzzy(key, limit, min_score)
+
+    def find_in_text(self, text: str, min_score: float = 0.7, min_words: int = 1) -> Optional[Tuple[int, str]]:
+        """
+        Find a game mentioned anywhere in a user message.
+
+        Tries aliases (incl. Thai), then exact names over word windows (longest
+        first), then fuzzy names for windows of two or more words.
+
+        Args:
+            min_words: Fewest words in both the matched text and the app name
+                (aliases always count). Use 2 when nothing else says the
+                message is about games: plenty of apps are named after one
+                everyday word ("Dinner", "Homework")
+        """
+        self.maybe_refresh()
+        normalized = unicodedata.normalize("NFKC", text).lower()
+
+        compact = normalize_name(normalized)
+        for alias in sorted(self._aliases, key=len, reverse=True):
+            if alias in compact and (not alias.isascii() or re.search(rf"\b{re.escape(alias)}\b", normalized)):
+                found = self.resolve(self._aliases[alias])
+                if found:
+                    return found
+
+        words = LATIN_WORD_RE.findall(normalized)
+        windows = []
+        for size in range(min(6, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                window = words[start:start + size]
+                # A name doesn't start (except "the") or end with a filler word of the question
+                if (window[0] in STOP_WORDS and window[0] != "the") or window[-1] in STOP_WORDS:
+                    continue
+                if size < min_words:
+                    continue
+                if size == 1 and (len(window[0]) < 4 or window[0].isdigit()):
+                    continue
+                windows.append(window)
+
+        for window in windows:
+            position = self._by_key.get(normalize_name("".join(window)))
+            if position is not None and self._name_words(self.names[position]) >= min_words:
+                return int(self.appids[position]), self.names[position]
+
+        for window in windows:
+            if not 2 <= len(window) <= 4:
+                continue
+            results = self._fuzzy(normalize_name("".join(window)), 1, min_score)
+            # "my homework" is close to "Homework": the name has to be long enough too
+            if results and self._name_words(results[0][1]) >= min_words:
+                return results[0][0], results[0][1]
+        return None
+
+    @staticmethod
+    def _name_words(name: str) -> int:
+        return len(LATIN_WORD_RE.findall(unicodedata.normalize("NFKC", name).lower()))
+
+    def _fuzzy(self, key: str, limit: int, min_score: float) -> List[Tuple[int, str, float]]:
+        """Trigram (Dice) similarity search."""
+        grams = _trigrams(key)
+        with self._lock:
+            # Copy the postings while add_apps can't append: appending to an array
+            # that np.frombuffer is viewing raises BufferError in the refresh
+            postings = [np.frombuffer(self._postings[g], dtype=np.int64) for g in grams if g in self._postings]
+            if not postings:
+                return []
+            candidates = np.concatenate(postings)
+            del postings
+        counts = np.bincount(candidates)
+        # Only names sharing enough trigrams can reach min_score
+        need = max(1, int(np.ceil(min_score * len(grams) / 2)))
+        positions = np.nonzero(counts >= need)[0]
+        if len(positions) == 0:
+            return []
+
+        lengths = np.array([len(self._keys[p]) for p in positions])
+        scores = 2 * counts[positions] / (len(grams) + lengths)
+        order = np.argsort(-scores, kind="stable")[:limit]
+        return [(int(self.appids[positions[i]]), self.names[positions[i]], round(float(scores[i]), 3))
+                for i in order if scores[i] >= min_score]
+
+
+_catalog: Optional[SteamCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> SteamCatalog:
+    """Process-wide catalog, loaded from STEAM_CATALOG_PATH on first use (empty if missing)."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = SteamCatalog(STEAM_CATALOG_PATH)
+    return _catalog
@@ -0,0 +1,193 @@
+"""
+Token-aware text chunking for the RAG system.
+
+Chunks are measured in tokens of the embedding model's own tokenizer, so no
+chunk is longer than the model can embed (the rest would be silently cut
+off). Chunk ends are moved back to the nearest paragraph, sentence or word
+boundary, including Thai text which has no sentence punctuation.
+"""
+
+import re
+from typing import List, Tuple, Iterable, Iterator, Optional
+
+import numpy as np
+
+try:
+    from pythainlp.tokenize import word_tokenize as thai_word_tokenize  # type: ignore
+except ImportError:
+    thai_word_tokenize = None
+
+# Boundary strength: a chunk prefers to end at the strongest boundary
+# available in the second half of its token window
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+SENTENCE_RE = re.compile(
+    r"[.!?…。]+[\"')\]]*\s+"    # punctuation followed by whitespace
+    r"|\n"                       # line breaks
+    r"|(?<=[\u0E00-\u0E7F])\s+(?=[\u0E00-\u0E7F])"  # spaces between Thai text (sentence breaks)
+)
+WORD_RE = re.compile(r"\s+")
+THAI_RUN_RE = re.compile(r"[\u0E00-\u0E7F]{2,}")
+
+
+class TokenChunker:
+    """
+    Split text into overlapping chunks of at most ``max_tokens`` tokens.
+
+    Needs a Hugging Face "fast" tokenizer (returns offset mappings), for
+    example ``SentenceTransformer(...).tokenizer``.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int = 254, overlap: int = 32, min_fill: float = 0.5):
+        """
+        Args:
+            tokenizer: Fast tokenizer of the embedding model
+            max_tokens: Maximum tokens per chunk (without special tokens)
+            overlap: Tokens shared between consecutive chunks
+            min_fill: A chunk may end at a boundary only after this fraction of max_tokens
+        """
+        if not getattr(tokenizer, "is_fast", False):
+            raise ValueError("TokenChunker needs a fast tokenizer with offset mapping")
+        if overlap >= max_tokens:
+            raise ValueError("overlap must be smaller than max_tokens")
+
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.min_fill = min_fill
+
+    @classmethod
+    def for_model(cls, model_name: str, max_tokens: Optional[int] = None, overlap: int = 32) -> "TokenChunker":
+        """
+        Build a chunker for a SentenceTransformer model name without loading
+        the model itself (used by ingestion worker processes).
+        """
+        from transformers import AutoTokenizer  # type: ignore
+
+        # SentenceTransformer resolves short names under sentence-transformers/
+        name = model_name
+        if "/" not in name and not re.match(r"^[.~]", name):
+            name = f"sentence-transformers/{name}"
+        tokenizer = AutoTokenizer.from_pretrained(name)
+
+        if max_tokens is None:
+            max_tokens = min(tokenizer.model_max_length, 512) - 2  # room for [CLS]/[SEP]
+        return cls(tokenizer, max_tokens=max_tokens, overlap=overlap)
+
+    def chunk(self, text: str) -> List[str]:
+        """Split text into chunks."""
+        return [text[start:end] for start, end in self.chunk_spans(text)]
+
+    def chunk_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Split text into chunks and return their (start, end) character offsets."""
+        if not text.strip():
+            return []
+
+        encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                                  return_attention_mask=False, return_token_type_ids=False,
+                                  verbose=False)
+        offsets = np.asarray(encoding["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+        n = len(offsets)
+        if n == 0:
+            return []
+        if n <= self.max_tokens:
+            return [(int(offsets[0, 0]), int(offsets[-1, 1]))]
+
+        # Boundaries as token positions: a chunk may end right before token k
+        token_ends = offsets[:, 1]
+        levels = [self._boundary_tokens(positions, token_ends)
+                  for positions in self._boundary_positions(text)]
+
+        spans = []
+        start = 0
+        min_length = max(1, int(self.max_tokens * self.min_fill))
+        while start < n:
+            end = min(start + self.max_tokens, n)
+            if end < n:
+                end = self._best_end(levels, start + min_length, end)
+
+            spans.append((int(offsets[start, 0]), int(offsets[end - 1, 1])))
+            if end >= n:
+                break
+            # Step back by the overlap (starting at a word if possible), but always move forward
+            next_start = end - self.overlap
+            words = levels[-1]
+            i = np.searchsorted(words, next_start)
+            if i < len(words) and words[i] < end:
+                next_start = int(words[i])
+            start = max(next_start, start + 1)
+
+        return spans
+
+    def iter_chunks(self, blocks: Iterable[str], buffer_chars: int = 200_000) -> Iterator[str]:
+        """
+        Chunk a stream of text blocks (e.g. lines or file reads) without
+        holding the whole text in memory.
+
+        Args:
+            blocks: Pieces of one continuous text, in order
+            buffer_chars: How much text to tokenize at a time
+        """
+        buffer = ""
+        for block in blocks:
+            buffer += block
+            if len(buffer) < buffer_chars:
+                continue
+
+            spans = self.chunk_spans(buffer)
+            if len(spans) < 2:
+                continue
+            # The last chunk may continue in the next block; keep it (and the overlap) buffered
+            for start, end in spans[:-1]:
+                yield buffer[start:end]
+            buffer = buffer[spans[-1][0]:]
+
+        for start, end in self.chunk_spans(buffer):
+            yield buffer[start:end]
+
+    def iter_file_chunks(self, path: str, read_size: int = 1 << 20) -> Iterator[str]:
+        """Stream chunks from a UTF-8 text file of any size."""
+        def read_blocks():
+            with open(path, "r", encoding="utf-8") as f:
+                while True:
+                    block = f.read(read_size)
+                    if not block:
+                        return
+                    yield block
+
+        yield from self.iter_chunks(read_blocks())
+
+    def _boundary_positions(self, text: str) -> List[np.ndarray]:
+        """Character positions where a chunk may end, strongest boundaries first."""
+        paragraphs = [m.end() for m in PARAGRAPH_RE.finditer(text)]
+        sentences = [m.end() for m in SENTENCE_RE.finditer(text)]
+        words = [m.end() for m in WORD_RE.finditer(text)]
+
+        # Thai writes words without spaces; use a word segmenter when installed
+        if thai_word_tokenize is not None:
+            for match in THAI_RUN_RE.finditer(text):
+                position = match.start()
+                for word in thai_word_tokenize(match.group(), keep_whitespace=False):
+                    found = text.find(word, position, match.end())
+                    if found < 0:
+                        break
+                    position = found + len(word)
+                    words.append(position)
+
+        return [np.unique(np.asarray(positions, dtype=np.int64))
+                for positions in (paragraphs, sentences, words)]
+
+    @staticmethod
+    def _boundary_tokens(positions: np.ndarray, token_ends: np.ndarray) -> np.ndarray:
+        """Convert character boundaries to token positions (number of tokens before the boundary)."""
+        if len(positions) == 0:
+            return positions
+        return np.unique(np.searchsorted(token_ends, positions, side="right"))
+
+    @staticmethod
+    def _best_end(levels: List[np.ndarray], low: int, high: int) -> int:
+        """Last boundary in [low, high] from the strongest level that has one, else high."""
+        for boundaries in levels:
+            i = np.searchsorted(boundaries, high, side="right") - 1
+            if i >= 0 and boundaries[i] >= low:
+                return int(boundaries[i])
+        return high
@@ -0,0 +1,73 @@
+"""
+Run several tool lookups (Steam, web search, RAG, ...) at the same time,
+each with its own deadline.
+
+The wait is as long as the slowest tool that finishes in time, not the sum
+of all of them. A tool that misses its deadline is reported as late and its
+result is dropped; it keeps running in the background, so the caches it
+fills are still warm for the next question.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .tracing import span, in_current_context
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    """Process-wide thread pool for tool calls."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tool")
+    return _executor
+
+
+def run_tools(tasks: Dict[str, Tuple[Callable[[], Any], float]],
+              executor: Optional[ThreadPoolExecutor] = None) -> Dict[str, Any]:
+    """
+    Start all tasks at once and collect the results that arrive in time.
+
+    Args:
+        tasks: name -> (function without arguments, deadline in ms from now)
+        executor: Thread pool to use (default: the shared tool pool)
+
+    Returns:
+        Dict with "results" (name -> value, only tools that finished in time
+        without error), "late" (names past their deadline), "errors"
+        (name -> message) and "timings_ms" (name -> duration of finished tools)
+    """
+    executor = executor or get_tool_executor()
+    start = time.perf_counter()
+    finished_at: Dict[str, float] = {}
+
+    def timed(name, fn):
+        try:
+            with span(f"tool.{name}"):
+                return fn()
+        finally:
+            finished_at[name] = time.perf_counter()
+
+    futures = {name: executor.submit(in_current_context(timed), name, fn) for name, (fn, _) in tasks.items()}
+
+    report = {"results": {}, "late": [], "errors": {}, "timings_ms": {}}
+    # Wait in deadline order, so each wait only covers the time left for that tool
+    for name in sorted(tasks, key=lambda n: tasks[n][1]):
+        remaining = tasks[name][1] / 1000 - (time.perf_counter() - start)
+        try:
+            report["results"][name] = futures[name].result(timeout=max(remaining, 0))
+        except FutureTimeout:
+            report["late"].append(name)
+            continue
+        except Exception as e:
+            report["errors"][name] = str(e)
+        report["timings_ms"][name] = round((finished_at.get(name, time.perf_counter()) - start) * 1000)
+
+    report["total_ms"] = round((time.perf_counter() - start) * 1000)
+    return report
@@ -0,0 +1,249 @@
+"""
+Request-level tracing for the chat pipeline.
+
+A span times one stage (gatekeeper, tool calls, Steam, web search, RAG,
+LLM, ...). Spans nest through a contextvar, so a span opened inside another
+becomes its child without passing anything around; work handed to a thread
+pool keeps its parent when submitted through in_current_context().
+
+Every finished span is also recorded in a "stage.<name>" latency histogram
+(utils/metrics), which gives p50/p95/p99 per stage. Finished traces can be
+written as OpenTelemetry (OTLP/JSON) lines to TRACE_EXPORT_PATH.
+"""
+
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import get_histogram, histogram_snapshots
+
+# One OTLP/JSON object per line, per finished trace ("" = do not export)
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "gamechatproject")
+# Recent traces kept in memory for the debug panel
+TRACE_KEEP = 200
+
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed stage. Use as a context manager (see span()) or call end().
+
+    Exceptions that leave the with-block mark the span as an error and are
+    re-raised; errors that the code handles itself can be attached with
+    record_exception().
+    """
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._start = time.perf_counter()
+        self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = (self.end_ns - self.start_ns) / 1e6 if self.end_ns else (time.perf_counter() - self._start) * 1000
+        return round(end, 1)
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException):
+        """Mark the span as failed."""
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        """Stop the clock, record the stage latency and hand the span to the trace store."""
+        if self.end_ns is not None:
+            return
+        elapsed = time.perf_counter() - self._start
+        self.end_ns = self.start_ns + int(elapsed * 1e9)
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        get_histogram(f"stage.{self.name}").observe(elapsed * 1000, error=self.error is not None)
+        _finish(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and isinstance(exc, Exception):
+            self.record_exception(exc)
+        self.end()
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": self.duration_ms,
+            "error": self.error,
+            "attributes": dict(self.attributes),
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """The span in OTLP/JSON form (ids as hex, times as strings of unix nanoseconds)."""
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        return otlp
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def to_otlp_json(spans: List[Span]) -> Dict[str, Any]:
+    """OTLP/JSON ExportTraceServiceRequest for a list of spans."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_otlp_attribute("service.name", TRACE_SERVICE_NAME)]},
+        "scopeSpans": [{
+            "scope": {"name": __name__},
+            "spans": [s.to_otlp() for s in spans],
+        }],
+    }]}
+
+
+class FileExporter:
+    """Append finished traces to a file, one OTLP/JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: List[Span]):
+        line = json.dumps(to_otlp_json(spans), ensure_ascii=False)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"Trace export error: {e}")
+
+
+_exporter: Optional[Any] = FileExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+
+# trace id -> {"spans": [...], "done": root span finished}
+_traces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_traces_lock = threading.Lock()
+
+
+def set_exporter(exporter):
+    """Send finished traces to exporter (anything with export(spans)); None turns exporting off."""
+    global _exporter
+    _exporter = exporter
+
+
+def _finish(finished: Span):
+    """Store a finished span; export the trace when its root ends (late children on their own)."""
+    with _traces_lock:
+        trace = _traces.get(finished.trace_id)
+        if trace is None:
+            trace = _traces[finished.trace_id] = {"spans": [], "done": False}
+            while len(_traces) > TRACE_KEEP:
+                _traces.popitem(last=False)
+        trace["spans"].append(finished)
+        if finished.parent_id is None:
+            trace["done"] = True
+            to_export = list(trace["spans"])
+        elif trace["done"]:
+            to_export = [finished]
+        else:
+            to_export = None
+
+    if to_export and _exporter is not None:
+        _exporter.export(to_export)
+
+
+def span(name: str, **attributes) -> Span:
+    """
+    Start a span under the current one. Use as `with span("steam.appdetails", appid=appid):`,
+    or call end() yourself where a with-block does not fit (e.g. around a generator).
+    """
+    return Span(name, _current.get(), attributes)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def record_exception(error: BaseException):
+    """Mark the current span as failed, for errors that are handled instead of raised."""
+    current = _current.get()
+    if current is not None:
+        current.record_exception(error)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator: run the function inside a span (named after the function by default)."""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def in_current_context(fn: Callable) -> Callable:
+    """Bind fn to a copy of the current context, so spans it opens in another thread keep their parent."""
+    context = contextvars.copy_context()
+    return functools.partial(context.run, fn)
+
+
+def get_trace(trace_id: str) -> List[Dict[str, Any]]:
+    """Finished spans of a trace, in start order."""
+    with _traces_lock:
+        trace = _traces.get(trace_id)
+        spans = list(trace["spans"]) if trace else []
+    return [s.to_dict() for s in sorted(spans, key=lambda s: s.start_ns)]
+
+
+def stage_stats() -> Dict[str, Dict[str, Any]]:
+    """Latency snapshot (count, p50/p95/p99, ...) per stage name."""
+    return {name.split(".", 1)[1]: snap for name, snap in histogram_snapshots("stage.").items()}